@@ -58,7 +58,9 @@ class AppConfig:
             'statement_day_inclusive': '账单日规则',
             'due_date_rule': '还款规则',
             'currency_type': '币种支持',
-            'annual_fee': '年费信息'
+            'annual_fee': '年费信息',
+            'credit_limit': '信用额度',
+            'due_date_adjustment': '节假日还款'
         }
     
     @staticmethod
@@ -1,6 +1,6 @@
 # Apple-Style UX Enhancements for Credit Card Bot
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 import database as db
 import core_logic
 
@@ -75,12 +75,48 @@ class AppleStyleUX:
     SCORING_CONFIG = {
         'local_currency_bonus': 5,
         'upcoming_statement_penalty': 10,
-        'statement_warning_days': 3
+        'statement_warning_days': 3,
+        'utilization_threshold': 0.3,   # 额度使用率超过 30% 开始扣分
+        'utilization_penalty': 20,      # 使用率从阈值升到 100% 时线性扣满
+        'reward_weight': 1.0            # 每 ¥1 预期返现折合的分数（约等于 1 天免息期）
     }
     
     @staticmethod
-    def get_best_card_for_today(cards: List[Dict]) -> Dict[str, Any]:
-        """Get the single best card for today - Apple's "one best choice" philosophy"""
+    def get_available_credit(card: Dict, balances: Dict[int, int]) -> Optional[int]:
+        """可用额度（分）= 信用额度 - 未还余额；未设置额度时返回 None"""
+        limit = card.get('credit_limit') or 0
+        if limit <= 0:
+            return None
+        return limit * 100 - max(balances.get(card['id'], 0), 0)
+    
+    @staticmethod
+    def utilization_penalty(card: Dict, balances: Dict[int, int], amount_cents: int = 0) -> float:
+        """按本次消费后的额度使用率计算扣分；未设置额度的卡不扣分"""
+        limit = card.get('credit_limit') or 0
+        if limit <= 0:
+            return 0
+        utilization = (max(balances.get(card['id'], 0), 0) + amount_cents) / (limit * 100)
+        threshold = AppleStyleUX.SCORING_CONFIG['utilization_threshold']
+        if utilization <= threshold:
+            return 0
+        excess = min(1.0, (utilization - threshold) / (1 - threshold))
+        return AppleStyleUX.SCORING_CONFIG['utilization_penalty'] * excess
+    
+    @staticmethod
+    def reward_bonus(reward_cents: int) -> float:
+        """预期返现（分）折算为评分加成"""
+        return AppleStyleUX.SCORING_CONFIG['reward_weight'] * reward_cents / 100
+    
+    @staticmethod
+    def get_best_card_for_today(cards: List[Dict], balances: Dict[int, int] = None, amount_cents: int = 0,
+                                rewards: Dict[int, int] = None) -> Dict[str, Any]:
+        """
+        Get the single best card for today - Apple's "one best choice" philosophy
+        
+        传入 balances（db.get_card_balances()）时按额度使用率扣分，
+        并排除可用额度不足以支付 amount_cents 的卡片；
+        rewards 为 card_id -> 预期返现（分），按 reward_weight 计入评分。
+        """
         if not cards:
             return None
         
@@ -88,20 +124,31 @@ class AppleStyleUX:
         
         # Apple原则：使用列表推导式简化代码
         card_scores = [
-            AppleStyleUX._calculate_card_score(card, today) 
+            AppleStyleUX._calculate_card_score(card, today, balances, amount_cents, rewards)
             for card in cards
         ]
+        if balances is not None and amount_cents:
+            card_scores = [s for s in card_scores if s['available_cents'] is None or s['available_cents'] >= amount_cents]
+            if not card_scores:
+                return None
         
         # Apple原则：使用max函数的key参数
         return max(card_scores, key=lambda x: x['score'])
     
     @staticmethod
-    def _calculate_card_score(card: Dict, today: date) -> Dict[str, Any]:
+    def _calculate_card_score(card: Dict, today: date, balances: Dict[int, int] = None, amount_cents: int = 0,
+                              rewards: Dict[int, int] = None) -> Dict[str, Any]:
         """Apple原则：提取复杂计算逻辑到单独方法"""
         days, due_date = core_logic.get_interest_free_period(card, today)
         
         # Base score is the free period days
         score = days
+        available_cents = None
+        if balances is not None:
+            available_cents = AppleStyleUX.get_available_credit(card, balances)
+            score -= AppleStyleUX.utilization_penalty(card, balances, amount_cents)
+        if rewards:
+            score += AppleStyleUX.reward_bonus(rewards.get(card['id'], 0))
         
         # Apply bonuses and penalties
         if card['currency_type'] in ['local', 'all']:
@@ -117,7 +164,8 @@ class AppleStyleUX:
             'card': card,
             'days': days,
             'due_date': due_date,
-            'score': score
+            'score': score,
+            'available_cents': available_cents
         }
     
     @staticmethod
@@ -0,0 +1,92 @@
+# backup.py
+"""
+基于 sqlite3 在线备份 API 的热备份：不停机、不产生撕裂的副本。
+
+备份在线程中分步复制页面（每步 pages 页，步与步之间 sleep），
+每一步结束都会释放源库的读锁，处理器的写入可以穿插进行，事件循环本身从不被阻塞。
+"""
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import database as db
+
+SNAPSHOT_PREFIX = "cards-"
+DEFAULT_RETENTION = 7
+DEFAULT_PAGES_PER_STEP = 64
+DEFAULT_STEP_SLEEP = 0.005
+
+
+def default_backup_dir() -> Path:
+    """快照默认放在数据库文件旁边的 backups/ 目录"""
+    path = getattr(db.get_backend(), 'path', None)
+    return (path.parent if path else db.DATA_DIR) / "backups"
+
+def options_from_config(backup_config: dict) -> dict:
+    """把 config.yaml 中的 backup 段转换为 snapshot() 的参数"""
+    backup_config = backup_config or {}
+    options = {
+        'retention': int(backup_config.get('retention') or DEFAULT_RETENTION),
+        'pages': int(backup_config.get('pages_per_step') or DEFAULT_PAGES_PER_STEP),
+    }
+    if backup_config.get('dir'):
+        options['backup_dir'] = Path(backup_config['dir'])
+    return options
+
+def list_snapshots(backup_dir: Path = None) -> List[Path]:
+    """按时间从新到旧列出快照"""
+    backup_dir = backup_dir or default_backup_dir()
+    if not backup_dir.exists():
+        return []
+    return sorted(backup_dir.glob(f"{SNAPSHOT_PREFIX}*.db"), reverse=True)
+
+def latest_snapshot(backup_dir: Path = None) -> Optional[Path]:
+    snapshots = list_snapshots(backup_dir)
+    return snapshots[0] if snapshots else None
+
+def prune_snapshots(backup_dir: Path = None, retention: int = DEFAULT_RETENTION) -> int:
+    """只保留最新的 retention 份快照，返回删除的数量"""
+    removed = 0
+    for old in list_snapshots(backup_dir)[max(1, retention):]:
+        old.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+def snapshot(
+    backup_dir: Path = None,
+    retention: int = DEFAULT_RETENTION,
+    pages: int = DEFAULT_PAGES_PER_STEP,
+    step_sleep: float = DEFAULT_STEP_SLEEP,
+) -> Path:
+    """同步创建一份时间点快照并执行轮换，返回快照路径"""
+    backend = db.get_backend()
+    if isinstance(backend, db.MemoryBackend):
+        raise RuntimeError("纯内存存储后端不支持备份")
+
+    backup_dir = backup_dir or default_backup_dir()
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    target = backup_dir / f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    partial = target.with_suffix(".db.partial")
+
+    started = datetime.now()
+    source = backend.connect()
+    destination = sqlite3.connect(partial)
+    try:
+        source.backup(destination, pages=pages, sleep=step_sleep)
+    finally:
+        destination.close()
+        source.close()
+    # 复制完成后再改名，保证目录中的快照总是完整的
+    partial.replace(target)
+
+    removed = prune_snapshots(backup_dir, retention)
+    elapsed = (datetime.now() - started).total_seconds()
+    logging.info(f"数据库快照已创建: {target.name}（耗时 {elapsed:.2f}s，轮换删除 {removed} 份）")
+    return target
+
+async def create_snapshot(**kwargs) -> Path:
+    """在线程中执行快照，事件循环保持响应"""
+    return await asyncio.to_thread(snapshot, **kwargs)
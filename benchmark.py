@@ -0,0 +1,243 @@
+# benchmark.py
+"""
+core_logic 与 AppleStyleUX 评分的微基准。
+
+覆盖 1 / 10 / 100 / 1000 张卡的合成组合，以及 1 天 / 1 个月 / 10 年的日期扫描。
+结果写入 benchmark_baseline.json（机器可读），对比时超过阈值即视为性能回退。
+
+用法：
+    python benchmark.py              # 与基线对比，回退时以非零状态退出
+    python benchmark.py --record     # 重新记录基线
+    python benchmark.py --quick      # 跳过 1000 张卡 × 10 年的组合
+    python benchmark.py -k best_card # 只运行名称包含该字符串的用例
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest import mock
+
+import core_logic
+from apple_ux_enhancements import AppleStyleUX
+
+BASELINE_FILE = Path(__file__).parent / "benchmark_baseline.json"
+DEFAULT_MAX_RATIO = 1.50  # 单个用例耗时超过基线的 150% 视为回退（留出机器噪声的余量）
+SWEEP_START = date(2025, 1, 1)
+
+PORTFOLIO_SIZES = [1, 10, 100, 1000]
+SWEEPS = {'1d': 1, '1m': 31, '10y': 3653}
+
+
+def synthetic_portfolio(size: int, seed: int = 42) -> List[Dict]:
+    """生成确定性的合成卡片组合，覆盖所有规则类型"""
+    rng = random.Random(seed + size)
+    cards = []
+    for i in range(size):
+        due_type = rng.choice(['fixed_day', 'days_after'])
+        cards.append({
+            'id': i + 1,
+            'nickname': f"卡{i:04d}",
+            'bank_name': rng.choice(['招商银行', '工商银行', '建设银行', '中信银行']),
+            'last_four_digits': f"{i % 10000:04d}",
+            'statement_day': rng.randint(1, 28),
+            'statement_day_inclusive': rng.choice([True, False]),
+            'due_date_type': due_type,
+            'due_date_value': rng.randint(1, 28) if due_type == 'fixed_day' else rng.randint(15, 25),
+            'currency_type': rng.choice(['local', 'foreign', 'all']),
+            'annual_fee_amount': 0,
+        })
+    return cards
+
+
+def date_sweep(days: int) -> List[date]:
+    return [SWEEP_START + timedelta(days=i) for i in range(days)]
+
+
+# --- 用例定义：每个工厂返回 (待测函数, 操作次数) ---
+def _case_interest_free(cards, days):
+    def run():
+        for d in days:
+            for card in cards:
+                core_logic.get_interest_free_period(card, d)
+    return run, len(cards) * len(days)
+
+def _case_next_due(cards, days):
+    def run():
+        for d in days:
+            for card in cards:
+                core_logic.get_next_due_date(card, d)
+    return run, len(cards) * len(days)
+
+def _case_statement_date(cards, days):
+    def run():
+        for d in days:
+            for card in cards:
+                core_logic.get_statement_date_for_purchase(d, card['statement_day'], card['statement_day_inclusive'])
+    return run, len(cards) * len(days)
+
+def _case_best_card_for_date(cards, days):
+    def run():
+        for d in days:
+            AppleStyleUX.get_best_card_for_date(cards, d)
+    return run, len(days)
+
+def _frozen_today(func):
+    """get_best_card_for_today / get_proactive_insights 内部读取 date.today()，逐日冻结后调用"""
+    class _FrozenDate(date):
+        current = SWEEP_START
+
+        @classmethod
+        def today(cls):
+            return cls.current
+
+    def factory(cards, days):
+        def run():
+            with mock.patch('apple_ux_enhancements.date', _FrozenDate):
+                for d in days:
+                    _FrozenDate.current = d
+                    func(cards)
+        return run, len(days)
+    return factory
+
+CASES: Dict[str, Callable] = {
+    'core.get_interest_free_period': _case_interest_free,
+    'core.get_next_due_date': _case_next_due,
+    'core.get_statement_date_for_purchase': _case_statement_date,
+    'ux.get_best_card_for_today': _frozen_today(AppleStyleUX.get_best_card_for_today),
+    'ux.get_best_card_for_date': _case_best_card_for_date,
+    'ux.get_proactive_insights': _frozen_today(AppleStyleUX.get_proactive_insights),
+}
+
+
+def measure(run: Callable, min_time: float = 0.3, min_repeat: int = 3, max_repeat: int = 100000) -> float:
+    """
+    重复运行直到累计耗时超过 min_time 且至少运行 min_repeat 次，返回单次运行的最短耗时（秒）。
+    单次超过 1 秒的大用例只运行一次。
+    """
+    best = float('inf')
+    total = 0.0
+    for repeat in range(1, max_repeat + 1):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = min(best, elapsed)
+        total += elapsed
+        if elapsed > 1.0 or (total >= min_time and repeat >= min_repeat):
+            break
+    return best
+
+
+def calibrate() -> float:
+    """固定的纯 Python 工作量，用于抵消不同机器之间的速度差异"""
+    def run():
+        total = 0
+        for i in range(200000):
+            total += i % 7
+        return total
+    return measure(run)
+
+
+def iter_cases(quick: bool = False, keyword: str = None):
+    for case_name, factory in CASES.items():
+        for size in PORTFOLIO_SIZES:
+            for sweep_name, sweep_days in SWEEPS.items():
+                if quick and size * sweep_days > 100 * 3653:
+                    continue
+                name = f"{case_name}[cards={size},sweep={sweep_name}]"
+                if keyword and keyword not in name:
+                    continue
+                yield name, factory, size, sweep_days
+
+
+def run_benchmarks(quick: bool = False, keyword: str = None) -> Dict[str, Dict]:
+    results = {}
+    portfolios = {size: synthetic_portfolio(size) for size in PORTFOLIO_SIZES}
+    sweeps = {days: date_sweep(days) for days in SWEEPS.values()}
+    for name, factory, size, sweep_days in iter_cases(quick, keyword):
+        run, ops = factory(portfolios[size], sweeps[sweep_days])
+        seconds = measure(run)
+        results[name] = {'ops': ops, 'seconds': round(seconds, 6), 'ns_per_op': round(seconds / ops * 1e9, 1)}
+        logging.info(f"{name}: {results[name]['ns_per_op']} ns/op")
+    return results
+
+
+def load_baseline() -> Dict:
+    if not BASELINE_FILE.exists():
+        return {}
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(results: Dict[str, Dict], calibration: float):
+    baseline = load_baseline()
+    previous = baseline.get('results', {})
+    for name, result in results.items():
+        # 保留人工调整过的单用例阈值
+        if 'max_ratio' in previous.get(name, {}):
+            result['max_ratio'] = previous[name]['max_ratio']
+        previous[name] = result
+    baseline = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'recorded_at': date.today().isoformat(),
+            'calibration_seconds': round(calibration, 6),
+        },
+        'default_max_ratio': baseline.get('default_max_ratio', DEFAULT_MAX_RATIO),
+        **{k: v for k, v in baseline.items() if k not in ('meta', 'default_max_ratio', 'results')},
+        'results': dict(sorted(previous.items())),
+    }
+    with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, calibration: float) -> List[str]:
+    """返回回退用例的描述列表；耗时按校准工作量换算到基线机器上再比较"""
+    regressions = []
+    default_ratio = baseline.get('default_max_ratio', DEFAULT_MAX_RATIO)
+    speed_factor = baseline.get('meta', {}).get('calibration_seconds', calibration) / calibration
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if not reference:
+            continue
+        ratio = result['ns_per_op'] * speed_factor / reference['ns_per_op']
+        limit = reference.get('max_ratio', default_ratio)
+        marker = "REGRESSION" if ratio > limit else "ok"
+        print(f"{marker:<10} {name}: {result['ns_per_op']} ns/op (基线 {reference['ns_per_op']}, x{ratio:.2f})")
+        if ratio > limit:
+            regressions.append(f"{name} 慢了 {ratio:.2f} 倍（阈值 {limit}）")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="core_logic / AppleStyleUX 微基准")
+    parser.add_argument('--record', action='store_true', help="记录新的基线")
+    parser.add_argument('--quick', action='store_true', help="跳过最大规模的组合")
+    parser.add_argument('-k', '--keyword', help="只运行名称包含该字符串的用例")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    calibration = calibrate()
+    results = run_benchmarks(args.quick, args.keyword)
+    if args.record:
+        save_baseline(results, calibration)
+        print(f"已记录 {len(results)} 个用例到 {BASELINE_FILE.name}")
+        return 0
+
+    regressions = compare(results, load_baseline(), calibration)
+    if regressions:
+        print("\n性能回退：\n" + "\n".join(f"• {r}" for r in regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# briefing.py
+"""
+每日简报的内容：今天各币种的最佳用卡、即将出账的账单、未来 7 天的还款和临近的年费。
+
+所有卡片只遍历一遍，每张卡在同一次循环里算出推荐评分、下一个账单日、下一个还款日和年费日；
+账单金额（记账 + 分期）最后用一次批量查询补齐。简报在凌晨由定时任务预先生成，
+到发送时间只发送缓存的结果。
+"""
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+import core_logic
+import database as db
+from apple_ux_enhancements import AppleStyleUX
+
+DUE_WINDOW_DAYS = 7
+FEE_WINDOW_DAYS = 30
+SCOPES = {'local': ('local', 'all'), 'foreign': ('foreign', 'all')}
+
+
+class BriefingItem(NamedTuple):
+    card: Dict
+    day: date
+    days_until: int
+    amount_cents: Optional[int] = None       # 账单金额（记账 + 分期），没有数据时为 None
+    installment_cents: int = 0
+
+
+class DailyBriefing(NamedTuple):
+    day: date
+    best: Dict[str, Optional[Dict]]          # 币种 -> _calculate_card_score 的结果
+    statements: List[BriefingItem]           # 即将出账
+    dues: List[BriefingItem]                 # 未来 DUE_WINDOW_DAYS 天内还款
+    fees: List[BriefingItem]                 # 未来 FEE_WINDOW_DAYS 天内的年费日（未豁免）
+
+
+def _next_fee_date(card: Dict, today: date) -> Optional[date]:
+    if not card.get('annual_fee_date') or not card.get('annual_fee_amount'):
+        return None
+    month, day = map(int, card['annual_fee_date'].split('-'))
+    fee_date = core_logic.safe_create_date(today.year, month, day)
+    if fee_date < today:
+        fee_date = core_logic.safe_create_date(today.year + 1, month, day)
+    return fee_date
+
+def build_briefing(cards: List[Dict], today: date) -> DailyBriefing:
+    balances = db.get_card_balances()
+    statement_window = AppleStyleUX.SCORING_CONFIG['statement_warning_days']
+    best: Dict[str, Optional[Dict]] = {scope: None for scope in SCOPES}
+    statements, dues, fees = [], [], []
+    statement_keys = {}  # BriefingItem 下标 -> (card_id, 账单日)
+
+    for card in cards:
+        scored = AppleStyleUX._calculate_card_score(card, today, balances)
+        for scope, allowed in SCOPES.items():
+            # 同分取先出现的卡，与 get_best_card_for_today 一致
+            if card['currency_type'] in allowed and (best[scope] is None or scored['score'] > best[scope]['score']):
+                best[scope] = scored
+
+        next_stmt = core_logic.get_next_calendar_statement_date(today, card['statement_day'])
+        if (next_stmt - today).days <= statement_window:
+            statement_keys[('statement', len(statements))] = (card['id'], next_stmt)
+            statements.append(BriefingItem(card, next_stmt, (next_stmt - today).days))
+
+        next_due = core_logic.get_next_due_date(card, today)
+        if (next_due - today).days <= DUE_WINDOW_DAYS:
+            stmt = core_logic.get_statement_date_for_due(card, next_due)
+            if stmt:
+                statement_keys[('due', len(dues))] = (card['id'], stmt)
+            dues.append(BriefingItem(card, next_due, (next_due - today).days))
+
+        fee_date = _next_fee_date(card, today)
+        if fee_date and not card.get('is_waived_for_cycle') and (fee_date - today).days <= FEE_WINDOW_DAYS:
+            fees.append(BriefingItem(card, fee_date, (fee_date - today).days, card['annual_fee_amount'] * 100))
+
+    keys = list(set(statement_keys.values()))
+    totals = db.get_cycle_totals(keys)
+    installment_totals = db.get_installment_totals(keys)
+    lists = {'statement': statements, 'due': dues}
+    for (kind, index), key in statement_keys.items():
+        ledger = totals.get(key, {}).get('total_cents', 0)
+        installment = installment_totals.get(key, 0)
+        if ledger or installment:
+            lists[kind][index] = lists[kind][index]._replace(amount_cents=ledger + installment, installment_cents=installment)
+
+    return DailyBriefing(
+        day=today,
+        best=best,
+        statements=sorted(statements, key=lambda item: item.day),
+        dues=sorted(dues, key=lambda item: item.day),
+        fees=sorted(fees, key=lambda item: item.day),
+    )
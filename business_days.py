@@ -0,0 +1,106 @@
+# business_days.py
+"""
+工作日日历：把 holidays.json 中的法定节假日和调休上班日编译为每年一个整数位图，
+第 i 位为 1 表示该年第 i + 1 天是工作日。
+
+判断某天是否工作日是一次移位；求下一个 / 上一个工作日用最低位 / 最高位运算直接定位，
+不逐日试探。数据集未覆盖的年份只按周末计算。
+"""
+import json
+import logging
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+HOLIDAYS_FILE = Path(__file__).parent / "holidays.json"
+
+# 还款日遇节假日的处理方式
+NONE = 'none'
+NEXT = 'next'
+PREVIOUS = 'previous'
+POLICIES = {
+    NONE: '不调整',
+    NEXT: '顺延至下一工作日',
+    PREVIOUS: '提前至上一工作日',
+}
+
+_bitmaps: Dict[int, int] = {}
+_covered_years: Optional[set] = None
+_load_lock = threading.Lock()
+
+
+def _days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+def _weekday_bitmap(year: int) -> int:
+    bits = 0
+    first = date(year, 1, 1).weekday()
+    for i in range(_days_in_year(year)):
+        if (first + i) % 7 < 5:
+            bits |= 1 << i
+    return bits
+
+def _load():
+    """首次使用时编译数据集中所有年份的位图"""
+    global _covered_years
+    if _covered_years is not None:
+        return
+    with _load_lock:
+        if _covered_years is not None:
+            return
+        with open(HOLIDAYS_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for year_text, entry in data['years'].items():
+            year = int(year_text)
+            start = date(year, 1, 1)
+            bits = _weekday_bitmap(year)
+            for first, last in entry['holidays']:
+                first, last = date.fromisoformat(first), date.fromisoformat(last)
+                for i in range((first - start).days, (last - start).days + 1):
+                    bits &= ~(1 << i)
+            for workday in entry['workdays']:
+                bits |= 1 << (date.fromisoformat(workday) - start).days
+            _bitmaps[year] = bits
+        _covered_years = set(_bitmaps)
+        logging.info(f"节假日数据已加载: {min(_covered_years)}-{max(_covered_years)} 年")
+
+def _bitmap(year: int) -> int:
+    _load()
+    bits = _bitmaps.get(year)
+    if bits is None:
+        bits = _bitmaps.setdefault(year, _weekday_bitmap(year))
+    return bits
+
+def is_covered(year: int) -> bool:
+    """该年份是否有节假日数据（否则只按周末判断）"""
+    _load()
+    return year in _covered_years
+
+def is_business_day(day: date) -> bool:
+    return bool(_bitmap(day.year) >> (day.timetuple().tm_yday - 1) & 1)
+
+def next_business_day(day: date) -> date:
+    """day 当天或之后的第一个工作日"""
+    while True:
+        rest = _bitmap(day.year) >> (day.timetuple().tm_yday - 1)
+        if rest:
+            return day + timedelta(days=(rest & -rest).bit_length() - 1)
+        day = date(day.year + 1, 1, 1)
+
+def previous_business_day(day: date) -> date:
+    """day 当天或之前的最后一个工作日"""
+    while True:
+        index = day.timetuple().tm_yday - 1
+        head = _bitmap(day.year) & ((1 << (index + 1)) - 1)
+        if head:
+            return date(day.year, 1, 1) + timedelta(days=head.bit_length() - 1)
+        day = date(day.year - 1, 12, 31)
+
+def adjust(day: date, policy: Optional[str]) -> date:
+    """按还款日调整方式返回实际的最后还款日；policy 为空或 none 时原样返回"""
+    if policy == NEXT:
+        return next_business_day(day)
+    if policy == PREVIOUS:
+        return previous_business_day(day)
+    return day
@@ -0,0 +1,146 @@
+# card_search.py
+"""
+卡片检索：/find 和卡片选择器按别名片段、银行名（招行 / 招商银行）或卡号后四位查找卡片。
+
+每位用户一份内存 n-gram 索引：别名、银行名和后四位归一化后，把长度 1-3 的全部子串映射到卡片别名。
+不超过 3 个字符的查询直接取对应的集合；更长的查询取各三元组集合的交集，再确认候选确实包含整个查询。
+索引在第一次查询时按卡片数据版本生成，之后随 database 的增删改回调就地更新，不再重读整张卡片表；
+错过了某次修改（版本对不上）时丢弃，下次查询重建。
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Set
+
+import database as db
+from merchants import normalize
+
+GRAM_SIZE = 3
+
+# 银行简称与全称：卡片的别名或银行名包含其中一个时，按组内其他名称也能搜到
+BANK_ALIASES = [
+    ("招商银行", "招行"),
+    ("工商银行", "工行"),
+    ("建设银行", "建行"),
+    ("中国银行", "中行"),
+    ("农业银行", "农行"),
+    ("交通银行", "交行"),
+    ("邮储银行", "邮政储蓄银行", "邮储"),
+    ("浦发银行", "浦发"),
+    ("民生银行", "民生"),
+    ("光大银行", "光大"),
+    ("兴业银行", "兴业"),
+    ("广发银行", "广发"),
+    ("平安银行", "平安"),
+    ("中信银行", "中信"),
+    ("华夏银行", "华夏"),
+]
+
+
+def _expand(text: str) -> Set[str]:
+    """归一化后的文本，以及把其中的银行名换成同组其他名称后的写法"""
+    text = normalize(text or '')
+    keys = {text} if text else set()
+    for group in BANK_ALIASES:
+        for alias in group:
+            if alias in text:
+                keys.update(text.replace(alias, other) for other in group if other != alias)
+    return keys
+
+def _grams(key: str) -> Set[str]:
+    return {key[i:i + n] for n in range(1, GRAM_SIZE + 1) for i in range(len(key) - n + 1)}
+
+
+class _UserIndex:
+    def __init__(self, version: int):
+        self.version = version
+        self.cards: Dict[str, Dict] = {}            # 别名 -> 卡片
+        self.keys: Dict[str, Set[str]] = {}         # 别名 -> 检索词
+        self.postings: Dict[str, Set[str]] = {}     # n-gram -> 别名
+
+    def add(self, card: Dict):
+        nickname = card['nickname']
+        keys = _expand(nickname) | _expand(card.get('bank_name'))
+        if card.get('last_four_digits'):
+            keys.add(str(card['last_four_digits']))
+        self.cards[nickname] = card
+        self.keys[nickname] = keys
+        for gram in set().union(*map(_grams, keys)):
+            self.postings.setdefault(gram, set()).add(nickname)
+
+    def remove(self, nickname: str):
+        self.cards.pop(nickname, None)
+        for gram in set().union(*map(_grams, self.keys.pop(nickname, ()))):
+            names = self.postings.get(gram)
+            if names is not None:
+                names.discard(nickname)
+                if not names:
+                    del self.postings[gram]
+
+    def search(self, text: str) -> List[str]:
+        query = normalize(text)
+        if not query:
+            return []
+        if len(query) <= GRAM_SIZE:
+            return sorted(self.postings.get(query, ()))
+        sets = sorted((self.postings.get(query[i:i + GRAM_SIZE], set())
+                       for i in range(len(query) - GRAM_SIZE + 1)), key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+        return sorted(name for name in candidates if any(query in key for key in self.keys[name]))
+
+
+_indexes: Dict[int, _UserIndex] = {}   # user_id -> 索引
+_loaded_backend: Optional[db.StorageBackend] = None
+_lock = threading.Lock()
+
+def _current_index() -> _UserIndex:
+    global _loaded_backend
+    backend = db.get_backend()
+    user_id = db.current_user()
+    # 先取版本再读数据：期间有写入时，这份索引只会被当作旧版本
+    version = db.get_data_version()
+    with _lock:
+        if _loaded_backend is not backend:
+            _indexes.clear()
+            _loaded_backend = backend
+        index = _indexes.get(user_id)
+        if index is None or index.version != version:
+            index = _UserIndex(version)
+            for card in db.get_all_cards():
+                index.add(card)
+            _indexes[user_id] = index
+        return index
+
+def search(text: str) -> List[Dict]:
+    """当前用户匹配 text 的卡片，按别名排序"""
+    index = _current_index()
+    return [index.cards[name] for name in index.search(text)]
+
+def search_page(text: str, limit: int, after: str = None, before: str = None) -> db.CardPage:
+    """按别名分页的检索结果，翻页参数与 db.get_cards_page 相同"""
+    index = _current_index()
+    names = index.search(text)
+    if before is not None:
+        end = bisect.bisect_left(names, before)
+        start = max(end - limit, 0)
+        return db.CardPage([index.cards[n] for n in names[start:end]], start > 0, True)
+    start = bisect.bisect_right(names, after) if after is not None else 0
+    return db.CardPage([index.cards[n] for n in names[start:start + limit]],
+                       after is not None, start + limit < len(names))
+
+def _on_card_change(user_id: int, previous_version: int, old_nickname: Optional[str], new_nickname: Optional[str]):
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is None or _loaded_backend is not db.get_backend():
+            return
+        if index.version != previous_version:
+            # 中间有未经过这里的修改，下次查询时重建
+            del _indexes[user_id]
+            return
+        if old_nickname:
+            index.remove(old_nickname)
+        card = db.get_card_by_nickname(new_nickname) if new_nickname else None
+        if card:
+            index.add(card)
+        index.version = db.get_data_version()
+
+db.on_card_change(_on_card_change)
@@ -0,0 +1,82 @@
+# compute_pool.py
+"""
+CPU 密集计算的进程池：覆盖图、策略模拟和账单日优化在独立进程中执行，事件循环只负责收发消息，
+计算期间其他命令不受影响。
+
+任务函数必须是模块级函数，参数是卡片快照（db.get_all_cards() 返回的字典列表）等可序列化的纯数据，
+在子进程中不访问数据库。池在 main.CardBotApplication 的 initialize 中启动、shutdown 中关闭
+（应用生命周期是手动管理的，不会调用 post_init / post_shutdown），关闭时等待运行中的任务结束。
+
+超时或被取消的任务：还在排队的直接撤销；已开始运行的无法中断，本池换用新的进程池继续接收任务，
+旧池跑完手头的任务后自行退出（各计算本身都有规模上限，不会无限占用进程）。
+workers 为 0 时改用线程池，不启动子进程（测试和压测用）。
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 60.0   # 秒
+
+
+class JobTimeout(Exception):
+    """任务超过时限"""
+
+
+class ComputePool:
+    def __init__(self, workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+
+    @classmethod
+    def from_config(cls, compute_config: Optional[Dict]) -> 'ComputePool':
+        compute_config = compute_config or {}
+        workers = compute_config.get('workers')
+        return cls(
+            workers=DEFAULT_WORKERS if workers is None else max(int(workers), 0),
+            timeout=float(compute_config.get('timeout') or DEFAULT_TIMEOUT),
+        )
+
+    def _new_executor(self) -> Executor:
+        if self.workers == 0:
+            return ThreadPoolExecutor(thread_name_prefix='compute')
+        # spawn：子进程不继承事件循环、数据库连接和线程
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._new_executor()
+            logging.info(f"计算池已启动（{self.workers} 个进程）" if self.workers else "计算池已启动（线程模式）")
+
+    async def shutdown(self):
+        """撤销排队中的任务，等待运行中的任务结束"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+            logging.info("计算池已关闭")
+
+    def _abandon(self, executor: Executor, future: Future):
+        """放弃一个任务；已在运行的无法撤销，换新池，旧池跑完后退出"""
+        if future.cancel() or future.done() or self._executor is not executor:
+            return
+        self._executor = self._new_executor()
+        executor.shutdown(wait=False)
+        logging.warning("计算任务超时或被取消但仍在运行，已换用新的计算池")
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """在池中执行 fn(*args, **kwargs)；超时抛出 JobTimeout，等待方被取消时任务一并撤销"""
+        if self._executor is None:
+            raise RuntimeError("计算池尚未启动")
+        executor = self._executor
+        future = executor.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(executor, future)
+            raise JobTimeout(f"计算超过 {timeout or self.timeout:.0f} 秒")
+        except asyncio.CancelledError:
+            self._abandon(executor, future)
+            raise
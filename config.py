@@ -32,6 +32,23 @@ def load_config():
             except ValueError:
                 raise ValueError("环境变量 ADMIN_USER_ID 必须是一个有效的整数。")
 
+        allowed_from_env = os.getenv('ALLOWED_USER_IDS')
+        if allowed_from_env:
+            try:
+                config['admin']['allowed_user_ids'] = [int(v) for v in allowed_from_env.replace(',', ' ').split()]
+                logging.info("使用环境变量中的 ALLOWED_USER_IDS。")
+            except ValueError:
+                raise ValueError("环境变量 ALLOWED_USER_IDS 必须是以逗号分隔的整数。")
+
+        storage_config = config.get('storage') or {}
+        config['storage'] = storage_config
+        if os.getenv('CARD_BOT_STORAGE'):
+            storage_config['backend'] = os.getenv('CARD_BOT_STORAGE')
+            logging.info("使用环境变量中的 CARD_BOT_STORAGE。")
+        if os.getenv('CARD_BOT_DB_PATH'):
+            storage_config['path'] = os.getenv('CARD_BOT_DB_PATH')
+            logging.info("使用环境变量中的 CARD_BOT_DB_PATH。")
+
         if not config.get('telegram', {}).get('bot_token') or not config.get('admin', {}).get('user_id'):
             raise ValueError("关键配置 bot_token 或 admin_user_id 未能成功加载。请检查 config.yaml 或 .env 文件。")
             
@@ -43,4 +60,11 @@ def load_config():
         raise Exception(f"加载或解析配置时出错: {e}")
 
 config = load_config()
-ADMIN_USER_ID = config['admin']['user_id']
\ No newline at end of file
+ADMIN_USER_ID = config['admin']['user_id']
+# 允许使用机器人的用户（管理员总在其中），auth_guard 每次只做一次集合查找
+ALLOWED_USER_IDS = frozenset({ADMIN_USER_ID, *(int(v) for v in config['admin'].get('allowed_user_ids') or [])})
+BACKUP_CONFIG = config.get('backup') or {}
+FORECAST_CONFIG = config.get('forecast') or {}
+COMPUTE_CONFIG = config.get('compute') or {}
+INLINE_CONFIG = config.get('inline') or {}
+NOTIFICATION_CONFIG = config.get('notifications') or {}
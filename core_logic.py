@@ -1,6 +1,8 @@
 # core_logic.py
 from datetime import datetime, timedelta, date
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+
+import business_days
 
 def safe_create_date(year, month, day):
     """为了处理 29, 30, 31 日在某些月份不存在的情况，使用安全的日期创建方法"""
@@ -28,16 +30,17 @@ def get_statement_date_for_purchase(today: date, statement_day: int, is_inclusiv
         next_month_date = today.replace(day=1) + timedelta(days=32)
         return safe_create_date(next_month_date.year, next_month_date.month, statement_day)
 
-def get_due_date_from_statement(statement_date: date, due_type: str, due_value: int) -> date:
-    """根据账单日计算还款日"""
+def get_due_date_from_statement(statement_date: date, due_type: str, due_value: int, adjustment: Optional[str] = None) -> date:
+    """根据账单日计算还款日；adjustment 为 next / previous 时遇节假日、周末顺延或提前到工作日"""
     if due_type == 'fixed_day':
         due_month = statement_date.month % 12 + 1
         due_year = statement_date.year + (1 if statement_date.month == 12 else 0)
-        return safe_create_date(due_year, due_month, due_value)
+        due_date = safe_create_date(due_year, due_month, due_value)
     elif due_type == 'days_after':
-        return statement_date + timedelta(days=due_value)
+        due_date = statement_date + timedelta(days=due_value)
     else:
         raise ValueError(f"未知的还款日类型: {due_type}")
+    return business_days.adjust(due_date, adjustment)
 
 def get_interest_free_period(card_info: Dict[str, Any], today: date = None) -> Tuple[int, date]:
     """计算从今天消费起，免息期天数和对应的最终还款日"""
@@ -48,7 +51,7 @@ def get_interest_free_period(card_info: Dict[str, Any], today: date = None) -> T
         today, card_info['statement_day'], card_info['statement_day_inclusive']
     )
     final_due_date = get_due_date_from_statement(
-        purchase_statement_date, card_info['due_date_type'], card_info['due_date_value']
+        purchase_statement_date, card_info['due_date_type'], card_info['due_date_value'], card_info.get('due_date_adjustment')
     )
     interest_free_days = (final_due_date - today).days
     return interest_free_days, final_due_date
@@ -65,13 +68,13 @@ def get_next_due_date(card_info: Dict[str, Any], today: date = None) -> date:
         prev_month_date = today.replace(day=1) - timedelta(days=1)
         last_stmt_date = safe_create_date(prev_month_date.year, prev_month_date.month, card_info['statement_day'])
 
-    this_cycle_due_date = get_due_date_from_statement(last_stmt_date, card_info['due_date_type'], card_info['due_date_value'])
+    this_cycle_due_date = get_due_date_from_statement(last_stmt_date, card_info['due_date_type'], card_info['due_date_value'], card_info.get('due_date_adjustment'))
 
     if this_cycle_due_date >= today:
         return this_cycle_due_date
     else:
         next_stmt_date = get_statement_date_for_purchase(today, card_info['statement_day'], card_info['statement_day_inclusive'])
-        return get_due_date_from_statement(next_stmt_date, card_info['due_date_type'], card_info['due_date_value'])
+        return get_due_date_from_statement(next_stmt_date, card_info['due_date_type'], card_info['due_date_value'], card_info.get('due_date_adjustment'))
 
 # --- 新增辅助函数 ---
 def get_next_calendar_statement_date(today: date, statement_day: int) -> date:
@@ -84,4 +87,70 @@ def get_next_calendar_statement_date(today: date, statement_day: int) -> date:
     # 如果今天已经过了本月的账单日
     else:
         next_month_date = today.replace(day=1) + timedelta(days=32)
-        return safe_create_date(next_month_date.year, next_month_date.month, statement_day)
\ No newline at end of file
+        return safe_create_date(next_month_date.year, next_month_date.month, statement_day)
+
+def get_previous_statement_date(statement_date: date, statement_day: int) -> date:
+    """
+    【新增】给定某一期的账单日，返回上一期的账单日。
+    用于定位“已出账、待还款”的那一期账单。
+    """
+    prev_month_date = statement_date.replace(day=1) - timedelta(days=1)
+    return safe_create_date(prev_month_date.year, prev_month_date.month, statement_day)
+
+def get_statement_date_for_due(card_info: Dict[str, Any], due_date: date) -> Optional[date]:
+    """
+    【新增】反查某个还款日对应哪一期账单，用于把该期账单金额关联到还款日上。
+    账单日在还款日之前最多约两个月（账单日后 60 天），向前查找三期即可。
+    """
+    statement_date = get_statement_date_for_purchase(due_date, card_info['statement_day'], card_info['statement_day_inclusive'])
+    for _ in range(4):
+        due = get_due_date_from_statement(statement_date, card_info['due_date_type'], card_info['due_date_value'], card_info.get('due_date_adjustment'))
+        if due == due_date:
+            return statement_date
+        statement_date = get_previous_statement_date(statement_date, card_info['statement_day'])
+    return None
+
+def build_period_runs(card_info: Dict[str, Any], start: date, days: int) -> List[Tuple[int, int, date, date]]:
+    """
+    【新增】把 [start, start + days) 按账单周期切分，返回 (起始偏移, 天数, 账单日, 还款日) 列表。
+    同一账单周期内的消费共享账单日和还款日，每个周期只计算一次。
+    """
+    statement_day = card_info['statement_day']
+    is_inclusive = card_info['statement_day_inclusive']
+    end = start + timedelta(days=days)
+    runs = []
+    day = start
+    while day < end:
+        statement_date = get_statement_date_for_purchase(day, statement_day, is_inclusive)
+        due_date = get_due_date_from_statement(statement_date, card_info['due_date_type'], card_info['due_date_value'], card_info.get('due_date_adjustment'))
+        if statement_day > 28:
+            # 月末账单日会被截断到当月最后一天，周期边界不规则，逐日计算
+            count = 1
+        else:
+            cycle_end = statement_date if is_inclusive else statement_date - timedelta(days=1)
+            count = min((cycle_end - day).days + 1, (end - day).days)
+        runs.append(((day - start).days, count, statement_date, due_date))
+        day += timedelta(days=count)
+    return runs
+
+def build_period_table(card_info: Dict[str, Any], start: date, days: int) -> List[Tuple[date, date]]:
+    """
+    【新增】预计算 [start, start + days) 内每天消费对应的 (账单日, 还款日)，第 i 项对应 start + i 天。
+    结果与逐日调用 get_statement_date_for_purchase / get_due_date_from_statement 一致
+    （由 equivalence_check.py 穷举验证）。
+    """
+    table = []
+    for _, count, statement_date, due_date in build_period_runs(card_info, start, days):
+        table.extend([(statement_date, due_date)] * count)
+    return table
+
+def build_period_column(card_info: Dict[str, Any], start: date, days: int) -> List[int]:
+    """
+    【新增】[start, start + days) 内每天消费的免息天数，第 i 项对应 start + i 天，
+    与逐日调用 get_interest_free_period 的天数一致。同一周期内每天减 1，整段用 range 生成。
+    """
+    column = []
+    for offset, count, _, due_date in build_period_runs(card_info, start, days):
+        first = (due_date - start).days - offset
+        column.extend(range(first, first - count, -1))
+    return column
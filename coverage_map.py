@@ -0,0 +1,94 @@
+# coverage_map.py
+"""
+组合免息期覆盖图：未来一年每天"最好的那张卡"能给出的免息天数，本币和外币分开计算。
+
+这就是 AppleStyleUX.get_best_card_for_today 逐日算出的免息期上包络。每张卡的一年免息期序列
+由 core_logic.build_period_column 按账单周期成段生成，逐日最大值由 map(max, ...) 一次算完；
+结果按用户缓存，以 (卡片数据版本, 起始日期) 判断是否有效，卡片增删改后自动失效；
+build_coverage 只接收卡片快照、不访问数据库，可以放到计算池的子进程中执行。
+"""
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import core_logic
+import database as db
+
+HORIZON_DAYS = 365
+DEAD_ZONE_DAYS = 30   # 默认阈值：最好的卡也不足这么多天免息的日子视为"盲区"
+SCOPES = {'local': ('local', 'all'), 'foreign': ('foreign', 'all')}
+
+
+class DeadZone(NamedTuple):
+    start: date
+    end: date        # 含
+    worst_days: int  # 区间内最短的免息天数
+
+
+class CoverageMap(NamedTuple):
+    start: date
+    envelopes: Dict[str, Optional[List[int]]]  # 币种 -> 每天的最长免息天数；没有可用卡片时为 None
+    best_cards: Dict[str, Optional[List[Dict]]]  # 币种 -> 每天提供该免息期的卡片
+
+    def dead_zones(self, scope: str, threshold: int = DEAD_ZONE_DAYS) -> List[DeadZone]:
+        """连续低于 threshold 天的区间"""
+        envelope = self.envelopes.get(scope)
+        if envelope is None:
+            return []
+        zones = []
+        zone_start = None
+        for offset, days in enumerate(envelope + [threshold]):
+            if days < threshold and zone_start is None:
+                zone_start = offset
+            elif days >= threshold and zone_start is not None:
+                zones.append(DeadZone(self.start + timedelta(days=zone_start), self.start + timedelta(days=offset - 1),
+                                      min(envelope[zone_start:offset])))
+                zone_start = None
+        return zones
+
+    def summary(self, scope: str) -> Optional[Tuple[int, float, int]]:
+        """(最短, 平均, 最长) 免息天数"""
+        envelope = self.envelopes.get(scope)
+        if envelope is None:
+            return None
+        return min(envelope), sum(envelope) / len(envelope), max(envelope)
+
+
+def build_coverage(cards: List[Dict], start: date, days: int = HORIZON_DAYS) -> CoverageMap:
+    """一次算出所有卡整个区间的免息期序列，再逐日取最大值"""
+    columns = {card['id']: core_logic.build_period_column(card, start, days) for card in cards}
+    envelopes, best_cards = {}, {}
+    for scope, allowed in SCOPES.items():
+        eligible = [card for card in cards if card['currency_type'] in allowed]
+        if not eligible:
+            envelopes[scope] = best_cards[scope] = None
+            continue
+        scope_columns = [columns[card['id']] for card in eligible]
+        envelopes[scope] = list(map(max, *scope_columns)) if len(scope_columns) > 1 else list(scope_columns[0])
+        # 同天数时取排在前面的卡
+        best_index = [max(range(len(day)), key=day.__getitem__) for day in zip(*scope_columns)]
+        best_cards[scope] = [eligible[i] for i in best_index]
+    return CoverageMap(start, envelopes, best_cards)
+
+
+_cache: Dict[int, Tuple[Tuple[int, date], CoverageMap]] = {}  # user_id -> ((数据版本, 起始日期), 覆盖图)
+_cache_lock = threading.Lock()
+
+def cached_coverage(start: date) -> Tuple[Tuple[int, date], Optional[CoverageMap]]:
+    """(缓存键, 当前用户仍有效的覆盖图)；没有有效缓存时覆盖图为 None，算好后用 store_coverage 按该键存入"""
+    key = (db.get_data_version(), start)
+    cached = _cache.get(db.current_user())
+    return key, cached[1] if cached and cached[0] == key else None
+
+def store_coverage(key: Tuple[int, date], coverage: CoverageMap):
+    with _cache_lock:
+        _cache[db.current_user()] = (key, coverage)  # 每个用户只保留最新版本
+
+def get_coverage(start: date = None) -> CoverageMap:
+    """返回当前用户卡片数据的覆盖图；数据版本或日期变化后重新计算"""
+    start = start or date.today()
+    key, coverage = cached_coverage(start)
+    if coverage is None:
+        coverage = build_coverage(db.get_all_cards(), start)
+        store_coverage(key, coverage)
+    return coverage
@@ -0,0 +1,72 @@
+# daily_ranking.py
+"""
+当天的推荐评分表：/ask 与内联模式（@机器人 300）共用。
+
+每位用户每天一张表，记录各卡今天消费的免息天数和到期日，以及本账单周期按类别的已记账消费（返现上限用）。
+表在凌晨随每日简报预先生成，以 (日期, 卡片数据版本, 记账版本) 判断是否有效，卡片或记账变化后下次使用时重建。
+给定金额和类别时只需按可用额度过滤、扣减额度使用率、加上预期返现后排序，不再逐卡计算账单周期。
+"""
+import threading
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import core_logic
+import database as db
+import rewards
+from apple_ux_enhancements import AppleStyleUX
+
+
+class DailyRanking(NamedTuple):
+    key: Tuple[date, int, int]                          # (日期, 卡片数据版本, 记账版本)
+    entries: List[Tuple[Dict, int, date, int]]          # (卡片, 免息天数, 到期日, 卡片序号)，按免息天数降序
+    cycle_spend: Dict[int, Dict[Optional[str], int]]    # card_id -> 本周期按类别的已记账消费
+
+
+def build_ranking(cards: List[Dict], today: date, key: Tuple[date, int, int] = None) -> DailyRanking:
+    periods = [(card, *core_logic.get_interest_free_period(card, today), position) for position, card in enumerate(cards)]
+    entries = sorted(periods, key=lambda entry: entry[1], reverse=True)
+    cycle_spend = rewards.cycle_spend_for(cards, today) if cards and rewards.get_engine().has_rules() else {}
+    return DailyRanking(key or (today, db.get_data_version(), db.get_ledger_version()), entries, cycle_spend)
+
+
+_cache: Dict[int, DailyRanking] = {}   # user_id -> 最新的评分表
+_cache_lock = threading.Lock()
+
+def get_ranking(today: date = None) -> DailyRanking:
+    """当前用户今天的评分表；日期或任一版本变化后重新生成"""
+    today = today or date.today()
+    user_id = db.current_user()
+    # 先取版本再读数据：期间有写入时，这张表只会被当作旧版本
+    key = (today, db.get_data_version(), db.get_ledger_version())
+    ranking = _cache.get(user_id)
+    if ranking is None or ranking.key != key:
+        ranking = build_ranking(db.get_all_cards(), today, key)
+        with _cache_lock:
+            _cache[user_id] = ranking
+    return ranking
+
+def rank(ranking: DailyRanking, amount_cents: int = 0, category: Optional[str] = None
+         ) -> Tuple[List[Dict], List[Tuple[Dict, int]]]:
+    """
+    按本次消费排序：返回 (推荐列表, 可用额度不足的卡)。
+    推荐项含 card、days、due_date、available、reward、rank，按 rank 降序。
+    """
+    balances = db.get_card_balances()
+    engine = rewards.get_engine()
+    cycle_spend = ranking.cycle_spend if amount_cents else {}
+    day = ranking.key[0]
+    recommendations, insufficient = [], []
+    for card, days, due_date, position in ranking.entries:
+        available = AppleStyleUX.get_available_credit(card, balances)
+        if amount_cents and available is not None and available < amount_cents:
+            insufficient.append((position, card, available))
+            continue
+        penalty = AppleStyleUX.utilization_penalty(card, balances, amount_cents)
+        quote = engine.quote(card['id'], category, amount_cents, day, cycle_spend.get(card['id']))
+        recommendations.append({'card': card, 'days': days, 'due_date': due_date, 'available': available,
+                                'reward': quote,
+                                'rank': days - penalty + AppleStyleUX.reward_bonus(quote.reward_cents),
+                                'position': position})
+    # 同分按卡片原有顺序；没有扣分和返现时表已是这个顺序，排序几乎不做交换
+    recommendations.sort(key=lambda x: (-x['rank'], x['position']))
+    return recommendations, [(card, available) for _, card, available in sorted(insufficient, key=lambda x: x[0])]
@@ -1,43 +1,448 @@
 # database.py
+import bisect
+import contextlib
+import contextvars
+import itertools
+import os
 import sqlite3
+import threading
+import time
 from pathlib import Path
 import logging
-from typing import List, Dict, Any, Optional
+from datetime import date
+from typing import Callable, Iterator, List, Dict, Any, NamedTuple, Optional, Tuple
+
+import core_logic
+import installments
+import migrations
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 DATA_DIR = Path(__file__).parent / "data"
 DATABASE_FILE = DATA_DIR / "cards.db"
 
+CARD_FIELDS = [
+    'nickname', 'last_four_digits', 'bank_name', 'statement_day',
+    'statement_day_inclusive', 'due_date_type', 'due_date_value',
+    'currency_type', 'annual_fee_amount', 'annual_fee_date',
+    'has_waiver', 'is_waived_for_cycle', 'waiver_reset_date', 'credit_limit',
+    'due_date_adjustment'
+]
+# 前缀查询的上界：别名以 prefix 开头 <=> prefix <= 别名 < prefix + PREFIX_END（按码点比较，与 SQLite 的 BINARY 排序一致）
+PREFIX_END = '\U0010ffff'
+
+# --- 存储后端 ---
+class StorageBackend:
+    """
+    存储后端接口：模块级函数（add_card / get_all_cards 等）负责日志与错误处理，
+    后端只负责读写，出错时抛出 sqlite3 的异常。
+    """
+    name = "base"
+
+    def connect(self) -> sqlite3.Connection:
+        """返回一个 SQLite 连接（卡片以外的表使用）"""
+        raise NotImplementedError
+
+    def init_schema(self):
+        raise NotImplementedError
+
+    def add_card(self, user_id: int, card_data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get_all_cards(self, user_id: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_card_by_nickname(self, user_id: int, nickname: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_cards_page(self, user_id: int, limit: int, after: str = None, before: str = None,
+                       prefix: str = None) -> List[Dict[str, Any]]:
+        """
+        按别名分页：after / before 为上一页的末尾 / 开头别名（不含），prefix 限定别名前缀。
+        最多返回 limit 张；传入 before 时按别名降序（离 before 最近的在前）。
+        """
+        raise NotImplementedError
+
+    def delete_card(self, user_id: int, nickname: str) -> bool:
+        raise NotImplementedError
+
+    def update_card(self, user_id: int, nickname: str, updates: Dict[str, Any],
+                    after_update: Callable[[sqlite3.Connection, Dict[str, Any]], None] = None) -> bool:
+        """
+        after_update(conn, 更新后的卡片) 在提交前于同一连接上执行（用于同步流水等依赖卡片字段的表），
+        抛出异常时整个更新回滚。
+        """
+        raise NotImplementedError
+
+    def get_user_ids(self) -> List[int]:
+        """有卡片的所有用户"""
+        raise NotImplementedError
+
+    def assign_cards(self, from_user_id: int, to_user_id: int) -> int:
+        """把一个用户的全部卡片转给另一个用户，返回转移的张数"""
+        raise NotImplementedError
+
+
+class SQLiteBackend(StorageBackend):
+    """磁盘上的 SQLite 数据库（默认后端）"""
+    name = "sqlite"
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path) if path else DATABASE_FILE
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def init_schema(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._migrate()
+
+    def _migrate(self):
+        conn = self.connect()
+        try:
+            migrations.run_migrations(conn)
+        finally:
+            conn.close()
+
+    # 以下查询都以 user_id 开头，走 UNIQUE (user_id, nickname) 索引
+    def add_card(self, user_id: int, card_data: Dict[str, Any]):
+        sql = f"INSERT INTO cards (user_id, {', '.join(CARD_FIELDS)}) VALUES (?, {', '.join(['?'] * len(CARD_FIELDS))})"
+        with self.connect() as conn:
+            conn.execute(sql, (user_id, *(card_data.get(field) for field in CARD_FIELDS)))
+            conn.commit()
+
+    def get_all_cards(self, user_id: int) -> List[Dict[str, Any]]:
+        with self.connect() as conn:
+            conn.row_factory = dict_factory
+            return conn.execute("SELECT * FROM cards WHERE user_id = ? ORDER BY nickname", (user_id,)).fetchall()
+
+    def get_card_by_nickname(self, user_id: int, nickname: str) -> Optional[Dict[str, Any]]:
+        with self.connect() as conn:
+            conn.row_factory = dict_factory
+            return conn.execute("SELECT * FROM cards WHERE user_id = ? AND nickname = ?", (user_id, nickname)).fetchone()
+
+    def get_cards_page(self, user_id: int, limit: int, after: str = None, before: str = None,
+                       prefix: str = None) -> List[Dict[str, Any]]:
+        # 全部条件都是 (user_id, nickname) 上的范围，只扫描索引中的一段，与卡片总数无关
+        conditions, params = ["user_id = ?"], [user_id]
+        if prefix:
+            conditions.append("nickname >= ? AND nickname < ?")
+            params += [prefix, prefix + PREFIX_END]
+        if after is not None:
+            conditions.append("nickname > ?")
+            params.append(after)
+        if before is not None:
+            conditions.append("nickname < ?")
+            params.append(before)
+        order = "DESC" if before is not None else "ASC"
+        with self.connect() as conn:
+            conn.row_factory = dict_factory
+            return conn.execute(
+                f"SELECT * FROM cards WHERE {' AND '.join(conditions)} ORDER BY nickname {order} LIMIT ?", (*params, limit)
+            ).fetchall()
+
+    def delete_card(self, user_id: int, nickname: str) -> bool:
+        with self.connect() as conn:
+            cursor = conn.execute("DELETE FROM cards WHERE user_id = ? AND nickname = ?", (user_id, nickname))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def update_card(self, user_id: int, nickname: str, updates: Dict[str, Any],
+                    after_update: Callable[[sqlite3.Connection, Dict[str, Any]], None] = None) -> bool:
+        set_clause = ", ".join([f"{field} = ?" for field in updates.keys()])
+        values = list(updates.values()) + [user_id, nickname]
+        with self.connect() as conn:
+            cursor = conn.execute(f"UPDATE cards SET {set_clause} WHERE user_id = ? AND nickname = ?", tuple(values))
+            if cursor.rowcount and after_update:
+                reader = conn.cursor()
+                reader.row_factory = dict_factory
+                card = reader.execute("SELECT * FROM cards WHERE user_id = ? AND nickname = ?",
+                                      (user_id, updates.get('nickname', nickname))).fetchone()
+                after_update(conn, card)
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def get_user_ids(self) -> List[int]:
+        with self.connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM cards ORDER BY user_id")]
+
+    def assign_cards(self, from_user_id: int, to_user_id: int) -> int:
+        with self.connect() as conn:
+            cursor = conn.execute("UPDATE cards SET user_id = ? WHERE user_id = ?", (to_user_id, from_user_id))
+            conn.commit()
+            return cursor.rowcount
+
+
+class SharedMemorySQLiteBackend(SQLiteBackend):
+    """
+    共享缓存的 :memory: SQLite：与磁盘后端走同一套 SQL，但不产生任何文件 I/O。
+    每个实例使用独立的库名，同一进程内的多个实例互不干扰。
+    """
+    name = "sqlite-memory"
+    _instances = 0
+
+    def __init__(self, db_name: str = None):
+        SharedMemorySQLiteBackend._instances += 1
+        self.db_name = db_name or f"cardbot-{os.getpid()}-{SharedMemorySQLiteBackend._instances}"
+        self.uri = f"file:{self.db_name}?mode=memory&cache=shared"
+        # 共享内存库在最后一个连接关闭时销毁，保留一个连接维持其生命周期
+        self._keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.uri, uri=True)
+
+    def init_schema(self):
+        self._migrate()
+
+
+class MemoryBackend(StorageBackend):
+    """
+    纯 Python 的内存存储，卡片读写不经过 SQL，适合隔离计算开销的基准测试。
+    卡片以外的表仍通过 connect() 使用一个私有的共享内存 SQLite。
+    卡片按用户分开存放：user_id -> 别名 -> 卡片。
+    """
+    name = "memory"
+
+    def __init__(self):
+        self._cards: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._aux = SharedMemorySQLiteBackend()
+
+    def connect(self) -> sqlite3.Connection:
+        return self._aux.connect()
+
+    def init_schema(self):
+        self._aux.init_schema()
+
+    # cards 表中 INTEGER / BOOLEAN 列：SQLite 按列类型亲和把能解析为数字的文本存成数字
+    _NUMERIC_FIELDS = {'statement_day', 'due_date_value', 'annual_fee_amount', 'credit_limit',
+                       'statement_day_inclusive', 'has_waiver', 'is_waived_for_cycle'}
+
+    @staticmethod
+    def _to_numeric(value: Any) -> Any:
+        if isinstance(value, str):
+            try:
+                return int(value)
+            except ValueError:
+                try:
+                    value = float(value)
+                except ValueError:
+                    return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    @classmethod
+    def _as_row(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        # 与 SQLite 的返回值保持一致：布尔值存为 0/1，数字列里的 '15' 存为 15
+        return {k: int(v) if isinstance(v, bool) else cls._to_numeric(v) if k in cls._NUMERIC_FIELDS else v
+                for k, v in values.items()}
+
+    @staticmethod
+    def _check_not_null(card: Dict[str, Any]):
+        required = ['nickname', 'statement_day', 'statement_day_inclusive',
+                    'due_date_type', 'due_date_value', 'currency_type']
+        for field in required:
+            if card.get(field) is None:
+                raise sqlite3.IntegrityError(f"NOT NULL constraint failed: cards.{field}")
+        if card['due_date_type'] not in ('fixed_day', 'days_after'):
+            raise sqlite3.IntegrityError("CHECK constraint failed: due_date_type")
+
+    def add_card(self, user_id: int, card_data: Dict[str, Any]):
+        card = self._as_row({field: card_data.get(field) for field in CARD_FIELDS})
+        self._check_not_null(card)
+        with self._lock:
+            cards = self._cards.setdefault(user_id, {})
+            if card['nickname'] in cards:
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: cards.user_id, cards.nickname")
+            cards[card['nickname']] = {'id': self._next_id, **card, 'user_id': user_id}
+            self._next_id += 1
+
+    def get_all_cards(self, user_id: int) -> List[Dict[str, Any]]:
+        return [dict(card) for _, card in sorted(self._cards.get(user_id, {}).items())]
+
+    def get_card_by_nickname(self, user_id: int, nickname: str) -> Optional[Dict[str, Any]]:
+        card = self._cards.get(user_id, {}).get(nickname)
+        return dict(card) if card else None
+
+    def get_cards_page(self, user_id: int, limit: int, after: str = None, before: str = None,
+                       prefix: str = None) -> List[Dict[str, Any]]:
+        cards = self._cards.get(user_id, {})
+        names = sorted(cards)
+        low, high = 0, len(names)
+        if prefix:
+            low, high = bisect.bisect_left(names, prefix), bisect.bisect_left(names, prefix + PREFIX_END)
+        if after is not None:
+            low = max(low, bisect.bisect_right(names, after))
+        if before is not None:
+            high = min(high, bisect.bisect_left(names, before))
+        selected = names[low:high]
+        selected = selected[::-1][:limit] if before is not None else selected[:limit]
+        return [dict(cards[name]) for name in selected]
+
+    def delete_card(self, user_id: int, nickname: str) -> bool:
+        with self._lock:
+            return self._cards.get(user_id, {}).pop(nickname, None) is not None
+
+    def update_card(self, user_id: int, nickname: str, updates: Dict[str, Any],
+                    after_update: Callable[[sqlite3.Connection, Dict[str, Any]], None] = None) -> bool:
+        with self._lock:
+            cards = self._cards.get(user_id, {})
+            card = cards.get(nickname)
+            if card is None:
+                return False
+            updated = {**card, **self._as_row(updates)}
+            self._check_not_null(updated)
+            new_nickname = updated['nickname']
+            if new_nickname != nickname and new_nickname in cards:
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: cards.user_id, cards.nickname")
+            if after_update:
+                # 先写辅助库，成功提交后才替换内存中的卡片
+                with self.connect() as conn:
+                    after_update(conn, dict(updated))
+                    conn.commit()
+            del cards[nickname]
+            cards[new_nickname] = updated
+            return True
+
+    def get_user_ids(self) -> List[int]:
+        return sorted(user_id for user_id, cards in self._cards.items() if cards)
+
+    def assign_cards(self, from_user_id: int, to_user_id: int) -> int:
+        with self._lock:
+            moving = self._cards.pop(from_user_id, {})
+            target = self._cards.setdefault(to_user_id, {})
+            if set(moving) & set(target):
+                self._cards[from_user_id] = moving
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: cards.user_id, cards.nickname")
+            for nickname, card in moving.items():
+                target[nickname] = {**card, 'user_id': to_user_id}
+            return len(moving)
+
+
+BACKENDS = {
+    SQLiteBackend.name: SQLiteBackend,
+    SharedMemorySQLiteBackend.name: SharedMemorySQLiteBackend,
+    MemoryBackend.name: MemoryBackend,
+}
+
+_backend: Optional[StorageBackend] = None
+
+# --- 多用户 ---
+# 当前请求所属的用户。每个更新在处理前设置（见 handlers.scope_update），定时任务按用户设置；
+# asyncio.to_thread 会复制上下文，线程里的查询同样限定在该用户的数据内。
+# 未设置时（脚本、基准测试）使用 DEFAULT_USER_ID，旧版本的单用户数据也迁移到这个用户下。
+DEFAULT_USER_ID = 0
+_current_user: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('current_user', default=None)
+
+def current_user() -> int:
+    user_id = _current_user.get()
+    return DEFAULT_USER_ID if user_id is None else user_id
+
+def set_current_user(user_id: Optional[int]) -> contextvars.Token:
+    return _current_user.set(user_id)
+
+@contextlib.contextmanager
+def user_scope(user_id: int) -> Iterator[None]:
+    """在 with 块内以 user_id 的身份读写数据"""
+    token = _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+def get_user_ids() -> List[int]:
+    try:
+        return get_backend().get_user_ids()
+    except Exception as e:
+        logging.error(f"获取用户列表时出错: {e}")
+        return []
+
+def adopt_default_user_cards(user_id: int) -> int:
+    """把 DEFAULT_USER_ID 名下的卡片（升级前的单用户数据）转给 user_id，启动时调用"""
+    if user_id == DEFAULT_USER_ID:
+        return 0
+    try:
+        moved = get_backend().assign_cards(DEFAULT_USER_ID, user_id)
+    except sqlite3.IntegrityError:
+        logging.error(f"无法把旧数据转给用户 {user_id}：存在同名卡片，请手动处理。")
+        return 0
+    if moved:
+        _bump_data_version(DEFAULT_USER_ID)
+        _bump_data_version(user_id)
+        logging.info(f"已把 {moved} 张旧卡片转给用户 {user_id}")
+    return moved
+
+# 卡片数据版本：每个用户增删改卡片后递增，由卡片派生的缓存（如 /coverage 覆盖图）据此判断是否失效。
+# 所有用户共用一个递增计数器，切换存储后端时更新基准版本，旧缓存随之全部失效。
+_version_counter = itertools.count(1)
+_base_version = 0
+_data_versions: Dict[int, int] = {}
+
+def get_data_version() -> int:
+    return _data_versions.get(current_user(), _base_version)
+
+def _bump_data_version(user_id: int = None):
+    _data_versions[current_user() if user_id is None else user_id] = next(_version_counter)
+
+# 记账版本：消费、撤销、还款、分期或返现规则变化后递增；卡片数据版本不随记账变化，
+# 依赖余额和返现的缓存（如内联推荐）需要同时比较这两个版本。
+_ledger_versions: Dict[int, int] = {}
+
+def get_ledger_version() -> int:
+    return _ledger_versions.get(current_user(), _base_version)
+
+def _bump_ledger_version():
+    _ledger_versions[current_user()] = next(_version_counter)
+
+# 卡片变更回调：增删改成功后以 (user_id, 修改前的数据版本, 原别名, 新别名) 调用，
+# 新增时原别名为 None，删除时新别名为 None。内存索引（如 card_search）据此就地更新。
+_card_listeners: List[Callable[[int, int, Optional[str], Optional[str]], None]] = []
+
+def on_card_change(callback: Callable[[int, int, Optional[str], Optional[str]], None]):
+    _card_listeners.append(callback)
+
+def _notify_card_change(previous_version: int, old_nickname: Optional[str], new_nickname: Optional[str]):
+    for callback in _card_listeners:
+        try:
+            callback(current_user(), previous_version, old_nickname, new_nickname)
+        except Exception as e:
+            logging.error(f"卡片变更回调出错: {e}")
+
+def configure(backend: str = None, path: str = None) -> StorageBackend:
+    """
+    选择存储后端。优先级: 环境变量 CARD_BOT_STORAGE / CARD_BOT_DB_PATH > 参数 > 默认（磁盘 SQLite）。
+    """
+    global _backend, _balance_index, _base_version
+    backend = os.getenv('CARD_BOT_STORAGE') or backend or SQLiteBackend.name
+    path = os.getenv('CARD_BOT_DB_PATH') or path
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的存储后端: {backend}（可选: {', '.join(BACKENDS)}）")
+    if backend == SQLiteBackend.name:
+        _backend = SQLiteBackend(path)
+    else:
+        _backend = BACKENDS[backend]()
+    _balance_index = None
+    _base_version = next(_version_counter)
+    _data_versions.clear()
+    _ledger_versions.clear()
+    logging.info(f"使用存储后端: {backend}")
+    return _backend
+
+def get_backend() -> StorageBackend:
+    if _backend is None:
+        configure()
+    return _backend
+
 def get_connection():
-    return sqlite3.connect(DATABASE_FILE)
+    return get_backend().connect()
 
 def init_db():
     logging.info("正在初始化数据库...")
     try:
-        DATA_DIR.mkdir(exist_ok=True)
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cards (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nickname TEXT NOT NULL UNIQUE,
-                last_four_digits TEXT,
-                bank_name TEXT,
-                statement_day INTEGER NOT NULL,
-                statement_day_inclusive BOOLEAN NOT NULL,
-                due_date_type TEXT NOT NULL CHECK(due_date_type IN ('fixed_day', 'days_after')),
-                due_date_value INTEGER NOT NULL,
-                currency_type TEXT NOT NULL,
-                annual_fee_amount INTEGER DEFAULT 0,
-                annual_fee_date TEXT,
-                has_waiver BOOLEAN DEFAULT FALSE,
-                is_waived_for_cycle BOOLEAN DEFAULT FALSE,
-                waiver_reset_date DATE
-            )
-            """)
-            conn.commit()
-            logging.info("数据库初始化成功。")
+        get_backend().init_schema()
+        logging.info("数据库初始化成功。")
     except Exception as e:
         logging.error(f"数据库初始化失败: {e}")
         raise
@@ -49,21 +454,13 @@ def dict_factory(cursor, row):
     return d
 
 def add_card(card_data: Dict[str, Any]) -> bool:
-    fields = [
-        'nickname', 'last_four_digits', 'bank_name', 'statement_day',
-        'statement_day_inclusive', 'due_date_type', 'due_date_value',
-        'currency_type', 'annual_fee_amount', 'annual_fee_date',
-        'has_waiver', 'is_waived_for_cycle', 'waiver_reset_date'
-    ]
-    sql = f"INSERT INTO cards ({', '.join(fields)}) VALUES ({', '.join(['?'] * len(fields))})"
-    values = tuple(card_data.get(field) for field in fields)
-    try:
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(sql, values)
-            conn.commit()
-            logging.info(f"成功添加卡片: {card_data.get('nickname')}")
-            return True
+    try:
+        previous_version = get_data_version()
+        get_backend().add_card(current_user(), card_data)
+        _bump_data_version()
+        _notify_card_change(previous_version, None, card_data.get('nickname'))
+        logging.info(f"成功添加卡片: {card_data.get('nickname')}")
+        return True
     except sqlite3.IntegrityError:
         logging.error(f"添加卡片失败: 别名 '{card_data.get('nickname')}' 已存在。")
         return False
@@ -73,36 +470,52 @@ def add_card(card_data: Dict[str, Any]) -> bool:
 
 def get_all_cards() -> List[Dict[str, Any]]:
     try:
-        with get_connection() as conn:
-            conn.row_factory = dict_factory
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM cards ORDER BY nickname")
-            return cursor.fetchall()
+        return get_backend().get_all_cards(current_user())
     except Exception as e:
         logging.error(f"获取所有卡片时出错: {e}")
         return []
 
 def get_card_by_nickname(nickname: str) -> Optional[Dict[str, Any]]:
     try:
-        with get_connection() as conn:
-            conn.row_factory = dict_factory
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM cards WHERE nickname = ?", (nickname,))
-            return cursor.fetchone()
+        return get_backend().get_card_by_nickname(current_user(), nickname)
     except Exception as e:
         logging.error(f"通过别名获取卡片时出错: {e}")
         return None
 
+class CardPage(NamedTuple):
+    cards: List[Dict[str, Any]]
+    has_prev: bool
+    has_next: bool
+
+def get_cards_page(limit: int, after: str = None, before: str = None, prefix: str = None) -> CardPage:
+    """
+    按别名的 keyset 分页：after 取该别名之后的一页，before 取之前的一页，都不传时为第一页；
+    prefix 只列出别名以它开头的卡片。每次只读取 limit + 1 行，多出的一行用来判断前后是否还有。
+    """
+    try:
+        rows = get_backend().get_cards_page(current_user(), limit + 1, after, before, prefix)
+    except Exception as e:
+        logging.error(f"分页获取卡片时出错: {e}")
+        return CardPage([], False, False)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        return CardPage(rows[::-1], more, True)
+    return CardPage(rows, after is not None, more)
+
 def delete_card(nickname: str) -> bool:
     try:
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM cards WHERE nickname = ?", (nickname,))
-            conn.commit()
-            if cursor.rowcount > 0:
-                logging.info(f"成功删除卡片: {nickname}")
-                return True
-            return False
+        backend = get_backend()
+        user_id = current_user()
+        previous_version = get_data_version()
+        card = backend.get_card_by_nickname(user_id, nickname)
+        if card and backend.delete_card(user_id, nickname):
+            delete_ledger_for_card(card['id'])
+            _bump_data_version()
+            _notify_card_change(previous_version, nickname, None)
+            logging.info(f"成功删除卡片: {nickname}")
+            return True
+        return False
     except Exception as e:
         logging.error(f"删除卡片时出错: {e}")
         return False
@@ -115,22 +528,9 @@ def update_card(nickname: str, updates: Dict[str, Any]) -> bool:
     if not updates:
         return False
 
-    # 构造 SQL 的 SET 部分
-    set_clause = ", ".join([f"{field} = ?" for field in updates.keys()])
-    values = list(updates.values())
-    values.append(nickname) # 用于 WHERE 子句
-
-    sql = f"UPDATE cards SET {set_clause} WHERE nickname = ?"
-    
     # 验证字段名，防止SQL注入
-    allowed_fields = [
-        'nickname', 'last_four_digits', 'bank_name', 'statement_day',
-        'statement_day_inclusive', 'due_date_type', 'due_date_value',
-        'currency_type', 'annual_fee_amount', 'annual_fee_date', 'has_waiver',
-        'is_waived_for_cycle', 'waiver_reset_date'
-    ]
     for field in updates.keys():
-        if field not in allowed_fields:
+        if field not in CARD_FIELDS:
             logging.error(f"尝试更新一个不允许的字段: {field}")
             return False
 
@@ -138,20 +538,22 @@ def update_card(nickname: str, updates: Dict[str, Any]) -> bool:
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(sql, tuple(values))
-                conn.commit()
-                if cursor.rowcount > 0:
-                    logging.info(f"成功更新卡片 {nickname} 的数据。")
-                    return True
-                else:
-                    logging.warning(f"未找到要更新的卡片: {nickname}")
-                    return False
+            previous_version = get_data_version()
+            # 账单日规则变化时，已记的流水和分期的每期应还在同一事务中按新规则重新归入账单周期
+            restate = _restate_ledger if STATEMENT_FIELDS & updates.keys() else None
+            if get_backend().update_card(current_user(), nickname, updates, restate):
+                _bump_data_version()
+                if restate:
+                    _bump_ledger_version()
+                _notify_card_change(previous_version, nickname, updates.get('nickname', nickname))
+                logging.info(f"成功更新卡片 {nickname} 的数据。")
+                return True
+            else:
+                logging.warning(f"未找到要更新的卡片: {nickname}")
+                return False
         except sqlite3.OperationalError as e:
             if "database is locked" in str(e) and attempt < max_retries - 1:
                 logging.warning(f"数据库锁定，重试 {attempt + 1}/{max_retries}")
-                import time
                 time.sleep(0.1 * (attempt + 1))  # 递增延迟
                 continue
             else:
@@ -162,3 +564,402 @@ def update_card(nickname: str, updates: Dict[str, Any]) -> bool:
             return False
     
     return False
+
+STATEMENT_FIELDS = {'statement_day', 'statement_day_inclusive'}
+
+def _restate_ledger(conn: sqlite3.Connection, card: Dict[str, Any]):
+    _restate_transactions(conn, card)
+    _restate_installments(conn, card)
+
+def _restate_transactions(conn: sqlite3.Connection, card: Dict[str, Any]):
+    """按卡片当前的账单日规则重新计算每笔流水所属的账单，并重建该卡的周期汇总"""
+    rows = conn.execute("SELECT id, spent_on FROM transactions WHERE card_id = ?", (card['id'],)).fetchall()
+    if not rows:
+        return
+    conn.executemany("UPDATE transactions SET statement_date = ? WHERE id = ?", [
+        (core_logic.get_statement_date_for_purchase(
+            date.fromisoformat(spent_on), card['statement_day'], card['statement_day_inclusive']).isoformat(), txn_id)
+        for txn_id, spent_on in rows
+    ])
+    conn.execute("DELETE FROM cycle_totals WHERE card_id = ?", (card['id'],))
+    conn.execute("""
+        INSERT INTO cycle_totals (card_id, statement_date, total_cents, txn_count)
+        SELECT card_id, statement_date, SUM(amount_cents), COUNT(*) FROM transactions
+        WHERE card_id = ? GROUP BY card_id, statement_date
+    """, (card['id'],))
+    logging.info(f"卡片 {card['nickname']} 的账单日规则已变更，{len(rows)} 笔流水已重新归入账单周期")
+
+def _restate_installments(conn: sqlite3.Connection, card: Dict[str, Any]):
+    """分期的每期应还（及计划的首期账单日）移到同一个月按新账单日出账的那一天"""
+    def moved(stmt: str) -> str:
+        day = date.fromisoformat(stmt)
+        return installments.statement_in_month(card, day.year, day.month).isoformat()
+
+    payments = conn.execute(
+        "SELECT plan_id, period_no, statement_date FROM installment_payments WHERE card_id = ?", (card['id'],)
+    ).fetchall()
+    if not payments:
+        return
+    conn.executemany("UPDATE installment_payments SET statement_date = ? WHERE plan_id = ? AND period_no = ?",
+                     [(moved(stmt), plan_id, period_no) for plan_id, period_no, stmt in payments])
+    plans = conn.execute("SELECT id, first_statement_date FROM installment_plans WHERE card_id = ?", (card['id'],)).fetchall()
+    conn.executemany("UPDATE installment_plans SET first_statement_date = ? WHERE id = ?",
+                     [(moved(stmt), plan_id) for plan_id, stmt in plans])
+    logging.info(f"卡片 {card['nickname']} 的 {len(payments)} 期分期应还已移到新的账单日")
+
+def _owned_card_ids() -> List[int]:
+    """当前用户的卡片 id；按流水、规则、分期的 id 操作时用来确认归属"""
+    return [card['id'] for card in get_backend().get_all_cards(current_user())]
+
+# --- 消费流水 ---
+def add_transaction(card_id: int, amount_cents: int, spent_on: date, statement_date: date, note: str = None, category: str = None) -> Optional[int]:
+    """
+    记录一笔消费，并在同一事务中增量更新该卡该账单周期的汇总。
+    返回流水 id，失败返回 None。
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO transactions (card_id, amount_cents, spent_on, statement_date, note, category) VALUES (?, ?, ?, ?, ?, ?)",
+                (card_id, amount_cents, spent_on.isoformat(), statement_date.isoformat(), note, category)
+            )
+            conn.execute("""
+                INSERT INTO cycle_totals (card_id, statement_date, total_cents, txn_count) VALUES (?, ?, ?, 1)
+                ON CONFLICT (card_id, statement_date) DO UPDATE SET
+                    total_cents = total_cents + excluded.total_cents,
+                    txn_count = txn_count + 1
+            """, (card_id, statement_date.isoformat(), amount_cents))
+            _apply_balance_delta(conn, card_id, amount_cents)
+            conn.commit()
+            _update_balance_index(card_id, amount_cents)
+            _bump_ledger_version()
+            logging.info(f"记录消费: 卡片 {card_id} ¥{amount_cents / 100:.2f} → {statement_date} 账单")
+            return cursor.lastrowid
+    except Exception as e:
+        logging.error(f"记录消费时出错: {e}")
+        return None
+
+def delete_transaction(transaction_id: int) -> Optional[Dict[str, Any]]:
+    """删除一笔流水并回滚对应的周期汇总，返回被删除的流水"""
+    try:
+        with get_connection() as conn:
+            conn.row_factory = dict_factory
+            txn = conn.execute("SELECT * FROM transactions WHERE id = ?", (transaction_id,)).fetchone()
+            if not txn or txn['card_id'] not in _owned_card_ids():
+                return None
+            conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+            conn.execute(
+                "UPDATE cycle_totals SET total_cents = total_cents - ?, txn_count = txn_count - 1 "
+                "WHERE card_id = ? AND statement_date = ?",
+                (txn['amount_cents'], txn['card_id'], txn['statement_date'])
+            )
+            conn.execute(
+                "DELETE FROM cycle_totals WHERE card_id = ? AND statement_date = ? AND txn_count <= 0",
+                (txn['card_id'], txn['statement_date'])
+            )
+            _apply_balance_delta(conn, txn['card_id'], -txn['amount_cents'])
+            conn.commit()
+            _update_balance_index(txn['card_id'], -txn['amount_cents'])
+            _bump_ledger_version()
+            logging.info(f"已撤销流水 {transaction_id}")
+            return txn
+    except Exception as e:
+        logging.error(f"删除流水时出错: {e}")
+        return None
+
+def get_cycle_totals(keys: List[Tuple[int, date]]) -> Dict[Tuple[int, date], Dict[str, int]]:
+    """
+    批量查询 (card_id, 账单日) 对应的周期汇总，一次主键查询完成，与流水条数无关。
+    没有消费的周期不会出现在结果中。
+    """
+    if not keys:
+        return {}
+    placeholders = ", ".join(["(?, ?)"] * len(keys))
+    params = [v for card_id, stmt in keys for v in (card_id, stmt.isoformat())]
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT card_id, statement_date, total_cents, txn_count FROM cycle_totals "
+                f"WHERE (card_id, statement_date) IN (VALUES {placeholders})",
+                params
+            ).fetchall()
+        return {
+            (card_id, date.fromisoformat(stmt)): {'total_cents': total, 'txn_count': count}
+            for card_id, stmt, total, count in rows
+        }
+    except Exception as e:
+        logging.error(f"查询账单周期汇总时出错: {e}")
+        return {}
+
+def get_category_cycle_spend(keys: List[Tuple[int, date]]) -> Dict[Tuple[int, date], Dict[Optional[str], int]]:
+    """
+    批量查询 (card_id, 账单日) 周期内按消费类别汇总的金额，用于计算返现上限的剩余额度。
+    走 idx_transactions_card_cycle 索引，只扫描涉及的周期。
+    """
+    if not keys:
+        return {}
+    placeholders = ", ".join(["(?, ?)"] * len(keys))
+    params = [v for card_id, stmt in keys for v in (card_id, stmt.isoformat())]
+    result: Dict[Tuple[int, date], Dict[Optional[str], int]] = {}
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT card_id, statement_date, category, SUM(amount_cents) FROM transactions "
+                f"WHERE (card_id, statement_date) IN (VALUES {placeholders}) "
+                f"GROUP BY card_id, statement_date, category",
+                params
+            ).fetchall()
+        for card_id, stmt, category, total in rows:
+            result.setdefault((card_id, date.fromisoformat(stmt)), {})[category] = total
+        return result
+    except Exception as e:
+        logging.error(f"查询分类消费汇总时出错: {e}")
+        return {}
+
+def delete_ledger_for_card(card_id: int):
+    """删除卡片时一并清理其流水、汇总、还款、返现规则与分期"""
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM transactions WHERE card_id = ?", (card_id,))
+            conn.execute("DELETE FROM cycle_totals WHERE card_id = ?", (card_id,))
+            conn.execute("DELETE FROM repayments WHERE card_id = ?", (card_id,))
+            conn.execute("DELETE FROM card_balances WHERE card_id = ?", (card_id,))
+            conn.execute("DELETE FROM reward_rules WHERE card_id = ?", (card_id,))
+            conn.execute("DELETE FROM installment_plans WHERE card_id = ?", (card_id,))
+            conn.execute("DELETE FROM installment_payments WHERE card_id = ?", (card_id,))
+            conn.commit()
+        with _balance_lock:
+            if _balance_index is not None:
+                _balance_index.pop(card_id, None)
+    except Exception as e:
+        logging.error(f"清理卡片 {card_id} 的流水时出错: {e}")
+
+# --- 还款与未还余额 ---
+# card_id -> 未还余额（分）的内存索引：首次使用时从 card_balances 加载，
+# 之后随记账、撤销和还款增量更新，推荐排序时查询可用额度只是一次字典查找。
+_balance_index: Optional[Dict[int, int]] = None
+_balance_lock = threading.Lock()
+
+def _apply_balance_delta(conn: sqlite3.Connection, card_id: int, delta_cents: int):
+    conn.execute("""
+        INSERT INTO card_balances (card_id, balance_cents) VALUES (?, ?)
+        ON CONFLICT (card_id) DO UPDATE SET balance_cents = balance_cents + excluded.balance_cents
+    """, (card_id, delta_cents))
+
+def _update_balance_index(card_id: int, delta_cents: int):
+    """事务提交后同步内存索引；索引尚未加载时无需处理，加载时会读到最新值"""
+    with _balance_lock:
+        if _balance_index is not None:
+            _balance_index[card_id] = _balance_index.get(card_id, 0) + delta_cents
+
+def get_card_balances() -> Dict[int, int]:
+    """返回 card_id -> 未还余额（分）的索引"""
+    global _balance_index
+    if _balance_index is None:
+        with _balance_lock:
+            if _balance_index is None:
+                try:
+                    with get_connection() as conn:
+                        _balance_index = dict(conn.execute("SELECT card_id, balance_cents FROM card_balances").fetchall())
+                except Exception as e:
+                    logging.error(f"加载未还余额时出错: {e}")
+                    return {}
+    return _balance_index
+
+def add_repayment(card_id: int, amount_cents: int, paid_on: date) -> Optional[int]:
+    """记录一笔还款并减少未还余额，返回还款记录 id，失败返回 None"""
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO repayments (card_id, amount_cents, paid_on) VALUES (?, ?, ?)",
+                (card_id, amount_cents, paid_on.isoformat())
+            )
+            _apply_balance_delta(conn, card_id, -amount_cents)
+            conn.commit()
+        _update_balance_index(card_id, -amount_cents)
+        _bump_ledger_version()
+        logging.info(f"记录还款: 卡片 {card_id} ¥{amount_cents / 100:.2f}")
+        return cursor.lastrowid
+    except Exception as e:
+        logging.error(f"记录还款时出错: {e}")
+        return None
+
+# --- 返现规则 ---
+def add_reward_rule(card_id: int, category: str, rate_bp: int, cap_cents: int = None,
+                    min_spend_cents: int = 0, starts_on: date = None, ends_on: date = None) -> Optional[int]:
+    """新增一条返现规则，返回规则 id，失败返回 None"""
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO reward_rules (card_id, category, rate_bp, cap_cents, min_spend_cents, starts_on, ends_on) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (card_id, category, rate_bp, cap_cents, min_spend_cents,
+                 starts_on.isoformat() if starts_on else None, ends_on.isoformat() if ends_on else None)
+            )
+            conn.commit()
+            _bump_ledger_version()
+            logging.info(f"新增返现规则: 卡片 {card_id} {category} {rate_bp / 100:.2f}%")
+            return cursor.lastrowid
+    except Exception as e:
+        logging.error(f"新增返现规则时出错: {e}")
+        return None
+
+def get_reward_rules(card_id: int = None) -> List[Dict[str, Any]]:
+    """获取当前用户全部（或指定卡片的）返现规则"""
+    try:
+        with get_connection() as conn:
+            conn.row_factory = dict_factory
+            if card_id is None:
+                owned = _owned_card_ids()
+                return conn.execute(
+                    f"SELECT * FROM reward_rules WHERE card_id IN ({', '.join('?' * len(owned))}) ORDER BY card_id, id", owned
+                ).fetchall()
+            return conn.execute("SELECT * FROM reward_rules WHERE card_id = ? ORDER BY id", (card_id,)).fetchall()
+    except Exception as e:
+        logging.error(f"获取返现规则时出错: {e}")
+        return []
+
+def delete_reward_rule(rule_id: int) -> bool:
+    try:
+        owned = _owned_card_ids()
+        with get_connection() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM reward_rules WHERE id = ? AND card_id IN ({', '.join('?' * len(owned))})", [rule_id, *owned]
+            )
+            conn.commit()
+            if cursor.rowcount:
+                _bump_ledger_version()
+            return cursor.rowcount > 0
+    except Exception as e:
+        logging.error(f"删除返现规则时出错: {e}")
+        return False
+
+# --- 分期 ---
+def add_installment_plan(card_id: int, principal_cents: int, periods: int, fee_rate_bp: int,
+                         first_statement_date: date, schedule: List[Tuple[int, date, int, int]],
+                         note: str = None) -> Optional[int]:
+    """
+    保存分期计划，并在同一事务中写入展开后的每期应还。
+    schedule 为 (期号, 账单日, 本金分, 手续费分) 列表。返回计划 id，失败返回 None。
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO installment_plans (card_id, principal_cents, periods, fee_rate_bp, first_statement_date, note) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (card_id, principal_cents, periods, fee_rate_bp, first_statement_date.isoformat(), note)
+            )
+            plan_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO installment_payments (plan_id, period_no, card_id, statement_date, principal_cents, fee_cents) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(plan_id, period_no, card_id, stmt.isoformat(), principal, fee) for period_no, stmt, principal, fee in schedule]
+            )
+            conn.commit()
+        _bump_ledger_version()
+        return plan_id
+    except Exception as e:
+        logging.error(f"保存分期计划时出错: {e}")
+        return None
+
+def get_installment_plans(as_of: date, card_id: int = None) -> List[Dict[str, Any]]:
+    """获取当前用户的分期计划，附带 as_of 当天及以后出账的剩余期数与金额（remaining_periods / remaining_cents）"""
+    sql = """
+        SELECT p.*, COUNT(s.period_no) AS remaining_periods,
+               COALESCE(SUM(s.principal_cents + s.fee_cents), 0) AS remaining_cents
+        FROM installment_plans p
+        LEFT JOIN installment_payments s ON s.plan_id = p.id AND s.statement_date >= ?
+    """
+    params: List[Any] = [as_of.isoformat()]
+    try:
+        if card_id is not None:
+            sql += " WHERE p.card_id = ?"
+            params.append(card_id)
+        else:
+            owned = _owned_card_ids()
+            sql += f" WHERE p.card_id IN ({', '.join('?' * len(owned))})"
+            params += owned
+        sql += " GROUP BY p.id ORDER BY p.card_id, p.id"
+        with get_connection() as conn:
+            conn.row_factory = dict_factory
+            return conn.execute(sql, params).fetchall()
+    except Exception as e:
+        logging.error(f"获取分期计划时出错: {e}")
+        return []
+
+def delete_installment_plan(plan_id: int) -> bool:
+    try:
+        owned = _owned_card_ids()
+        with get_connection() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM installment_plans WHERE id = ? AND card_id IN ({', '.join('?' * len(owned))})", [plan_id, *owned]
+            )
+            if cursor.rowcount:
+                conn.execute("DELETE FROM installment_payments WHERE plan_id = ?", (plan_id,))
+            conn.commit()
+        if cursor.rowcount:
+            _bump_ledger_version()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logging.error(f"删除分期计划时出错: {e}")
+        return False
+
+def get_installment_totals(keys: List[Tuple[int, date]]) -> Dict[Tuple[int, date], int]:
+    """
+    批量查询 (card_id, 账单日) 当期应还的分期金额（本金 + 手续费），
+    查询键作为 VALUES 表与 installment_payments 连接，每个键是一次 (card_id, statement_date) 索引查找。
+    没有分期的周期不出现在结果中。
+    """
+    if not keys:
+        return {}
+    placeholders = ", ".join(["(?, ?)"] * len(keys))
+    params = [v for card_id, stmt in keys for v in (card_id, stmt.isoformat())]
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"WITH k (card_id, statement_date) AS (VALUES {placeholders}) "
+                f"SELECT s.card_id, s.statement_date, SUM(s.principal_cents + s.fee_cents) "
+                f"FROM k JOIN installment_payments s ON s.card_id = k.card_id AND s.statement_date = k.statement_date "
+                f"GROUP BY s.card_id, s.statement_date",
+                params
+            ).fetchall()
+        return {(card_id, date.fromisoformat(stmt)): total for card_id, stmt, total in rows}
+    except Exception as e:
+        logging.error(f"查询分期应还时出错: {e}")
+        return {}
+
+# --- 家庭成员 ---
+def get_household_members() -> List[Dict[str, Any]]:
+    """全部家庭成员关系，启动时载入内存（见 households.py）"""
+    try:
+        with get_connection() as conn:
+            conn.row_factory = dict_factory
+            return conn.execute("SELECT member_id, owner_id, role FROM household_members ORDER BY owner_id, member_id").fetchall()
+    except Exception as e:
+        logging.error(f"获取家庭成员时出错: {e}")
+        return []
+
+def set_household_member(owner_id: int, member_id: int, role: str) -> bool:
+    """加入家庭或修改角色"""
+    try:
+        with get_connection() as conn:
+            conn.execute("""
+                INSERT INTO household_members (member_id, owner_id, role) VALUES (?, ?, ?)
+                ON CONFLICT (member_id) DO UPDATE SET owner_id = excluded.owner_id, role = excluded.role
+            """, (member_id, owner_id, role))
+            conn.commit()
+        logging.info(f"用户 {member_id} 以 {role} 身份加入 {owner_id} 的家庭")
+        return True
+    except Exception as e:
+        logging.error(f"保存家庭成员时出错: {e}")
+        return False
+
+def remove_household_member(member_id: int) -> bool:
+    try:
+        with get_connection() as conn:
+            cursor = conn.execute("DELETE FROM household_members WHERE member_id = ?", (member_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+    except Exception as e:
+        logging.error(f"移除家庭成员时出错: {e}")
+        return False
@@ -0,0 +1,179 @@
+# equivalence_check.py
+"""
+账单规则的穷举等价性检查。
+
+遍历所有规则组合（账单日 1-28 × 是否计入本期 × 还款日类型 × 还款日数值 × 节假日调整方式），
+在覆盖闰年 / 平年二月和跨年的日期窗口内逐日计算核心结果，
+用于证明任何优化后的计算引擎与当前 core_logic 的结果完全一致。
+同时验证 build_period_table / build_period_column 预计算表与逐日计算的结果一致。
+
+用法：
+    python equivalence_check.py                      # 当前 core_logic 与记录的摘要对比
+    python equivalence_check.py --engine my_engine   # 候选引擎与 core_logic 逐项对比
+    python equivalence_check.py --record             # 重新记录摘要（仅在有意改变语义时使用）
+"""
+import sys
+import json
+import hashlib
+import argparse
+import importlib
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+import benchmark
+import business_days
+import core_logic
+
+# 2023-12 至 2025-03：包含两次跨年、闰年二月（2024）和平年二月（2025）
+WINDOW_START = date(2023, 12, 1)
+WINDOW_END = date(2025, 3, 31)
+
+CHECKED_FUNCTIONS = [
+    'get_statement_date_for_purchase',
+    'get_due_date_from_statement',
+    'get_interest_free_period',
+    'get_next_due_date',
+    'get_next_calendar_statement_date',
+]
+
+
+def all_rules() -> Iterator[Dict]:
+    """枚举所有合法的规则组合（与添加卡片时的输入校验一致）"""
+    due_ranges = {'fixed_day': range(1, 29), 'days_after': range(1, 61)}
+    for statement_day in range(1, 29):
+        for inclusive in (True, False):
+            for due_type, values in due_ranges.items():
+                for due_value in values:
+                    for adjustment in business_days.POLICIES:
+                        yield {
+                            'statement_day': statement_day,
+                            'statement_day_inclusive': inclusive,
+                            'due_date_type': due_type,
+                            'due_date_value': due_value,
+                            'due_date_adjustment': adjustment,
+                        }
+
+
+def window_days(start: date = WINDOW_START, end: date = WINDOW_END) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def evaluate(engine, function: str, rule: Dict, days: List[date]) -> List:
+    """对单条规则在整个窗口内求值，返回可比较、可序列化的结果列表"""
+    fn = getattr(engine, function)
+    if function == 'get_statement_date_for_purchase':
+        return [fn(d, rule['statement_day'], rule['statement_day_inclusive']) for d in days]
+    if function == 'get_due_date_from_statement':
+        return [fn(d, rule['due_date_type'], rule['due_date_value'], rule['due_date_adjustment']) for d in days]
+    if function == 'get_next_calendar_statement_date':
+        return [fn(d, rule['statement_day']) for d in days]
+    return [fn(rule, d) for d in days]
+
+
+def _rule_key(rule: Dict) -> Tuple:
+    return (rule['statement_day'], rule['statement_day_inclusive'], rule['due_date_type'], rule['due_date_value'],
+            rule['due_date_adjustment'])
+
+
+def compute_digests(engine, days: List[date]) -> Dict[str, str]:
+    digests = {}
+    for function in CHECKED_FUNCTIONS:
+        h = hashlib.sha256()
+        for rule in all_rules():
+            h.update(repr((_rule_key(rule), evaluate(engine, function, rule, days))).encode())
+        digests[function] = h.hexdigest()
+    return digests
+
+
+def compare_engines(candidate, reference, days: List[date], max_reports: int = 10) -> List[str]:
+    """逐条规则逐日对比，返回前 max_reports 个不一致的描述"""
+    mismatches = []
+    for function in CHECKED_FUNCTIONS:
+        if not hasattr(candidate, function):
+            continue
+        for rule in all_rules():
+            expected = evaluate(reference, function, rule, days)
+            actual = evaluate(candidate, function, rule, days)
+            if expected == actual:
+                continue
+            for d, e, a in zip(days, expected, actual):
+                if e != a:
+                    mismatches.append(f"{function}{_rule_key(rule)} @ {d}: 期望 {e}, 实际 {a}")
+                    break
+            if len(mismatches) >= max_reports:
+                return mismatches
+    return mismatches
+
+
+def check_period_tables(days: List[date], max_reports: int = 10) -> List[str]:
+    """build_period_table / build_period_column 是逐日计算的预计算版本，逐条规则对比两者的结果"""
+    mismatches = []
+    for rule in all_rules():
+        table = core_logic.build_period_table(rule, days[0], len(days))
+        column = core_logic.build_period_column(rule, days[0], len(days))
+        for d, entry, free_days in zip(days, table, column):
+            statement_date = core_logic.get_statement_date_for_purchase(d, rule['statement_day'], rule['statement_day_inclusive'])
+            expected = (statement_date, core_logic.get_due_date_from_statement(statement_date, rule['due_date_type'], rule['due_date_value'], rule['due_date_adjustment']))
+            if entry != expected:
+                mismatches.append(f"build_period_table{_rule_key(rule)} @ {d}: 期望 {expected}, 实际 {entry}")
+                break
+            if free_days != (expected[1] - d).days:
+                mismatches.append(f"build_period_column{_rule_key(rule)} @ {d}: 期望 {(expected[1] - d).days}, 实际 {free_days}")
+                break
+        for name, result in (('build_period_table', table), ('build_period_column', column)):
+            if len(result) != len(days):
+                mismatches.append(f"{name}{_rule_key(rule)}: 长度 {len(result)} != {len(days)}")
+        if len(mismatches) >= max_reports:
+            break
+    return mismatches
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="账单规则穷举等价性检查")
+    parser.add_argument('--engine', help="候选引擎的模块名，需提供与 core_logic 同名的函数")
+    parser.add_argument('--record', action='store_true', help="把当前 core_logic 的结果摘要写入基线文件")
+    args = parser.parse_args(argv)
+
+    days = window_days()
+    rule_count = sum(1 for _ in all_rules())
+    print(f"规则组合 {rule_count} 条 × {len(days)} 天（{WINDOW_START} ~ {WINDOW_END}）")
+
+    if args.engine:
+        candidate = importlib.import_module(args.engine)
+        mismatches = compare_engines(candidate, core_logic, days)
+        if mismatches:
+            print("❌ 结果不一致：\n" + "\n".join(mismatches))
+            return 1
+        print(f"✅ {args.engine} 与 core_logic 完全一致")
+        return 0
+
+    table_mismatches = check_period_tables(days)
+    if table_mismatches:
+        print("❌ 预计算表与逐日计算不一致：\n" + "\n".join(table_mismatches))
+        return 1
+    print("✅ build_period_table / build_period_column 与逐日计算一致")
+
+    digests = compute_digests(core_logic, days)
+    baseline = benchmark.load_baseline()
+    if args.record:
+        baseline['equivalence'] = {
+            'window': [WINDOW_START.isoformat(), WINDOW_END.isoformat()],
+            'rules': rule_count,
+            'digests': digests,
+        }
+        with open(benchmark.BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"已记录 {len(digests)} 个函数的结果摘要")
+        return 0
+
+    recorded = baseline.get('equivalence', {}).get('digests', {})
+    failed = [name for name, digest in digests.items() if recorded.get(name) not in (None, digest)]
+    for name, digest in digests.items():
+        status = "未记录" if name not in recorded else ("❌ 不一致" if name in failed else "✅ 一致")
+        print(f"{status} {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
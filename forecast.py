@@ -0,0 +1,123 @@
+# forecast.py
+"""
+还款现金流预测：把未来 90-180 天所有卡的出账日和还款日展开为事件流，
+按天、按周（周一开始）汇总应还金额，标出还款集中或金额过高的周。
+
+每张卡的事件由 core_logic.build_period_runs 按账单周期成段生成，本身已按日期排序；
+多张卡的事件流用 heapq.merge 归并后只扫描一遍，不逐日调用 get_next_due_date。
+金额来自记账数据：每期账单取 cycle_totals，已出账未还的一期再按未还余额封顶；
+分期每期应还从已展开的 installment_payments 中按 (卡片, 账单日) 取出后相加。
+"""
+import heapq
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import core_logic
+import database as db
+
+MIN_HORIZON_DAYS = 90
+MAX_HORIZON_DAYS = 180
+
+STATEMENT = 'statement'
+DUE = 'due'
+
+
+class ForecastEvent(NamedTuple):
+    day: date
+    kind: str                      # statement / due
+    card: Dict
+    statement_date: date
+    amount_cents: Optional[int]    # 有记账或分期数据时为该期账单金额
+
+
+class WeekBucket(NamedTuple):
+    start: date                    # 周一
+    due_events: List[ForecastEvent]
+    statement_events: List[ForecastEvent]
+    due_cents: int
+    flagged: bool
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=6)
+
+
+class Forecast(NamedTuple):
+    start: date
+    days: int
+    daily_due: Dict[date, int]     # 还款日 -> 当日应还（分），只含有还款的日子
+    weeks: List[WeekBucket]        # 只含有事件的周，按时间排序
+
+    @property
+    def flagged_weeks(self) -> List[WeekBucket]:
+        return [week for week in self.weeks if week.flagged]
+
+    @property
+    def total_due_cents(self) -> int:
+        return sum(self.daily_due.values())
+
+
+def _card_events(card: Dict, start: date, end: date) -> Iterator[ForecastEvent]:
+    """单张卡在 [start, end) 内的出账与还款事件，按日期升序"""
+    open_stmt = core_logic.get_statement_date_for_purchase(start, card['statement_day'], card['statement_day_inclusive'])
+    # 已出账但还款日未到的上一期
+    statements = [core_logic.get_previous_statement_date(open_stmt, card['statement_day'])]
+    statements += [stmt for _, _, stmt, _ in core_logic.build_period_runs(card, start, (end - start).days)]
+    events = []
+    for stmt in dict.fromkeys(statements):  # 月末账单日逐日切分时会重复，去重并保持顺序
+        due = core_logic.get_due_date_from_statement(stmt, card['due_date_type'], card['due_date_value'], card.get('due_date_adjustment'))
+        if start <= stmt < end:
+            events.append(ForecastEvent(stmt, STATEMENT, card, stmt, None))
+        if start <= due < end:
+            events.append(ForecastEvent(due, DUE, card, stmt, None))
+    events.sort(key=lambda e: e.day)
+    return iter(events)
+
+def build_forecast(cards: List[Dict], start: date, days: int, weekly_threshold_cents: int,
+                   weekly_due_count: int) -> Forecast:
+    end = start + timedelta(days=days)
+    streams = [_card_events(card, start, end) for card in cards]
+    events = list(heapq.merge(*streams, key=lambda e: e.day))
+
+    keys = list({(e.card['id'], e.statement_date) for e in events})
+    totals = db.get_cycle_totals(keys)
+    installment_totals = db.get_installment_totals(keys)
+    balances = db.get_card_balances()
+    first_due: Dict[int, date] = {}
+
+    daily_due: Dict[date, int] = defaultdict(int)
+    weeks: Dict[date, dict] = {}
+    for event in events:
+        key = (event.card['id'], event.statement_date)
+        total = totals.get(key)
+        amount = total['total_cents'] if total else None
+        if event.kind == DUE and amount is not None:
+            card_id = event.card['id']
+            if first_due.setdefault(card_id, event.day) == event.day:
+                # 最近一期可能已部分还款，应还不超过当前未还余额
+                amount = min(amount, max(balances.get(card_id, 0), 0))
+        if key in installment_totals:
+            amount = (amount or 0) + installment_totals[key]
+        event = event._replace(amount_cents=amount)
+
+        week_start = event.day - timedelta(days=event.day.weekday())
+        week = weeks.setdefault(week_start, {'due': [], 'statement': [], 'cents': 0})
+        if event.kind == DUE:
+            week['due'].append(event)
+            week['cents'] += amount or 0
+            daily_due[event.day] += amount or 0
+        else:
+            week['statement'].append(event)
+
+    buckets = [
+        WeekBucket(
+            start=week_start,
+            due_events=week['due'],
+            statement_events=week['statement'],
+            due_cents=week['cents'],
+            flagged=week['cents'] > weekly_threshold_cents or len(week['due']) >= weekly_due_count,
+        )
+        for week_start, week in weeks.items()
+    ]
+    return Forecast(start, days, dict(daily_due), buckets)
@@ -1,17 +1,42 @@
 # handlers.py
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import (
+    Update, InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InlineQueryResultsButton,
+    InputTextMessageContent
+)
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, MessageHandler, 
     filters, CallbackQueryHandler
 )
+import asyncio
+import html
 import logging
+import re
 from datetime import datetime, date, timedelta
+from typing import NamedTuple, Optional
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 import calendar as py_calendar
 
-from config import ADMIN_USER_ID
+from config import ADMIN_USER_ID, ALLOWED_USER_IDS, BACKUP_CONFIG, FORECAST_CONFIG, INLINE_CONFIG
 import database as db
+import backup
+import briefing
+import business_days
+import card_search
+import compute_pool
 import core_logic
+import coverage_map
+import daily_ranking
+import forecast
+import households
+import installments
+import merchants
+import optimizer
+import reminders
+import rewards
+import sharding
+import simulator
 from apple_ux_enhancements import AppleStyleUX
 from app_config import config
 
@@ -27,11 +52,11 @@ from app_config import config
     EDIT_STATEMENT_INCLUSIVE, EDIT_CURRENCY_TYPE,
     EDIT_DUE_DATE_TYPE, EDIT_DUE_DATE_VALUE,
     EDIT_FEE_SUB_MENU, EDIT_FEE_AMOUNT, EDIT_FEE_DATE, EDIT_HAS_WAIVER,
-    EDIT_WAIVER_STATUS,
+    EDIT_WAIVER_STATUS, EDIT_DUE_ADJUSTMENT,
 
     # delcard 流程
     DEL_CARD_CHOOSE
-) = range(24)
+) = range(25)
 
 EDITABLE_FIELDS = {
     'nickname': '别名',
@@ -41,7 +66,9 @@ EDITABLE_FIELDS = {
     'statement_day_inclusive': '账单日规则',
     'due_date_rule': '还款规则',
     'currency_type': '币种支持',
-    'annual_fee': '年费信息'
+    'annual_fee': '年费信息',
+    'credit_limit': '信用额度',
+    'due_date_adjustment': '节假日还款'
 }
 
 def format_card_name(card: dict) -> str:
@@ -61,6 +88,10 @@ def _format_card_summary(card: dict) -> str:
     currency_map = {"local": "人民币", "foreign": "外币", "all": "全币种"}
     currency_text = currency_map.get(card['currency_type'], card['currency_type'])
     
+    adjustment = card.get('due_date_adjustment')
+    if adjustment and adjustment != business_days.NONE:
+        due_rule += f"，遇节假日{business_days.POLICIES[adjustment]}"
+
     info_parts = [
         f"• 账单日：{card['statement_day']}号",
         f"• 还款：{due_rule}",
@@ -71,6 +102,10 @@ def _format_card_summary(card: dict) -> str:
         fee_status = "已豁免" if card.get('is_waived_for_cycle') else "待处理"
         info_parts.append(f"• 年费：¥{card['annual_fee_amount']} ({fee_status})")
     
+    available = AppleStyleUX.get_available_credit(card, db.get_card_balances())
+    if available is not None:
+        info_parts.append(f"• 额度：¥{card['credit_limit']:,}（可用 {_format_money(available)}）")
+    
     return "📋 <b>当前信息概览</b>\n" + "\n".join(info_parts) + "\n"
 
 def _format_primary_recommendation(best_card_info: dict) -> str:
@@ -96,16 +131,147 @@ def _format_primary_recommendation(best_card_info: dict) -> str:
         f"💡 {advice}"
     )
 
-async def auth_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """检查用户是否是管理员，不是则礼貌拒绝"""
+def _format_money(cents: int) -> str:
+    """金额统一以分存储，展示为 ¥1,234.50"""
+    return f"¥{cents / 100:,.2f}"
+
+def _parse_amount_cents(text: str):
+    """解析用户输入的金额（支持 ¥、千分位），返回分；无效返回 None"""
+    try:
+        amount = Decimal(text.replace(',', '').lstrip('¥￥'))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or amount <= 0 or amount >= Decimal('100000000'):
+        return None
+    return int((amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+class AskQuery(NamedTuple):
+    amount_cents: Optional[int]
+    currency: Optional[str]
+    category: Optional[str]
+    merchant: Optional[merchants.MerchantMatch]
+    scope: Optional[str]  # local / foreign / None（两类都展示）
+
+_AMOUNT_TOKEN = re.compile(r'^(\D*?)(\d[\d.,]*)(\D*)$')
+
+def _parse_ask_query(args: list) -> Optional[AskQuery]:
+    """
+    解析 /ask 的自由文本：金额（可带币种符号或后缀，如 $120、38元）、币种、类别和商户可任意顺序出现。
+    未识别的词拼成商户名交给商户词典；商户也无法识别时返回 None。
+    """
+    amount_cents = currency = category = None
+    rest = []
+    for token in args:
+        match = _AMOUNT_TOKEN.match(token)
+        if match and amount_cents is None:
+            prefix, number, suffix = match.groups()
+            currencies = [merchants.parse_currency(part) for part in (prefix, suffix) if part]
+            amount = _parse_amount_cents(number)
+            if amount is not None and all(currencies):
+                amount_cents = amount
+                currency = currency or (currencies[0] if currencies else None)
+                continue
+        if currency is None and merchants.parse_currency(token):
+            currency = merchants.parse_currency(token)
+            continue
+        if category is None and rewards.parse_category(token):
+            category = rewards.parse_category(token)
+            continue
+        rest.append(token)
+
+    merchant = None
+    if rest:
+        merchant = merchants.resolve(" ".join(rest))
+        if merchant is None:
+            return None
+        category = category or merchant.merchant.category
+
+    if currency:
+        scope = 'local' if currency == merchants.LOCAL_CURRENCY else 'foreign'
+    else:
+        scope = merchant.merchant.region if merchant else None
+    return AskQuery(amount_cents, currency, category, merchant, scope)
+
+def _find_card(cards: list, text: str):
+    """按别名查找卡片：先精确匹配，再匹配唯一包含该文本的别名"""
+    for card in cards:
+        if card['nickname'] == text:
+            return card
+    matches = [card for card in cards if text.lower() in card['nickname'].lower()]
+    return matches[0] if len(matches) == 1 else None
+
+def _format_installment_part(cents) -> str:
+    return f"（含分期 {_format_money(cents)}）" if cents else ""
+
+def _format_bill_forecast(cards: list, today: date) -> str:
+    """根据周期汇总生成账单预估：已出账待还款的金额 + 本期已累计的消费"""
+    cycles = []
+    for card in cards:
+        open_stmt = core_logic.get_statement_date_for_purchase(today, card['statement_day'], card['statement_day_inclusive'])
+        closed_stmt = core_logic.get_previous_statement_date(open_stmt, card['statement_day'])
+        cycles.append((card, open_stmt, closed_stmt))
+    keys = [(card['id'], stmt) for card, open_stmt, closed_stmt in cycles for stmt in (open_stmt, closed_stmt)]
+    totals = db.get_cycle_totals(keys)
+    installment_totals = db.get_installment_totals(keys)
+    if not totals and not installment_totals:
+        return ""
+
+    closed_lines, open_lines = [], []
+    for card, open_stmt, closed_stmt in cycles:
+        closed = totals.get((card['id'], closed_stmt))
+        closed_cents = (closed['total_cents'] if closed else 0) + installment_totals.get((card['id'], closed_stmt), 0)
+        if closed_cents > 0:
+            due_date = core_logic.get_due_date_from_statement(closed_stmt, card['due_date_type'], card['due_date_value'], card.get('due_date_adjustment'))
+            if due_date >= today:
+                closed_lines.append(
+                    f"• 🔴 {format_card_name(card)} 已出账 <b>{_format_money(closed_cents)}</b>"
+                    f"{_format_installment_part(installment_totals.get((card['id'], closed_stmt)))}，"
+                    f"{due_date.strftime('%m月%d日')}前还款\n"
+                )
+        current = totals.get((card['id'], open_stmt))
+        installment_cents = installment_totals.get((card['id'], open_stmt), 0)
+        if (current and current['total_cents'] > 0) or installment_cents:
+            spent = f"本期累计 {_format_money(current['total_cents'])}（{current['txn_count']}笔）" if current else "本期"
+            if installment_cents:
+                spent += f" + 分期 {_format_money(installment_cents)}"
+            open_lines.append(f"• 🟢 {format_card_name(card)} {spent}，{open_stmt.strftime('%m月%d日')}出账\n")
+    if not closed_lines and not open_lines:
+        return ""
+    return "🧾 <b>账单预估</b>\n" + "".join(closed_lines) + "".join(open_lines)
+
+async def scope_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """在所有处理器之前执行（group -1）：把本次更新的数据库读写限定在发送者所属的卡片组合"""
+    user = update.effective_user
+    db.set_current_user(households.resolve(user.id).portfolio_id if user else None)
+
+def _is_active_portfolio(user_id: int) -> bool:
+    """户主仍在允许列表中，且本人没有加入别人的家庭（加入后自己名下的卡片不再使用）"""
+    return user_id in ALLOWED_USER_IDS and households.resolve(user_id).role == households.OWNER
+
+def tenant_user_ids() -> list:
+    """有卡片的有效卡片组合（户主的 user_id），定时任务逐个为他们执行；分片部署时只含本进程的分片"""
+    return [user_id for user_id in db.get_user_ids() if _is_active_portfolio(user_id) and sharding.owns(user_id)]
+
+async def auth_guard(update: Update, context: ContextTypes.DEFAULT_TYPE, role: str = households.VIEWER) -> bool:
+    """
+    检查用户是否可以使用（在允许列表中，或是允许列表中户主的家庭成员），
+    以及在家庭中的角色是否足以执行 role 级别的操作；不满足则礼貌拒绝
+    """
     user_id = update.effective_user.id
-    if user_id != ADMIN_USER_ID:
-        if update.message:
-            await update.message.reply_text("抱歉，这是一个私人机器人。")
-        elif update.callback_query:
-            await update.callback_query.answer("抱歉，这是一个私人机器人。", show_alert=True)
-        return False
-    return True
+    membership = households.resolve(user_id)
+    if membership.portfolio_id not in ALLOWED_USER_IDS:
+        text = f"抱歉，这是一个私人机器人。\n如需加入家庭共享，请把你的用户 ID {user_id} 发给户主。"
+    elif not membership.allows(role):
+        text = f"您在这个家庭中是{households.ROLE_NAMES[membership.role]}，没有权限执行此操作。"
+    else:
+        return True
+    if update.message:
+        await update.message.reply_text(text)
+    elif update.callback_query:
+        await update.callback_query.answer(text, show_alert=True)
+    elif update.inline_query:
+        await update.inline_query.answer([], cache_time=0, is_personal=True)
+    return False
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await auth_guard(update, context): return
@@ -138,10 +304,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/delcard - 删除卡片\n\n"
         "📊 <b>查看信息</b>\n"
         "/cards - 卡片组合概览\n"
+        "/find - 按别名、银行或后四位查找卡片\n"
         "/ask - 智能消费建议\n"
-        "/calendar - 还款日历视图\n\n"
+        "/calendar - 还款日历视图\n"
+        "/spend - 记一笔消费\n"
+        "/repay - 记录还款\n"
+        "/rewards - 返现规则\n"
+        "/installments - 分期计划\n"
+        "/simulate - 多年用卡策略模拟\n"
+        "/optimize - 账单日调整建议\n"
+        "/coverage - 全年免息期覆盖图\n"
+        "/forecast - 还款现金流预测\n"
+        "/briefing - 今日简报\n"
+        "/household - 家庭共享\n"
+        "@机器人 300 - 在任意聊天中查看最佳用卡\n\n"
         "⚙️ <b>其他功能</b>\n"
         "/checkfees - 手动年费检查\n"
+        "/backup - 下载数据库快照\n"
         "/cancel - 取消当前操作"
     )
     
@@ -173,7 +352,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 # --- /addcard 流程 ---
 async def add_card_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if not await auth_guard(update, context): return ConversationHandler.END
+    if not await auth_guard(update, context, households.EDITOR): return ConversationHandler.END
     
     # 显示当前已有卡片数量
     existing_cards = db.get_all_cards()
@@ -418,6 +597,7 @@ async def finalize_add_card(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     chat_id = update.effective_chat.id
     if db.add_card(card_data):
+        _rearm_card_reminders(context, card_data['nickname'])
         # Apple-style: Simple success with immediate value
         card_name = AppleStyleUX.format_card_name_simple(card_data)
         days, due_date = core_logic.get_interest_free_period(card_data)
@@ -451,16 +631,79 @@ async def finalize_add_card(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ConversationHandler.END
 
 
+# --- 卡片选择器（/editcard、/delcard）：按别名 keyset 分页，每次只读取和渲染一页 ---
+CARD_PICKER_KEY = 'card_picker'   # 当前页的首尾别名与筛选词，翻页时据此读取相邻的一页
+_CARD_PICKERS = {
+    # 类型: (标题, 按钮文字, 选中卡片的回调前缀, 没有卡片时的提示, 所在的会话状态)
+    'edit': ("请选择您要编辑的卡片：", "{name}", "edit_card_", "您还没有卡片可以编辑。", EDIT_CHOOSE_CARD),
+    'del': ("请选择您要删除的卡片：", "删除【{name}】", "del_confirm_", "您没有任何卡片可以删除。", DEL_CARD_CHOOSE),
+}
+
+def _card_picker_page(limit: int, query: Optional[str], after: str = None, before: str = None) -> db.CardPage:
+    """有筛选词时从检索索引分页（别名片段、银行名或后四位），否则直接按别名分页读库"""
+    if query:
+        return card_search.search_page(query, limit, after=after, before=before)
+    return db.get_cards_page(limit, after=after, before=before)
+
+def _render_card_picker(context: ContextTypes.DEFAULT_TYPE, kind: str, page: db.CardPage, query: Optional[str]):
+    title, label, callback_prefix = _CARD_PICKERS[kind][:3]
+    keyboard = [
+        [InlineKeyboardButton(label.format(name=format_card_name(c)), callback_data=f"{callback_prefix}{c['nickname']}")]
+        for c in page.cards
+    ]
+    nav = []
+    if page.has_prev:
+        nav.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"{kind}_page_prev"))
+    if page.has_next:
+        nav.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"{kind}_page_next"))
+    if nav:
+        keyboard.append(nav)
+    context.user_data[CARD_PICKER_KEY] = {
+        'kind': kind, 'query': query, 'first': page.cards[0]['nickname'], 'last': page.cards[-1]['nickname'],
+    }
+    text = f"{title}（匹配“{html.escape(query)}”）" if query else title
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def _start_card_picker(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str) -> int:
+    """发送选择器的第一页；命令后的文字用来筛选，如 /editcard 招行、/editcard 1234"""
+    query = " ".join(context.args or []) or None
+    page = _card_picker_page(config.ui.max_cards_display, query)
+    if not page.cards:
+        await update.message.reply_text(f"没有匹配“{html.escape(query)}”的卡片。" if query else _CARD_PICKERS[kind][3])
+        return ConversationHandler.END
+    text, markup = _render_card_picker(context, kind, page, query)
+    await update.message.reply_text(text, reply_markup=markup)
+    return _CARD_PICKERS[kind][4]
+
+async def card_picker_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """处理选择器的上一页 / 下一页"""
+    query = update.callback_query
+    await query.answer()
+    kind, _, direction = query.data.split('_')
+    limit = config.ui.max_cards_display
+    state = context.user_data.get(CARD_PICKER_KEY)
+    if not state or state['kind'] != kind:
+        # 翻页位置已丢失（如在另一个选择器之后点了旧消息），从第一页开始
+        search_text, page = None, _card_picker_page(limit, None)
+    elif direction == 'next':
+        search_text, page = state['query'], _card_picker_page(limit, state['query'], after=state['last'])
+    else:
+        search_text, page = state['query'], _card_picker_page(limit, state['query'], before=state['first'])
+    if not page.cards:
+        # 相邻一页的卡片已被删除，回到第一页
+        page = _card_picker_page(limit, search_text)
+    if not page.cards:
+        context.user_data.pop(CARD_PICKER_KEY, None)
+        await query.edit_message_text(text=_CARD_PICKERS[kind][3])
+        return ConversationHandler.END
+    text, markup = _render_card_picker(context, kind, page, search_text)
+    await query.edit_message_text(text=text, reply_markup=markup)
+    return _CARD_PICKERS[kind][4]
+
 # --- /editcard 流程 ---
 async def edit_card_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if not await auth_guard(update, context): return ConversationHandler.END
-    cards = db.get_all_cards()
-    if not cards:
-        await update.message.reply_text("您还没有卡片可以编辑。")
-        return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(format_card_name(c), callback_data=f"edit_card_{c['nickname']}")] for c in cards]
-    await update.message.reply_text("请选择您要编辑的卡片：", reply_markup=InlineKeyboardMarkup(keyboard))
-    return EDIT_CHOOSE_CARD
+    if not await auth_guard(update, context, households.EDITOR): return ConversationHandler.END
+    return await _start_card_picker(update, context, 'edit')
 
 async def edit_show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -512,6 +755,7 @@ async def edit_choose_card(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     query = update.callback_query
     await query.answer()
     nickname = query.data.split("edit_card_")[1]
+    context.user_data.pop(CARD_PICKER_KEY, None)
     context.user_data['edit_nickname'] = nickname
     await edit_show_main_menu(update, context) 
     return EDIT_MAIN_MENU
@@ -554,6 +798,15 @@ async def edit_main_menu_router(update: Update, context: ContextTypes.DEFAULT_TY
         await query.edit_message_text(text="请选择新的<b>币种支持</b>：", reply_markup=InlineKeyboardMarkup(keyboard))
         return EDIT_CURRENCY_TYPE
         
+    if field_to_edit == 'due_date_adjustment':
+        keyboard = [[InlineKeyboardButton(name, callback_data=f"edit_adj_{policy}")]
+                    for policy, name in business_days.POLICIES.items()]
+        await query.edit_message_text(
+            text="还款日遇法定节假日或周末时，银行如何处理？",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return EDIT_DUE_ADJUSTMENT
+
     if field_to_edit == 'annual_fee':
         await query.edit_message_text(text="请输入新的<b>年费金额</b>（无则输入0）：")
         return EDIT_FEE_AMOUNT
@@ -576,6 +829,12 @@ async def edit_get_simple_value(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("输入不能为空，请重新输入。")
         return EDIT_GET_VALUE
     
+    if field == 'credit_limit':
+        if not new_value.isdigit():
+            await update.message.reply_text("请输入整数金额（元），无额度限制请输入0。")
+            return EDIT_GET_VALUE
+        new_value = int(new_value)
+    
     # 检查别名唯一性
     if field == 'nickname' and new_value != nickname:
         if db.get_card_by_nickname(new_value):
@@ -585,6 +844,7 @@ async def edit_get_simple_value(update: Update, context: ContextTypes.DEFAULT_TY
     if db.update_card(nickname, {field: new_value}):
         if field == 'nickname':
             context.user_data['edit_nickname'] = new_value
+        _rearm_card_reminders(context, context.user_data['edit_nickname'])
         field_name_cn = EDITABLE_FIELDS.get(field, field)
         await update.message.reply_text(f"✅ {field_name_cn}更新成功！")
     else:
@@ -599,6 +859,7 @@ async def edit_get_statement_inclusive(update: Update, context: ContextTypes.DEF
     new_value = (query.data == 'edit_inclusive_true')
     
     if db.update_card(nickname, {'statement_day_inclusive': new_value}):
+        _rearm_card_reminders(context, nickname)
         await query.message.reply_text(f"✅ “账单日规则”更新成功！")
     else:
         await query.message.reply_text("❌ 更新失败。")
@@ -619,6 +880,20 @@ async def edit_get_currency_type(update: Update, context: ContextTypes.DEFAULT_T
     await edit_show_main_menu(update, context)
     return EDIT_MAIN_MENU
 
+async def edit_get_due_adjustment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    nickname = context.user_data['edit_nickname']
+    new_value = query.data.split("edit_adj_")[1]
+
+    if new_value in business_days.POLICIES and db.update_card(nickname, {'due_date_adjustment': new_value}):
+        _rearm_card_reminders(context, nickname)
+        await query.message.reply_text(f"✅ “节假日还款”更新为：{business_days.POLICIES[new_value]}")
+    else:
+        await query.message.reply_text("❌ 更新失败。")
+    await edit_show_main_menu(update, context)
+    return EDIT_MAIN_MENU
+
 async def edit_get_due_date_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -634,6 +909,7 @@ async def edit_get_due_date_value(update: Update, context: ContextTypes.DEFAULT_
         due_type = context.user_data['edit_due_type']
         updates = {'due_date_type': due_type, 'due_date_value': new_value}
         if db.update_card(nickname, updates):
+            _rearm_card_reminders(context, nickname)
             await update.message.reply_text("✅ 还款规则更新成功！")
         else:
             await update.message.reply_text("❌ 更新失败，请检查输入格式或稍后重试。")
@@ -755,7 +1031,7 @@ async def list_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Apple-style: Show summary first, then details
     summary = AppleStyleUX.generate_notification_summary(cards)
-    best_card = AppleStyleUX.get_best_card_for_today(cards)
+    best_card = AppleStyleUX.get_best_card_for_today(cards, db.get_card_balances())
     
     message = f"💳 <b>卡片组合</b> ({len(cards)}张)\n"
     if summary != "All set":
@@ -802,6 +1078,26 @@ async def list_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message += f"\n/ask 获取智能建议"
     await update.message.reply_text(message, parse_mode=ParseMode.HTML)
 
+async def find_card_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/find 招行、/find 小红、/find 1234：按别名片段、银行名或卡号后四位查找卡片"""
+    if not await auth_guard(update, context): return
+    text = " ".join(context.args or [])
+    if not text:
+        await update.message.reply_text("用法：/find 关键词\n可以是别名的一部分、银行名（招行 / 招商银行）或卡号后四位。")
+        return
+    matches = card_search.search(text)
+    if not matches:
+        await update.message.reply_text(f"没有匹配“{html.escape(text)}”的卡片。")
+        return
+    shown = matches[:config.ui.max_cards_display]
+    # 消息按 HTML 解析，用户输入的关键词和别名需要转义
+    lines = [f"🔎 <b>匹配“{html.escape(text)}”的卡片</b>（{len(matches)}张）", ""]
+    lines += [f"• {html.escape(format_card_name(card))} · 账单日 {card['statement_day']}号" for card in shown]
+    if len(matches) > len(shown):
+        lines.append(f"……另有 {len(matches) - len(shown)} 张，请输入更具体的关键词")
+    lines.append(f"\n/editcard {html.escape(text)} 编辑这些卡片")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
 async def get_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Apple原则：简化复杂逻辑，专注核心功能"""
     if not await auth_guard(update, context): 
@@ -823,67 +1119,101 @@ async def get_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE)
     today_str = today.strftime('%Y年%m月%d日')
     weekday = ['周一', '周二', '周三', '周四', '周五', '周六', '周日'][today.weekday()]
     
-    # 计算所有卡片的免息期
-    recommendations = []
-    for card in cards:
-        days, due_date = core_logic.get_interest_free_period(card)
-        recommendations.append({'card': card, 'days': days, 'due_date': due_date})
-    
-    recommendations.sort(key=lambda x: x['days'], reverse=True)
+    # /ask [商户] [金额] [币种] [类别]：按可用额度过滤、按额度使用率扣分，并计入预期返现
+    query = _parse_ask_query(context.args or [])
+    if query is None:
+        await update.message.reply_text(
+            "用法：/ask [商户] [金额] [币种] [类别]\n"
+            "例如：/ask 星巴克 38、/ask amazon 120 USD、/ask 3000 餐饮\n"
+            f"类别：{'、'.join(rewards.CATEGORIES.values())}"
+        )
+        return
+    amount_cents = merchants.to_local_cents(query.amount_cents, query.currency) if query.amount_cents else 0
+    category, scope = query.category, query.scope
+
+    # 免息期来自当天的评分表（凌晨预生成）；余额来自内存索引，返现规则已按类别编译
+    recommendations, insufficient = daily_ranking.rank(daily_ranking.get_ranking(today.date()), amount_cents, category)
 
     # 分别获取本币和外币卡片推荐
     local_cards = [r for r in recommendations if r['card']['currency_type'] in ['local', 'all']][:3]
     foreign_cards = [r for r in recommendations if r['card']['currency_type'] in ['foreign', 'all']][:3]
 
     message = f"🎯 <b>智能消费建议</b>\n📅 {today_str} {weekday}\n"
+    if query.merchant:
+        match_hint = "" if query.merchant.exact else "（模糊匹配）"
+        message += f"🏪 {query.merchant.merchant.name}{match_hint}\n"
+    if amount_cents:
+        if query.currency and query.currency != merchants.LOCAL_CURRENCY:
+            message += f"💵 消费金额 {query.currency} {query.amount_cents / 100:,.2f}（约 {_format_money(amount_cents)}）"
+        else:
+            message += f"💵 消费金额 {_format_money(amount_cents)}"
+        message += f" • 🏷️ {rewards.category_name(category)}\n" if category else "\n"
+    elif category:
+        message += f"🏷️ {rewards.category_name(category)}\n"
     message += "="*30 + "\n\n"
     
-    # 人民币消费建议
-    message += "💰 <b>人民币消费推荐</b>\n"
-    if local_cards:
-        for i, rec in enumerate(local_cards):
-            rank_emoji = ["🥇", "🥈", "🥉"][i]
-            card_name_str = format_card_name(rec['card'])
-            due_date_str = rec['due_date'].strftime('%m月%d日')
+    if scope != 'foreign':
+        # 人民币消费建议
+        message += "💰 <b>人民币消费推荐</b>\n"
+        if local_cards:
+            for i, rec in enumerate(local_cards):
+                rank_emoji = ["🥇", "🥈", "🥉"][i]
+                card_name_str = format_card_name(rec['card'])
+                due_date_str = rec['due_date'].strftime('%m月%d日')
             
-            # 根据免息期长短给出不同的建议
-            if rec['days'] >= 40:
-                advice = "💎 超长免息期，大额消费首选"
-            elif rec['days'] >= 25:
-                advice = "✨ 免息期较长，适合中大额消费"
-            elif rec['days'] >= 15:
-                advice = "👍 免息期适中，日常消费推荐"
-            else:
-                advice = "⚠️ 免息期较短，建议小额消费"
+                # 根据免息期长短给出不同的建议
+                if rec['days'] >= 40:
+                    advice = "💎 超长免息期，大额消费首选"
+                elif rec['days'] >= 25:
+                    advice = "✨ 免息期较长，适合中大额消费"
+                elif rec['days'] >= 15:
+                    advice = "👍 免息期适中，日常消费推荐"
+                else:
+                    advice = "⚠️ 免息期较短，建议小额消费"
             
-            message += f"{rank_emoji} <b>{card_name_str}</b>\n"
-            message += f"    ⏰ 免息期: <b>{rec['days']}天</b> (至{due_date_str})\n"
-            message += f"    💡 {advice}\n\n"
-    else:
-        message += "❌ 暂无支持人民币的卡片\n\n"
-
-    # 外币消费建议
-    message += "🌍 <b>外币消费推荐</b>\n"
-    if foreign_cards:
-        for i, rec in enumerate(foreign_cards):
-            rank_emoji = ["🥇", "🥈", "🥉"][i]
-            card_name_str = format_card_name(rec['card'])
-            due_date_str = rec['due_date'].strftime('%m月%d日')
+                message += f"{rank_emoji} <b>{card_name_str}</b>\n"
+                message += f"    ⏰ 免息期: <b>{rec['days']}天</b> (至{due_date_str})\n"
+                if rec['available'] is not None:
+                    message += f"    💳 可用额度: {_format_money(rec['available'])}\n"
+                if rec['reward'].reward_cents:
+                    message += f"    🎁 预计返现: <b>{_format_money(rec['reward'].reward_cents)}</b>（{rec['reward'].rule.describe()}）\n"
+                message += f"    💡 {advice}\n\n"
+        else:
+            message += "❌ 暂无支持人民币的卡片\n\n"
+
+    if scope != 'local':
+        # 外币消费建议
+        message += "🌍 <b>外币消费推荐</b>\n"
+        if foreign_cards:
+            for i, rec in enumerate(foreign_cards):
+                rank_emoji = ["🥇", "🥈", "🥉"][i]
+                card_name_str = format_card_name(rec['card'])
+                due_date_str = rec['due_date'].strftime('%m月%d日')
             
-            if rec['days'] >= 40:
-                advice = "🌟 海外消费/网购首选"
-            elif rec['days'] >= 25:
-                advice = "✈️ 出境旅游推荐"
-            elif rec['days'] >= 15:
-                advice = "🛒 外币小额消费适用"
-            else:
-                advice = "⚠️ 免息期较短，谨慎使用"
+                if rec['days'] >= 40:
+                    advice = "🌟 海外消费/网购首选"
+                elif rec['days'] >= 25:
+                    advice = "✈️ 出境旅游推荐"
+                elif rec['days'] >= 15:
+                    advice = "🛒 外币小额消费适用"
+                else:
+                    advice = "⚠️ 免息期较短，谨慎使用"
             
-            message += f"{rank_emoji} <b>{card_name_str}</b>\n"
-            message += f"    ⏰ 免息期: <b>{rec['days']}天</b> (至{due_date_str})\n"
-            message += f"    💡 {advice}\n\n"
-    else:
-        message += "❌ 暂无支持外币的卡片\n\n"
+                message += f"{rank_emoji} <b>{card_name_str}</b>\n"
+                message += f"    ⏰ 免息期: <b>{rec['days']}天</b> (至{due_date_str})\n"
+                if rec['available'] is not None:
+                    message += f"    💳 可用额度: {_format_money(rec['available'])}\n"
+                if rec['reward'].reward_cents:
+                    message += f"    🎁 预计返现: <b>{_format_money(rec['reward'].reward_cents)}</b>（{rec['reward'].rule.describe()}）\n"
+                message += f"    💡 {advice}\n\n"
+        else:
+            message += "❌ 暂无支持外币的卡片\n\n"
+
+    if insufficient:
+        message += "⛔ <b>额度不足</b>\n"
+        for card, available in insufficient:
+            message += f"• {format_card_name(card)} 可用 {_format_money(max(available, 0))}\n"
+        message += "\n"
 
     # 添加智能提醒
     message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
@@ -907,28 +1237,441 @@ async def get_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         message += "✅ 近期无账单日，消费无忧\n"
 
+    bill_forecast = _format_bill_forecast(cards, today.date())
+    if bill_forecast:
+        message += "\n" + bill_forecast
+
     await update.message.reply_text(message, parse_mode=ParseMode.HTML)
 
-async def del_card_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if not await auth_guard(update, context): return ConversationHandler.END
+# --- 内联模式：在任意聊天输入 @机器人 300 ---
+INLINE_CACHE_KEY = 'inline_answers'   # user_id -> (评分表版本, {查询: 结果})
+INLINE_CACHE_QUERIES = 64             # 每位用户缓存的查询数，超过后清空重来
+INLINE_CACHE_TIME = int(INLINE_CONFIG.get('cache_time', 30))   # Telegram 端缓存秒数
+
+def _inline_article(scope: str, index: int, rec: dict, amount_text: str, merchant_name: Optional[str]):
+    card_name = format_card_name(rec['card'])
+    due_date_str = rec['due_date'].strftime('%m月%d日')
+    details = [f"免息 {rec['days']} 天（至{due_date_str}）"]
+    if rec['available'] is not None:
+        details.append(f"可用 {_format_money(rec['available'])}")
+    if rec['reward'].reward_cents:
+        details.append(f"返现 {_format_money(rec['reward'].reward_cents)}")
+
+    subject = merchant_name or ("外币消费" if scope == 'foreign' else "人民币消费")
+    text = f"💳 {subject}{f' {amount_text}' if amount_text else ''}，建议刷 <b>{card_name}</b>\n"
+    text += f"⏰ 免息期 <b>{rec['days']}天</b>（至{due_date_str}）"
+    if rec['reward'].reward_cents:
+        text += f"\n🎁 预计返现 {_format_money(rec['reward'].reward_cents)}（{rec['reward'].rule.describe()}）"
+    return InlineQueryResultArticle(
+        id=f"{scope}-{rec['card']['id']}",
+        title=f"{'🌍' if scope == 'foreign' else '💰'} {['🥇', '🥈', '🥉'][index]} {card_name}",
+        description=" · ".join(details),
+        input_message_content=InputTextMessageContent(text, parse_mode=ParseMode.HTML),
+    )
+
+def _build_inline_results(query: AskQuery, ranking: daily_ranking.DailyRanking) -> list:
+    """与 /ask 相同的排序，本币、外币各取前三"""
+    amount_cents = merchants.to_local_cents(query.amount_cents, query.currency) if query.amount_cents else 0
+    recommendations, _ = daily_ranking.rank(ranking, amount_cents, query.category)
+    merchant_name = query.merchant.merchant.name if query.merchant else None
+    if query.currency and query.currency != merchants.LOCAL_CURRENCY:
+        amount_text = f"{query.currency} {query.amount_cents / 100:,.2f}"
+    else:
+        amount_text = _format_money(amount_cents) if amount_cents else ""
+    results = []
+    for scope, allowed in (('local', ('local', 'all')), ('foreign', ('foreign', 'all'))):
+        if query.scope and query.scope != scope:
+            continue
+        scoped = [rec for rec in recommendations if rec['card']['currency_type'] in allowed][:3]
+        results.extend(_inline_article(scope, i, rec, amount_text, merchant_name) for i, rec in enumerate(scoped))
+    return results
+
+async def inline_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    处理内联查询 @机器人 [商户] [金额] [币种] [类别]：直接使用当天的评分表，
+    同一用户的相同查询在评分表版本不变时只是一次字典查找。
+    """
+    if not await auth_guard(update, context): return
+    inline_query = update.inline_query
+    query = _parse_ask_query(inline_query.query.split())
+    if query is None:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True,
+                                  button=InlineQueryResultsButton("没有识别出金额或商户，点此打开机器人", start_parameter="ask"))
+        return
+
+    ranking = daily_ranking.get_ranking()
+    cache = context.bot_data.setdefault(INLINE_CACHE_KEY, {})
+    user_id = db.current_user()
+    cached = cache.get(user_id)
+    if cached is None or cached[0] != ranking.key:
+        cached = cache[user_id] = (ranking.key, {})
+    answers = cached[1]
+    query_key = (query.amount_cents, query.currency, query.category, query.scope,
+                 query.merchant.merchant.name if query.merchant else None)
+    results = answers.get(query_key)
+    if results is None:
+        results = _build_inline_results(query, ranking)
+        if len(answers) >= INLINE_CACHE_QUERIES:
+            answers.clear()
+        answers[query_key] = results
+
+    if not results:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True,
+                                  button=InlineQueryResultsButton("还没有可推荐的卡片，点此添加", start_parameter="addcard"))
+        return
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
+
+# --- /spend 记账 ---
+async def spend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /spend <金额> [卡片] [备注]：记录一笔消费并归入对应的账单周期"""
+    if not await auth_guard(update, context, households.EDITOR): return
+
+    args = context.args or []
+    amount_cents = _parse_amount_cents(args[0]) if args else None
+    if amount_cents is None:
+        await update.message.reply_text(
+            "🧾 <b>记一笔消费</b>\n\n"
+            "用法：/spend 金额 [卡片别名] [备注]\n"
+            "例如：/spend 38.5 招行小红卡 午餐\n\n"
+            "💡 <i>不指定卡片时，按今日最优卡记账</i>",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
     cards = db.get_all_cards()
     if not cards:
-        await update.message.reply_text("您没有任何卡片可以删除。")
-        return ConversationHandler.END
-    
-    keyboard = [[InlineKeyboardButton(f"删除【{format_card_name(c)}】", callback_data=f"del_confirm_{c['nickname']}")] for c in cards]
-    await update.message.reply_text("请选择您要删除的卡片：", 
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        await update.message.reply_text("您还没有卡片，请先使用 /addcard 添加。")
+        return
+
+    card = _find_card(cards, args[1]) if len(args) > 1 else None
+    note_parts = args[2:] if card else args[1:]
+    # 备注的第一个词若是消费类别（如“餐饮”），一并记录，用于返现上限统计
+    category = rewards.parse_category(note_parts[0]) if note_parts else None
+    if category == rewards.ALL_CATEGORIES:
+        category = None
+    auto_selected = card is None
+    if auto_selected:
+        local_cards = [c for c in cards if c['currency_type'] in ['local', 'all']] or cards
+        expected_rewards = None
+        engine = rewards.get_engine()
+        if engine.has_rules():
+            cycle_spend = rewards.cycle_spend_for(local_cards, date.today())
+            expected_rewards = {
+                c['id']: engine.quote(c['id'], category, amount_cents, date.today(), cycle_spend.get(c['id'])).reward_cents
+                for c in local_cards
+            }
+        best = AppleStyleUX.get_best_card_for_today(local_cards, db.get_card_balances(), amount_cents, expected_rewards)
+        if not best:
+            await update.message.reply_text("❌ 所有卡片的可用额度都不足，请指定卡片记账。")
+            return
+        card = best['card']
+    note = " ".join(note_parts)[:config.ui.max_input_length] or None
+
+    today = date.today()
+    statement_date = core_logic.get_statement_date_for_purchase(today, card['statement_day'], card['statement_day_inclusive'])
+    due_date = core_logic.get_due_date_from_statement(statement_date, card['due_date_type'], card['due_date_value'], card.get('due_date_adjustment'))
+    transaction_id = db.add_transaction(card['id'], amount_cents, today, statement_date, note, category)
+    if not transaction_id:
+        await update.message.reply_text("❌ 记账失败，请稍后重试。")
+        return
+
+    cycle = db.get_cycle_totals([(card['id'], statement_date)]).get((card['id'], statement_date), {})
+    message = (
+        f"✅ <b>已记账 {_format_money(amount_cents)}</b>\n"
+        f"💳 {format_card_name(card)}\n"
+        f"🧾 计入 {statement_date.strftime('%m月%d日')} 账单"
+        f"（本期累计 {_format_money(cycle.get('total_cents', amount_cents))}，{cycle.get('txn_count', 1)}笔）\n"
+        f"⏰ {due_date.strftime('%m月%d日')}前还款"
+    )
+    if note:
+        message += f"\n📝 {note}"
+    if auto_selected:
+        message += "\n\n💡 <i>未指定卡片，已按今日最优卡记账</i>"
+    keyboard = [[InlineKeyboardButton("↩️ 撤销", callback_data=f"spend_undo_{transaction_id}")]]
+    await update.message.reply_text(message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+
+async def spend_undo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理记账消息上的“撤销”按钮"""
+    if not await auth_guard(update, context, households.EDITOR): return
+    query = update.callback_query
+    await query.answer()
+    transaction_id = int(query.data.split("spend_undo_")[1])
+    transaction = db.delete_transaction(transaction_id)
+    if transaction:
+        await query.edit_message_text(text=f"↩️ 已撤销 {_format_money(transaction['amount_cents'])} 的消费记录。")
+    else:
+        await query.edit_message_text(text="该记录已不存在或已撤销。")
+
+# --- /repay 还款 ---
+async def repay(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /repay <金额|all> <卡片>：记录还款，恢复可用额度"""
+    if not await auth_guard(update, context, households.EDITOR): return
+
+    args = context.args or []
+    cards = db.get_all_cards()
+    card = _find_card(cards, args[1]) if len(args) > 1 else None
+    if not card:
+        await update.message.reply_text(
+            "💸 <b>记录还款</b>\n\n"
+            "用法：/repay 金额|all 卡片别名\n"
+            "例如：/repay 1200 招行小红卡\n"
+            "      /repay all 招行小红卡（还清全部）",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    balance = db.get_card_balances().get(card['id'], 0)
+    amount_cents = balance if args[0].lower() == 'all' else _parse_amount_cents(args[0])
+    if not amount_cents or amount_cents <= 0:
+        await update.message.reply_text("该卡没有未还余额。" if args[0].lower() == 'all' else "金额无效，请重新输入。")
+        return
+
+    if not db.add_repayment(card['id'], amount_cents, date.today()):
+        await update.message.reply_text("❌ 记录还款失败，请稍后重试。")
+        return
+
+    balances = db.get_card_balances()
+    message = (
+        f"✅ <b>已还款 {_format_money(amount_cents)}</b>\n"
+        f"💳 {format_card_name(card)}\n"
+        f"🧾 未还余额 {_format_money(balances.get(card['id'], 0))}"
+    )
+    available = AppleStyleUX.get_available_credit(card, balances)
+    if available is not None:
+        message += f"\n💰 可用额度 {_format_money(available)}"
+    await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+
+# --- 返现规则 ---
+_REWARD_OPTION_KEYS = {'上限': 'cap', '满': 'min', '从': 'from', '至': 'to'}
+
+def _parse_reward_options(tokens: list):
+    """解析 /setreward 的可选参数（上限=50 满=100 从=2025-01-01 至=2025-12-31），无效返回 None"""
+    options = {}
+    for token in tokens:
+        key, sep, value = token.partition('=')
+        key = _REWARD_OPTION_KEYS.get(key)
+        if not sep or not key:
+            return None
+        if key in ('cap', 'min'):
+            cents = _parse_amount_cents(value)
+            if cents is None:
+                return None
+            options[key] = cents
+        else:
+            try:
+                options[key] = date.fromisoformat(value)
+            except ValueError:
+                return None
+    return options
+
+async def set_reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /setreward <卡片> <类别> <比例%> [上限=元] [满=元] [从=日期] [至=日期]"""
+    if not await auth_guard(update, context, households.EDITOR): return
+
+    args = context.args or []
+    usage = (
+        "🎁 <b>设置返现规则</b>\n\n"
+        "用法：/setreward 卡片别名 类别 比例% [上限=元] [满=元] [从=日期] [至=日期]\n"
+        "例如：/setreward 招行小红卡 餐饮 5% 上限=50\n"
+        "      /setreward 招行小红卡 全部 0.3%\n\n"
+        f"类别：{'、'.join(rewards.CATEGORIES.values())}"
+    )
+    card = _find_card(db.get_all_cards(), args[0]) if args else None
+    category = rewards.parse_category(args[1]) if len(args) > 1 else None
+    options = _parse_reward_options(args[3:]) if len(args) > 2 else None
+    try:
+        rate = Decimal(args[2].rstrip('%')) if len(args) > 2 else None
+    except InvalidOperation:
+        rate = None
+    if not card or not category or options is None or rate is None or not (0 < rate <= 100):
+        await update.message.reply_text(usage, parse_mode=ParseMode.HTML)
+        return
+
+    rate_bp = int((rate * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    rule_id = db.add_reward_rule(card['id'], category, rate_bp, options.get('cap'), options.get('min', 0),
+                                 options.get('from'), options.get('to'))
+    if not rule_id:
+        await update.message.reply_text("❌ 保存返现规则失败，请稍后重试。")
+        return
+    rewards.invalidate()
+    rule = rewards.RewardRule(rule_id, card['id'], category, rate_bp, options.get('cap'), options.get('min', 0),
+                              options.get('from'), options.get('to'))
+    await update.message.reply_text(
+        f"✅ 已为 {format_card_name(card)} 添加返现规则 #{rule_id}\n🎁 {rule.describe()}"
+    )
+
+async def list_rewards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /rewards [卡片]：列出返现规则"""
+    if not await auth_guard(update, context): return
+
+    cards = db.get_all_cards()
+    if context.args:
+        card = _find_card(cards, context.args[0])
+        if not card:
+            await update.message.reply_text("未找到该卡片。")
+            return
+        cards = [card]
+    rules_by_card = {}
+    for row in db.get_reward_rules():
+        rules_by_card.setdefault(row['card_id'], []).append(rewards.RewardRule.from_row(row))
+
+    lines = []
+    for card in cards:
+        if card['id'] in rules_by_card:
+            lines.append(f"💳 <b>{format_card_name(card)}</b>")
+            lines.extend(f"  #{rule.id} {rule.describe()}" for rule in rules_by_card[card['id']])
+    if not lines:
+        await update.message.reply_text("暂无返现规则，使用 /setreward 添加。")
+        return
+    await update.message.reply_text(
+        "🎁 <b>返现规则</b>\n\n" + "\n".join(lines) + "\n\n/delreward 编号 删除规则",
+        parse_mode=ParseMode.HTML
+    )
+
+async def delete_reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /delreward <编号>"""
+    if not await auth_guard(update, context, households.EDITOR): return
+
+    args = context.args or []
+    rule_id = args[0].lstrip('#') if args else ''
+    if not rule_id.isdigit():
+        await update.message.reply_text("用法：/delreward 规则编号（可在 /rewards 中查看）")
+        return
+    if db.delete_reward_rule(int(rule_id)):
+        rewards.invalidate()
+        await update.message.reply_text(f"🗑️ 已删除返现规则 #{rule_id}")
+    else:
+        await update.message.reply_text("该规则不存在。")
+
+# --- 分期 ---
+_INSTALLMENT_PERIODS = re.compile(r'^(\d+)期?$')
+_INSTALLMENT_FIRST = re.compile(r'^首期=(\d{4})-(\d{1,2})$')
+
+async def add_installment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /installment <卡片> <金额> <期数> [费率%] [首期=YYYY-MM] [备注]"""
+    if not await auth_guard(update, context, households.EDITOR): return
+
+    args = context.args or []
+    usage = (
+        "💳 <b>添加分期</b>\n\n"
+        "用法：/installment 卡片别名 金额 期数 [每期费率%] [首期=年-月] [备注]\n"
+        "例如：/installment 招行小红卡 12000 12 0.6% 手机\n"
+        "      /installment 招行小红卡 6000 6期 首期=2026-12\n\n"
+        f"💡 <i>期数 1-{installments.MAX_PERIODS}；不指定首期时从本期账单开始</i>"
+    )
+    card = _find_card(db.get_all_cards(), args[0]) if args else None
+    principal_cents = _parse_amount_cents(args[1]) if len(args) > 1 else None
+    periods_match = _INSTALLMENT_PERIODS.match(args[2]) if len(args) > 2 else None
+    if not card or not principal_cents or not periods_match or not 1 <= int(periods_match.group(1)) <= installments.MAX_PERIODS:
+        await update.message.reply_text(usage, parse_mode=ParseMode.HTML)
+        return
+    periods = int(periods_match.group(1))
+
+    today = date.today()
+    fee_rate_bp = 0
+    first_statement = core_logic.get_statement_date_for_purchase(today, card['statement_day'], card['statement_day_inclusive'])
+    note_parts = []
+    for token in args[3:]:
+        first_match = _INSTALLMENT_FIRST.match(token)
+        if token.endswith('%'):
+            try:
+                rate = Decimal(token.rstrip('%'))
+            except InvalidOperation:
+                rate = None
+            if rate is None or not 0 <= rate < 10:
+                await update.message.reply_text(usage, parse_mode=ParseMode.HTML)
+                return
+            fee_rate_bp = int((rate * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        elif first_match and 1 <= int(first_match.group(2)) <= 12:
+            first_statement = installments.statement_in_month(card, int(first_match.group(1)), int(first_match.group(2)))
+        else:
+            note_parts.append(token)
+    note = " ".join(note_parts)[:config.ui.max_input_length] or None
+
+    schedule = installments.build_schedule(card, principal_cents, periods, fee_rate_bp, first_statement)
+    plan_id = db.add_installment_plan(card['id'], principal_cents, periods, fee_rate_bp, first_statement, schedule, note)
+    if not plan_id:
+        await update.message.reply_text("❌ 保存分期计划失败，请稍后重试。")
+        return
+
+    first, last = schedule[0], schedule[-1]
+    first_due = core_logic.get_due_date_from_statement(first.statement_date, card['due_date_type'], card['due_date_value'], card.get('due_date_adjustment'))
+    per_period = _format_money(first.total_cents)
+    if first.principal_cents != last.principal_cents:
+        per_period += f"（之后每期 {_format_money(last.total_cents)}）"
+    await update.message.reply_text(
+        f"✅ 已添加分期 #{plan_id}\n\n"
+        f"💳 {format_card_name(card)}{f' · {note}' if note else ''}\n"
+        f"💰 本金 {_format_money(principal_cents)} × {periods} 期"
+        + (f"，每期手续费 {fee_rate_bp / 100:g}%（共 {_format_money(first.fee_cents * periods)}）" if fee_rate_bp else "，免手续费") + "\n"
+        f"📅 每期应还 {per_period}\n"
+        f"🧾 {first.statement_date.strftime('%Y-%m-%d')} ~ {last.statement_date.strftime('%Y-%m-%d')} 出账，"
+        f"首期 {first_due.strftime('%m月%d日')}前还款",
+        parse_mode=ParseMode.HTML
     )
-    return DEL_CARD_CHOOSE
+
+async def list_installments(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /installments [卡片]：列出分期计划与剩余期数"""
+    if not await auth_guard(update, context): return
+
+    cards = db.get_all_cards()
+    card_id = None
+    if context.args:
+        card = _find_card(cards, context.args[0])
+        if not card:
+            await update.message.reply_text("未找到该卡片。")
+            return
+        card_id = card['id']
+    cards_by_id = {card['id']: card for card in cards}
+    plans = [plan for plan in db.get_installment_plans(date.today(), card_id) if plan['card_id'] in cards_by_id]
+    if not plans:
+        await update.message.reply_text("暂无分期计划，使用 /installment 添加。")
+        return
+
+    lines, remaining_total, current_card = [], 0, None
+    for plan in plans:
+        if plan['card_id'] != current_card:
+            current_card = plan['card_id']
+            lines.append(f"💳 <b>{format_card_name(cards_by_id[current_card])}</b>")
+        status = (f"剩余 {plan['remaining_periods']} 期 {_format_money(plan['remaining_cents'])}"
+                  if plan['remaining_periods'] else "已全部出账")
+        fee = f"，费率 {plan['fee_rate_bp'] / 100:g}%" if plan['fee_rate_bp'] else ""
+        note = f" · {plan['note']}" if plan['note'] else ""
+        lines.append(f"  #{plan['id']} {_format_money(plan['principal_cents'])} × {plan['periods']} 期{fee}{note}，{status}")
+        remaining_total += plan['remaining_cents']
+    await update.message.reply_text(
+        "🗓️ <b>分期计划</b>\n\n" + "\n".join(lines)
+        + f"\n\n待出账合计 <b>{_format_money(remaining_total)}</b>\n/delinstallment 编号 删除分期",
+        parse_mode=ParseMode.HTML
+    )
+
+async def delete_installment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /delinstallment <编号>"""
+    if not await auth_guard(update, context, households.EDITOR): return
+
+    args = context.args or []
+    plan_id = args[0].lstrip('#') if args else ''
+    if not plan_id.isdigit():
+        await update.message.reply_text("用法：/delinstallment 分期编号（可在 /installments 中查看）")
+        return
+    if db.delete_installment_plan(int(plan_id)):
+        await update.message.reply_text(f"🗑️ 已删除分期 #{plan_id}")
+    else:
+        await update.message.reply_text("该分期不存在。")
+
+async def del_card_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if not await auth_guard(update, context, households.EDITOR): return ConversationHandler.END
+    return await _start_card_picker(update, context, 'del')
 
 async def del_card_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     nickname = query.data.split("del_confirm_")[1]
+    context.user_data.pop(CARD_PICKER_KEY, None)
     card = db.get_card_by_nickname(nickname)
     
     if card and db.delete_card(nickname):
+        _disarm_card_reminders(context, card['id'])
         card_name_str = format_card_name(card)
         await query.edit_message_text(text=f"卡片【{card_name_str}】已成功删除。")
     else:
@@ -1059,10 +1802,10 @@ async def calendar_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- 自动化任务函数 ---
 
 # Removed duplicate function - keeping only the one at the end of file
-async def _perform_fee_check(bot, chat_id: int):
-    """封装了年费检查的核心逻辑，可被任何方式调用"""
+async def _perform_fee_check(bot, chat_ids: list):
+    """封装了年费检查的核心逻辑，可被任何方式调用；每条提醒只生成一次，发给 chat_ids 中的每个聊天"""
     today = date.today()
-    logging.info(f"为 Chat ID {chat_id} 执行年费检查...")
+    logging.info(f"为 Chat ID {chat_ids} 执行年费检查...")
     
     cards_with_fee = [card for card in db.get_all_cards() if card.get('annual_fee_date')]
     reminders_sent = 0
@@ -1114,35 +1857,648 @@ async def _perform_fee_check(bot, chat_id: int):
             keyboard = [[
                 InlineKeyboardButton("✅ 已完成豁免，标记为已处理", callback_data=f"waiver_confirm_{card['nickname']}")
             ]]
-            await bot.send_message(
-                chat_id=chat_id,
-                text=message,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.HTML
-            )
+            await _send_to_all(bot, chat_ids, message, reply_markup=InlineKeyboardMarkup(keyboard))
             reminders_sent += 1
     
     return reminders_sent
 
+async def _send_to_all(bot, chat_ids: list, text: str, **kwargs):
+    """把同一条已生成的消息发给多个聊天（家庭成员），单个聊天失败不影响其他人"""
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML, **kwargs)
+        except Exception as e:
+            logging.error(f"向 {chat_id} 发送消息失败: {e}")
+
 # --- 自动化与手动触发函数 ---
 async def daily_check_job(context: ContextTypes.DEFAULT_TYPE):
-    """由 JobQueue 每日自动调用的函数"""
-    job = context.job
-    await _perform_fee_check(context.bot, job.chat_id)
+    """由 JobQueue 每日自动调用的函数：逐个用户检查年费，提醒发到各自的私聊"""
+    for user_id in tenant_user_ids():
+        with db.user_scope(user_id):
+            try:
+                await _perform_fee_check(context.bot, households.recipients(user_id))
+            except Exception as e:
+                logging.error(f"用户 {user_id} 的年费检查失败: {e}")
 
 async def force_check_fees(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """【新增】处理 /checkfees 命令，手动触发年费检查"""
-    if not await auth_guard(update, context): return
+    if not await auth_guard(update, context, households.EDITOR): return
     
     await update.message.reply_text("正在手动触发年费检查...")
     
-    reminders_sent = await _perform_fee_check(context.bot, update.effective_chat.id)
+    reminders_sent = await _perform_fee_check(context.bot, [update.effective_chat.id])
     
     if reminders_sent > 0:
         await update.message.reply_text(f"检查完成，共发送了 {reminders_sent} 条提醒。")
     else:
         await update.message.reply_text("检查完成，当前没有需要提醒的年费项目。")
 
+# --- 数据库备份 ---
+async def backup_job(context: ContextTypes.DEFAULT_TYPE):
+    """由 JobQueue 定期调用，生成数据库快照并轮换旧快照"""
+    try:
+        await backup.create_snapshot(**backup.options_from_config(BACKUP_CONFIG))
+    except Exception as e:
+        logging.error(f"定时备份失败: {e}")
+
+async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /backup 命令：生成一份时间点快照并以文件形式发送（快照含所有用户的数据，仅限管理员）"""
+    if not await auth_guard(update, context): return
+    if update.effective_user.id != ADMIN_USER_ID:
+        await update.message.reply_text("数据库快照包含所有用户的数据，只有管理员可以下载。")
+        return
+
+    await update.message.reply_text("💾 正在生成数据库快照...")
+    options = backup.options_from_config(BACKUP_CONFIG)
+    try:
+        snapshot_path = await backup.create_snapshot(**options)
+    except Exception as e:
+        logging.error(f"手动备份失败: {e}")
+        snapshot_path = backup.latest_snapshot(options.get('backup_dir'))
+        if not snapshot_path:
+            await update.message.reply_text("❌ 备份失败，且没有可用的历史快照。")
+            return
+        await update.message.reply_text("⚠️ 生成新快照失败，将发送最近一份历史快照。")
+
+    await update.message.reply_document(
+        document=snapshot_path,
+        filename=snapshot_path.name,
+        caption=f"💾 <b>数据库快照</b>\n{snapshot_path.name}",
+        parse_mode=ParseMode.HTML
+    )
+
+# --- 计算池：耗时计算在子进程中执行，进度消息原地更新 ---
+COMPUTE_POOL_KEY = 'compute_pool'
+COMPUTE_JOBS_KEY = 'compute_jobs'   # (chat_id, 进度消息 id) -> 正在执行的计算任务
+PROGRESS_INTERVAL = 3               # 进度消息的刷新间隔（秒），Telegram 限制同一消息的编辑频率
+
+def _progress_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton("取消", callback_data="compute_cancel")]])
+
+async def _start_computation(update: Update, context: ContextTypes.DEFAULT_TYPE, title: str, render,
+                             fn, *args, **kwargs):
+    """
+    在计算池中执行 fn(*args, **kwargs)，完成后把进度消息替换为 render(结果)。
+    计算在后台任务中等待，处理器立即返回：本聊天的后续更新（包括“取消”按钮）不必排在计算后面。
+    """
+    jobs = context.bot_data.setdefault(COMPUTE_JOBS_KEY, {})
+    chat_id = update.effective_chat.id
+    if any(job_chat_id == chat_id for job_chat_id, _ in jobs):
+        await update.message.reply_text("⏳ 上一个计算还在进行中，请等待完成或点“取消”后再试。")
+        return
+    message = await update.message.reply_text(f"⏳ {title}：计算中…", reply_markup=_progress_keyboard())
+    key = (chat_id, message.message_id)
+    jobs[key] = context.application.create_task(
+        _run_computation(context, message, title, render, fn, args, kwargs, key), update=update
+    )
+
+async def _run_computation(context: ContextTypes.DEFAULT_TYPE, message, title: str, render, fn, args, kwargs, key):
+    pool: compute_pool.ComputePool = context.bot_data[COMPUTE_POOL_KEY]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    job = asyncio.ensure_future(pool.run(fn, *args, **kwargs))
+    try:
+        while not (await asyncio.wait({job}, timeout=PROGRESS_INTERVAL))[0]:
+            try:
+                await message.edit_text(f"⏳ {title}：计算中… 已用 {loop.time() - started:.0f} 秒",
+                                        reply_markup=_progress_keyboard())
+            except TelegramError as e:
+                logging.warning(f"更新进度消息失败: {e}")
+        text = render(job.result())
+    except compute_pool.JobTimeout as e:
+        text = f"⏱️ {title}：{e}，已停止。请缩小范围后重试。"
+    except asyncio.CancelledError:
+        # 用户点了“取消”；同时撤销池中的任务
+        job.cancel()
+        text = f"🛑 {title}：已取消。"
+    except Exception as e:
+        logging.error(f"{title} 计算失败: {e}", exc_info=True)
+        text = f"❌ {title}：计算失败，请稍后再试。"
+    finally:
+        context.bot_data[COMPUTE_JOBS_KEY].pop(key, None)
+    await message.edit_text(text, parse_mode=ParseMode.HTML)
+
+async def compute_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理进度消息上的“取消”按钮"""
+    if not await auth_guard(update, context): return
+    query = update.callback_query
+    task = context.bot_data.get(COMPUTE_JOBS_KEY, {}).get((query.message.chat_id, query.message.message_id))
+    if task is None:
+        await query.answer("计算已经结束。")
+        return
+    task.cancel()
+    await query.answer("正在取消…")
+
+# --- /simulate 策略模拟 ---
+_SIMULATE_SPEND = re.compile(r'^(外币)?(每天|每周|每月)(.+)$')
+_SIMULATE_MONTHS = re.compile(r'^(\d+)(个月)?$')
+
+def _parse_simulate_args(args: list):
+    """解析 /simulate 参数，返回 (月数, 消费计划, 固定卡别名)；无法识别返回 None"""
+    months, profile, fixed_name = 12, [], None
+    for token in args:
+        spend_match = _SIMULATE_SPEND.match(token)
+        months_match = _SIMULATE_MONTHS.match(token)
+        if spend_match:
+            amount_cents = _parse_amount_cents(spend_match.group(3))
+            if amount_cents is None:
+                return None
+            scope = 'foreign' if spend_match.group(1) else 'local'
+            profile.append(simulator.SpendItem(simulator.FREQUENCIES[spend_match.group(2)], amount_cents, scope))
+        elif months_match and simulator.MIN_MONTHS <= int(months_match.group(1)) <= simulator.MAX_MONTHS:
+            months = int(months_match.group(1))
+        elif token.startswith('固定='):
+            fixed_name = token[len('固定='):]
+        else:
+            return None
+    return (months, profile, fixed_name) if profile else None
+
+def _format_strategy(result: simulator.StrategyResult, cards_by_id: dict, title: str) -> str:
+    peak, peak_card_id = result.peak_balance
+    busiest_day, busiest_amount = result.busiest_due_day
+    lines = [
+        f"<b>{title}</b>",
+        f"• 平均免息 <b>{result.avg_float_days:.1f}</b> 天（资金占用 {_format_money(result.float_cent_days)}·天）",
+        f"• 用到 {result.cards_used} 张卡，单卡最高余额 {_format_money(peak)}"
+        + (f"（{format_card_name(cards_by_id[peak_card_id])}）" if peak_card_id else ""),
+    ]
+    if busiest_day:
+        lines.append(
+            f"• 每月约 {result.due_days_per_month():.1f} 个还款日，单日最高 {_format_money(busiest_amount)}"
+            f"（{busiest_day.strftime('%Y-%m-%d')}）"
+        )
+    return "\n".join(lines)
+
+def _format_simulation(report: simulator.SimulationReport, profile: list, cards_by_id: dict, fixed_card: Optional[dict]) -> str:
+    advice, fixed = report.advice, report.fixed
+    if fixed_card:
+        fixed_title = f"📌 固定用 {format_card_name(fixed_card)}"
+    else:
+        fixed_title = "📌 固定用单卡（免息天数最多的一张）"
+    gain = advice.avg_float_days - fixed.avg_float_days
+
+    message = (
+        f"🔮 <b>策略模拟</b>（{report.months}个月，{report.start.strftime('%Y-%m-%d')} 起）\n"
+        f"🧾 {' + '.join(item.describe() for item in profile)}，共 {report.event_count} 笔 {_format_money(advice.total_cents)}\n\n"
+        f"{_format_strategy(advice, cards_by_id, '🤖 跟随每日推荐')}\n\n"
+        f"{_format_strategy(fixed, cards_by_id, fixed_title)}\n\n"
+    )
+    if gain > 0:
+        message += f"✅ 跟随推荐平均多 <b>{gain:.1f}</b> 天免息期"
+    elif gain < 0:
+        message += f"📌 固定用卡平均多 <b>{-gain:.1f}</b> 天免息期"
+    else:
+        message += "两种策略的免息期相同"
+    message += f"\n\n<i>⏱️ 计算耗时 {report.seconds * 1000:.0f} ms</i>"
+    return message
+
+async def simulate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /simulate：模拟多年按推荐用卡与固定用卡的差异"""
+    if not await auth_guard(update, context): return
+
+    parsed = _parse_simulate_args(context.args or [])
+    if parsed is None:
+        await update.message.reply_text(
+            "🔮 <b>策略模拟</b>\n\n"
+            "用法：/simulate [月数] 消费计划… [固定=卡片别名]\n"
+            "消费计划：每天50、每周300、每月2000，外币加前缀如 外币每月500\n"
+            "例如：/simulate 24 每天50 每月2000 外币每月500\n\n"
+            f"💡 <i>月数 {simulator.MIN_MONTHS}-{simulator.MAX_MONTHS}，默认 12；不指定固定卡时与免息天数最多的单卡对比</i>",
+            parse_mode=ParseMode.HTML
+        )
+        return
+    months, profile, fixed_name = parsed
+
+    cards = db.get_all_cards()
+    if not cards:
+        await update.message.reply_text("您还没有卡片，请先使用 /addcard 添加。")
+        return
+    fixed_card = _find_card(cards, fixed_name) if fixed_name else None
+    if fixed_name and not fixed_card:
+        await update.message.reply_text(f"未找到卡片【{fixed_name}】。")
+        return
+
+    cards_by_id = {card['id']: card for card in cards}
+    await _start_computation(
+        update, context, "🔮 策略模拟", lambda report: _format_simulation(report, profile, cards_by_id, fixed_card),
+        simulator.simulate, cards, profile, months, fixed_card=fixed_card
+    )
+
+# --- /optimize 账单日优化 ---
+def _format_optimization(result: optimizer.OptimizationResult, selected: list, cards: list) -> str:
+    changes = [a for a in result.assignments if a.suggested_day != a.current_day]
+    message = (
+        f"🧭 <b>账单日优化</b>（{len(selected)}/{len(cards)} 张卡参与调整）\n\n"
+        f"当前：最差 <b>{result.current_worst}</b> 天，平均 {result.current_average:.1f} 天\n"
+        f"调整后：最差 <b>{result.best_worst}</b> 天，平均 {result.best_average:.1f} 天\n\n"
+    )
+    if changes:
+        message += "\n".join(
+            f"• {format_card_name(a.card)}：账单日 {a.current_day} 日 → <b>{a.suggested_day} 日</b>"
+            for a in changes
+        )
+    else:
+        message += "✅ 当前账单日已是最优，无需调整"
+    if not result.exact:
+        message += "\n\n⚠️ 组合较大，搜索在时限内结束，结果为近似最优"
+    message += f"\n\n<i>⏱️ 计算耗时 {result.seconds * 1000:.0f} ms，搜索 {result.nodes} 个节点</i>"
+    return message
+
+async def optimize_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /optimize：为选定的卡寻找使整个组合免息期最长的账单日"""
+    if not await auth_guard(update, context): return
+
+    args = context.args or []
+    if not args:
+        await update.message.reply_text(
+            "🧭 <b>账单日优化</b>\n\n"
+            "用法：/optimize 卡片别名… 或 /optimize all\n"
+            "例如：/optimize 招行小红卡 中信白金\n\n"
+            "💡 <i>在其余卡保持不变的前提下，为选定的卡寻找新的账单日，"
+            "使未来一年人民币消费每天可用的最长免息期中最差的一天最长，其次平均值最高</i>",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    # 组合只包含能刷人民币的卡，与 /ask 的本币推荐一致
+    cards = [card for card in db.get_all_cards() if card['currency_type'] in ('local', 'all')]
+    if not cards:
+        await update.message.reply_text("您还没有支持人民币的卡片，请先使用 /addcard 添加。")
+        return
+    if len(args) == 1 and args[0].lower() == 'all':
+        selected = cards
+    else:
+        selected = []
+        for name in args:
+            card = _find_card(cards, name)
+            if card is None:
+                await update.message.reply_text(f"未找到支持人民币的卡片【{name}】。")
+                return
+            if card not in selected:
+                selected.append(card)
+
+    await _start_computation(
+        update, context, "🧭 账单日优化", lambda result: _format_optimization(result, selected, cards),
+        optimizer.optimize, cards, selected
+    )
+
+# --- /coverage 免息期覆盖图 ---
+MAX_DEAD_ZONES_SHOWN = 8
+
+def _format_coverage_scope(cov: coverage_map.CoverageMap, scope: str, title: str, threshold: int) -> str:
+    summary = cov.summary(scope)
+    if summary is None:
+        return f"<b>{title}</b>\n没有支持该币种的卡片"
+    worst, average, best = summary
+    lines = [f"<b>{title}</b>", f"最短 <b>{worst}</b> 天 · 平均 {average:.1f} 天 · 最长 {best} 天"]
+
+    # 按月列出最短免息期，一眼看出哪个月偏弱
+    monthly = {}
+    for offset, days in enumerate(cov.envelopes[scope]):
+        day = cov.start + timedelta(days=offset)
+        key = (day.year, day.month)
+        monthly[key] = min(monthly.get(key, days), days)
+    cells = [
+        f"{'次年' if year > cov.start.year and month == cov.start.month else ''}{month}月 {'⚠️' if days < threshold else ''}{days}"
+        for (year, month), days in monthly.items()
+    ]
+    lines.append(" | ".join(cells))
+
+    zones = cov.dead_zones(scope, threshold)
+    if not zones:
+        lines.append(f"✅ 全年每天都有免息 ≥ {threshold} 天的卡")
+        return "\n".join(lines)
+    lines.append(f"🕳️ 盲区（最好的卡也不足 {threshold} 天）：")
+    for zone in zones[:MAX_DEAD_ZONES_SHOWN]:
+        card = cov.best_cards[scope][(zone.start - cov.start).days]
+        span = zone.start.strftime('%m-%d') if zone.start == zone.end else f"{zone.start.strftime('%m-%d')} ~ {zone.end.strftime('%m-%d')}"
+        lines.append(f"• {span}：最短 {zone.worst_days} 天（首日最佳 {format_card_name(card)}）")
+    if len(zones) > MAX_DEAD_ZONES_SHOWN:
+        lines.append(f"… 另有 {len(zones) - MAX_DEAD_ZONES_SHOWN} 段")
+    return "\n".join(lines)
+
+def _format_coverage(cov: coverage_map.CoverageMap, threshold: int) -> str:
+    end = cov.start + timedelta(days=coverage_map.HORIZON_DAYS - 1)
+    return (
+        f"🗺️ <b>免息期覆盖图</b>（{cov.start.strftime('%Y-%m-%d')} ~ {end.strftime('%Y-%m-%d')}）\n\n"
+        f"{_format_coverage_scope(cov, 'local', '💴 人民币', threshold)}\n\n"
+        f"{_format_coverage_scope(cov, 'foreign', '💵 外币', threshold)}\n\n"
+        f"💡 <i>/coverage 天数 可调整盲区阈值；/optimize 可给出改善盲区的账单日建议</i>"
+    )
+
+async def coverage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /coverage [天数]：未来一年每天最佳卡片的免息天数与盲区"""
+    if not await auth_guard(update, context): return
+
+    args = context.args or []
+    threshold = coverage_map.DEAD_ZONE_DAYS
+    if args:
+        if not args[0].isdigit() or not 1 <= int(args[0]) <= 60:
+            await update.message.reply_text("用法：/coverage [天数]，天数为 1-60，例如 /coverage 40")
+            return
+        threshold = int(args[0])
+
+    start = date.today()
+    # 先取缓存键再读卡片：期间卡片有变化时，存入的结果只会被当作旧版本，不会错配
+    key, cov = coverage_map.cached_coverage(start)
+    cards = db.get_all_cards()
+    if not cards:
+        await update.message.reply_text("您还没有卡片，请先使用 /addcard 添加。")
+        return
+    if cov is not None:
+        await update.message.reply_text(_format_coverage(cov, threshold), parse_mode=ParseMode.HTML)
+        return
+
+    def render(cov: coverage_map.CoverageMap) -> str:
+        coverage_map.store_coverage(key, cov)
+        return _format_coverage(cov, threshold)
+    await _start_computation(
+        update, context, "🗺️ 免息期覆盖图", render, coverage_map.build_coverage, cards, start
+    )
+
+# --- /forecast 还款现金流预测 ---
+def _build_forecast(days: int) -> forecast.Forecast:
+    return forecast.build_forecast(
+        db.get_all_cards(), date.today(), days,
+        weekly_threshold_cents=int(FORECAST_CONFIG.get('weekly_threshold', 10000)) * 100,
+        weekly_due_count=int(FORECAST_CONFIG.get('weekly_due_count', 3)),
+    )
+
+def _format_due_event(event: forecast.ForecastEvent) -> str:
+    amount = _format_money(event.amount_cents) if event.amount_cents is not None else "金额未记账"
+    return f"  · {event.day.strftime('%m-%d')} {format_card_name(event.card)} {amount}"
+
+def _format_forecast_week(week: forecast.WeekBucket, detailed: bool) -> str:
+    line = (
+        f"{'⚠️' if week.flagged else '•'} {week.start.strftime('%m-%d')} ~ {week.end.strftime('%m-%d')}："
+        f"{len(week.due_events)} 笔还款 {_format_money(week.due_cents)}"
+    )
+    if week.statement_events:
+        line += f"，{len(week.statement_events)} 张出账"
+    if detailed and week.due_events:
+        line += "\n" + "\n".join(_format_due_event(event) for event in week.due_events)
+    return line
+
+def _format_forecast_alert(result: forecast.Forecast, within_days: int = 14) -> str:
+    """每日提醒用：未来 within_days 天内开始的高压周，没有则返回空字符串"""
+    limit = result.start + timedelta(days=within_days)
+    weeks = [week for week in result.flagged_weeks if week.start < limit]
+    if not weeks:
+        return ""
+    return "💸 <b>还款高峰预警</b>\n" + "\n".join(_format_forecast_week(week, detailed=True) for week in weeks)
+
+async def forecast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /forecast [天数]：按周汇总未来的出账和还款，标出集中还款的周"""
+    if not await auth_guard(update, context): return
+
+    args = context.args or []
+    days = int(FORECAST_CONFIG.get('horizon_days', forecast.MIN_HORIZON_DAYS))
+    if args:
+        if not args[0].isdigit() or not forecast.MIN_HORIZON_DAYS <= int(args[0]) <= forecast.MAX_HORIZON_DAYS:
+            await update.message.reply_text(
+                f"用法：/forecast [天数]，天数为 {forecast.MIN_HORIZON_DAYS}-{forecast.MAX_HORIZON_DAYS}，例如 /forecast 120"
+            )
+            return
+        days = int(args[0])
+
+    result = _build_forecast(days)
+    if not result.weeks:
+        await update.message.reply_text("您还没有卡片，请先使用 /addcard 添加。")
+        return
+    end = result.start + timedelta(days=days - 1)
+    message = (
+        f"💸 <b>还款现金流预测</b>（{result.start.strftime('%Y-%m-%d')} ~ {end.strftime('%Y-%m-%d')}）\n"
+        f"已记账及分期合计应还 <b>{_format_money(result.total_due_cents)}</b>\n\n"
+        + "\n".join(_format_forecast_week(week, detailed=week.flagged) for week in result.weeks)
+    )
+    if result.flagged_weeks:
+        message += (
+            f"\n\n⚠️ 共 {len(result.flagged_weeks)} 周还款集中"
+            f"（单周超过 ¥{int(FORECAST_CONFIG.get('weekly_threshold', 10000)):,} "
+            f"或 {int(FORECAST_CONFIG.get('weekly_due_count', 3))} 笔以上），请提前备好资金"
+        )
+    await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+
+# --- 每日简报 ---
+BRIEFING_CACHE_KEY = 'daily_briefing'
+
+def _render_daily_briefing(today: date) -> str:
+    """一次遍历全部卡片生成简报正文（在定时任务的线程中执行）"""
+    cards = db.get_all_cards()
+    if not cards:
+        return "☀️ <b>每日简报</b>\n\n您还没有卡片，使用 /addcard 添加。"
+    result = briefing.build_briefing(cards, today)
+    weekday = ['周一', '周二', '周三', '周四', '周五', '周六', '周日'][today.weekday()]
+    parts = [f"☀️ <b>每日简报</b> · {today.strftime('%m月%d日')} {weekday}"]
+
+    best_lines = []
+    for scope, title in (('local', '💴 人民币'), ('foreign', '💵 外币')):
+        best = result.best[scope]
+        if best:
+            best_lines.append(f"{title}：<b>{format_card_name(best['card'])}</b>，免息 {best['days']} 天（至{best['due_date'].strftime('%m月%d日')}）")
+    if best_lines:
+        parts.append("🎯 <b>今日用卡</b>\n" + "\n".join(best_lines))
+
+    if result.statements:
+        parts.append("🧾 <b>即将出账</b>\n" + "\n".join(
+            f"• {format_card_name(item.card)} {'今天' if item.days_until == 0 else f'{item.days_until}天后'}出账"
+            + (f"，{_format_money(item.amount_cents)}{_format_installment_part(item.installment_cents)}" if item.amount_cents else "")
+            for item in result.statements
+        ))
+
+    if result.dues:
+        parts.append(f"💰 <b>{briefing.DUE_WINDOW_DAYS}天内还款</b>\n" + "\n".join(
+            f"{config.get_event_status_emoji(item.days_until)} {item.day.strftime('%m-%d')} {format_card_name(item.card)}"
+            + (f" <b>{_format_money(item.amount_cents)}</b>{_format_installment_part(item.installment_cents)}" if item.amount_cents else "")
+            for item in result.dues
+        ))
+
+    if result.fees:
+        parts.append("📆 <b>年费提醒</b>\n" + "\n".join(
+            f"• {format_card_name(item.card)} {item.day.strftime('%m-%d')} 收取 {_format_money(item.amount_cents)}（{item.days_until}天后）"
+            for item in result.fees
+        ))
+
+    alert = _format_forecast_alert(_build_forecast(forecast.MIN_HORIZON_DAYS))
+    if alert:
+        parts.append(alert)
+    if len(parts) == 1:
+        parts.append("✅ 今天没有需要处理的账单事项")
+    return "\n\n".join(parts)
+
+def _briefing_key() -> tuple:
+    """简报缓存的有效期：当天、卡片数据和记账（消费、还款、分期的金额）都未变"""
+    return (date.today(), db.get_data_version(), db.get_ledger_version())
+
+async def _get_daily_briefing(context: ContextTypes.DEFAULT_TYPE) -> str:
+    """返回当前用户今天的简报：有当天且卡片与记账都未变的缓存直接使用，否则现场生成并缓存"""
+    key = _briefing_key()
+    cache = context.bot_data.setdefault(BRIEFING_CACHE_KEY, {})  # user_id -> (key, 正文)
+    cached = cache.get(db.current_user())
+    if cached and cached[0] == key:
+        return cached[1]
+    text = await asyncio.to_thread(_render_daily_briefing, key[0])
+    cache[db.current_user()] = (key, text)
+    return text
+
+async def briefing_precompute_job(context: ContextTypes.DEFAULT_TYPE):
+    """凌晨执行：为每个用户预先生成当天的简报和推荐评分表"""
+    context.bot_data.pop(BRIEFING_CACHE_KEY, None)
+    context.bot_data.pop(INLINE_CACHE_KEY, None)
+    users = tenant_user_ids()
+    for user_id in users:
+        with db.user_scope(user_id):
+            await _get_daily_briefing(context)
+            # 内联推荐与 /ask 使用的当天评分表
+            await asyncio.to_thread(daily_ranking.get_ranking)
+    logging.info(f"每日简报已预生成（{date.today()}，{len(users)} 位用户）")
+
+async def briefing_send_job(context: ContextTypes.DEFAULT_TYPE):
+    """到发送时间只发送缓存的简报；缓存缺失（如凌晨后才启动）或卡片、记账有变更时才现场生成"""
+    cache = context.bot_data.get(BRIEFING_CACHE_KEY, {})
+    for user_id in tenant_user_ids():
+        with db.user_scope(user_id):
+            cached = cache.get(user_id)
+            if not cached or cached[0] != _briefing_key():
+                logging.info(f"用户 {user_id} 没有可用的预生成简报（未预生成或卡片、记账已变更），现场生成")
+            text = await _get_daily_briefing(context)
+        await _send_to_all(context.bot, households.recipients(user_id), text)
+
+async def briefing_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /briefing：查看今天的简报"""
+    if not await auth_guard(update, context): return
+    await update.message.reply_text(await _get_daily_briefing(context), parse_mode=ParseMode.HTML)
+
+# --- 家庭共享 ---
+_HOUSEHOLD_USAGE = (
+    "用法：\n"
+    "/household add 用户ID [editor|viewer] - 邀请成员（默认查看者）或修改角色\n"
+    "/household remove 用户ID - 移除成员\n"
+    "/household leave - 退出所在家庭"
+)
+
+async def household_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /household：查看家庭成员，户主可邀请、移除成员，成员可退出"""
+    if not await auth_guard(update, context): return
+    user_id = update.effective_user.id
+    membership = households.resolve(user_id)
+    args = context.args or []
+    action = args[0].lower() if args else None
+
+    if action == 'leave':
+        if membership.role == households.OWNER:
+            await update.message.reply_text("您是户主，没有可以退出的家庭。")
+        elif households.remove_member(user_id):
+            await update.message.reply_text("已退出家庭，之后将使用您自己的卡片。")
+        else:
+            await update.message.reply_text("❌ 退出失败，请稍后再试。")
+        return
+
+    if action in ('add', 'remove'):
+        if not await auth_guard(update, context, households.OWNER): return
+        if len(args) < 2 or not args[1].isdigit():
+            await update.message.reply_text(_HOUSEHOLD_USAGE)
+            return
+        member_id = int(args[1])
+        if action == 'remove':
+            if households.members_of(user_id).get(member_id) and households.remove_member(member_id):
+                await update.message.reply_text(f"已将用户 {member_id} 移出家庭。")
+            else:
+                await update.message.reply_text(f"用户 {member_id} 不是您的家庭成员。")
+            return
+        role = args[2].lower() if len(args) > 2 else households.VIEWER
+        error = households.add_member(user_id, member_id, role)
+        if error:
+            await update.message.reply_text(f"❌ {error}")
+        else:
+            await update.message.reply_text(
+                f"✅ 用户 {member_id} 已作为{households.ROLE_NAMES[role]}加入您的家庭，"
+                f"将共用您的卡片并收到提醒与简报。"
+            )
+        return
+
+    if action is not None:
+        await update.message.reply_text(_HOUSEHOLD_USAGE)
+        return
+
+    if membership.role != households.OWNER:
+        await update.message.reply_text(
+            f"🏠 您是用户 {membership.portfolio_id} 家庭的<b>{households.ROLE_NAMES[membership.role]}</b>。\n\n"
+            f"/household leave 退出家庭",
+            parse_mode=ParseMode.HTML
+        )
+        return
+    members = households.members_of(user_id)
+    lines = [f"🏠 <b>我的家庭</b>\n\n👑 户主：{user_id}（您）"]
+    lines += [f"• {member_id} {households.ROLE_NAMES[role]}" for member_id, role in members.items()]
+    if not members:
+        lines.append("还没有其他成员")
+    await update.message.reply_text("\n".join(lines) + "\n\n" + _HOUSEHOLD_USAGE, parse_mode=ParseMode.HTML)
+
+# --- 还款日 / 账单日提醒 ---
+REMINDER_SCHEDULER_KEY = 'reminders'
+
+def _rearm_card_reminders(context: ContextTypes.DEFAULT_TYPE, nickname: str):
+    """卡片新增或修改后只重新登记这一张卡的提醒"""
+    scheduler = context.bot_data.get(REMINDER_SCHEDULER_KEY)
+    if scheduler is None:
+        return
+    card = db.get_card_by_nickname(nickname)
+    if card:
+        scheduler.arm_card(card)
+
+def _disarm_card_reminders(context: ContextTypes.DEFAULT_TYPE, card_id: int):
+    scheduler = context.bot_data.get(REMINDER_SCHEDULER_KEY)
+    if scheduler is not None:
+        scheduler.disarm_card(card_id)
+
+def _render_reminder(job: reminders.ReminderJob, cards: list, today: date) -> str:
+    """同一天的多张卡合并为一条提醒；金额为该期账单的记账 + 分期"""
+    keys = {}
+    for card in cards:
+        stmt = job.day if job.kind == reminders.STATEMENT else core_logic.get_statement_date_for_due(card, job.day)
+        if stmt:
+            keys[card['id']] = (card['id'], stmt)
+    totals = db.get_cycle_totals(list(keys.values()))
+    installment_totals = db.get_installment_totals(list(keys.values()))
+
+    days_until = (job.day - today).days
+    when = "今天" if days_until <= 0 else ("明天" if days_until == 1 else f"{days_until}天后")
+    if job.kind == reminders.DUE:
+        title = f"⏰ <b>还款提醒</b> · {job.day.strftime('%m月%d日')}（{when}）"
+    else:
+        title = f"🧾 <b>账单日提醒</b> · {job.day.strftime('%m月%d日')}（{when}）出账"
+
+    lines, total_cents = [], 0
+    for card in sorted(cards, key=lambda c: c['nickname']):
+        key = keys.get(card['id'])
+        ledger = totals.get(key, {}).get('total_cents', 0) if key else 0
+        installment = installment_totals.get(key, 0) if key else 0
+        line = f"• {format_card_name(card)}"
+        if ledger or installment:
+            line += f" <b>{_format_money(ledger + installment)}</b>{_format_installment_part(installment)}"
+            total_cents += ledger + installment
+        lines.append(line)
+    message = title + "\n\n" + "\n".join(lines)
+    if len(cards) > 1 and total_cents:
+        message += f"\n\n合计 <b>{_format_money(total_cents)}</b>"
+    return message
+
+async def repayment_reminder_job(context: ContextTypes.DEFAULT_TYPE):
+    """某个还款日 / 账单日的一次提醒（由 ReminderScheduler 按准确时间登记）"""
+    job = context.job.data
+    scheduler = context.bot_data.get(REMINDER_SCHEDULER_KEY)
+    if scheduler is None:
+        return
+    cards = scheduler.cards_for(job)
+    try:
+        if cards and _is_active_portfolio(job.user_id):
+            with db.user_scope(job.user_id):
+                text = await asyncio.to_thread(_render_reminder, job, cards, date.today())
+            await _send_to_all(context.bot, households.recipients(job.user_id), text)
+    finally:
+        scheduler.job_fired(job)
+
 async def calendar_date_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await auth_guard(update, context): return
     
@@ -1191,6 +2547,26 @@ async def calendar_date_detail(update: Update, context: ContextTypes.DEFAULT_TYP
                     'card': card,
                     'description': f'年费 ¥{card["annual_fee_amount"]}'
                 })
+
+    # 还款日附上该期账单金额（记账 + 分期），一次查询
+    due_statements = {}
+    for event in events:
+        if event['type'] == 'due_date':
+            statement_date = core_logic.get_statement_date_for_due(event['card'], selected_date)
+            if statement_date:
+                due_statements[event['card']['id']] = statement_date
+    if due_statements:
+        keys = list(due_statements.items())
+        totals = db.get_cycle_totals(keys)
+        installment_totals = db.get_installment_totals(keys)
+        for event in events:
+            key = (event['card']['id'], due_statements.get(event['card']['id']))
+            if event['type'] != 'due_date' or key[1] is None:
+                continue
+            installment_cents = installment_totals.get(key, 0)
+            amount = totals.get(key, {}).get('total_cents', 0) + installment_cents
+            if amount:
+                event['description'] = f"还款日 {_format_money(amount)}{_format_installment_part(installment_cents)}"
     
     # 构建详细信息
     date_str_cn = selected_date.strftime('%Y年%m月%d日')
@@ -1326,7 +2702,7 @@ async def calendar_quick_actions(update: Update, context: ContextTypes.DEFAULT_T
 
 async def confirm_waiver(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理用户点击"确认豁免"按钮的回调"""
-    if not await auth_guard(update, context): return
+    if not await auth_guard(update, context, households.EDITOR): return
     
     query = update.callback_query
     await query.answer("正在更新状态...")
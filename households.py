@@ -0,0 +1,111 @@
+# households.py
+"""
+家庭共享：多个用户以户主、编辑者或查看者的身份共用一组卡片。
+
+卡片仍按 user_id 分区，家庭的卡片就是户主名下的卡片；成员的每次请求都以户主的 user_id 读写数据。
+成员关系首次使用时从 household_members 整表载入内存，角色判断和提醒收件人都是字典查找，
+增删成员时同步更新数据库和内存。
+"""
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+import database as db
+
+OWNER = 'owner'
+EDITOR = 'editor'
+VIEWER = 'viewer'
+ROLE_NAMES = {OWNER: '户主', EDITOR: '编辑者', VIEWER: '查看者'}
+_ROLE_RANK = {VIEWER: 1, EDITOR: 2, OWNER: 3}
+
+
+class Membership(NamedTuple):
+    portfolio_id: int   # 使用哪位户主的卡片
+    role: str
+
+    def allows(self, role: str) -> bool:
+        return _ROLE_RANK[self.role] >= _ROLE_RANK[role]
+
+
+_members: Dict[int, Membership] = {}     # 成员 -> 所属家庭与角色（户主本人不在其中）
+_households: Dict[int, Set[int]] = {}    # 户主 -> 成员
+_loaded_backend: Optional[db.StorageBackend] = None
+_lock = threading.Lock()
+_listeners: List[Callable[[], None]] = []   # 成员关系变更后的回调（分片部署时通知其他进程）
+
+
+def _ensure_loaded():
+    """首次使用或切换存储后端后重新载入成员关系"""
+    global _loaded_backend
+    backend = db.get_backend()
+    if _loaded_backend is backend:
+        return
+    with _lock:
+        if _loaded_backend is backend:
+            return
+        _members.clear()
+        _households.clear()
+        for row in db.get_household_members():
+            _members[row['member_id']] = Membership(row['owner_id'], row['role'])
+            _households.setdefault(row['owner_id'], set()).add(row['member_id'])
+        _loaded_backend = backend
+
+def invalidate():
+    """丢弃内存中的成员关系，下次使用时重新载入（其他进程修改了成员关系时调用）"""
+    global _loaded_backend
+    _loaded_backend = None
+
+def on_change(callback: Callable[[], None]):
+    _listeners.append(callback)
+
+def _notify():
+    for callback in _listeners:
+        callback()
+
+def resolve(user_id: int) -> Membership:
+    """用户当前使用的卡片组合与角色；没有加入家庭时就是自己的户主"""
+    _ensure_loaded()
+    return _members.get(user_id) or Membership(user_id, OWNER)
+
+def members_of(owner_id: int) -> Dict[int, str]:
+    """户主的成员及角色，不含户主本人"""
+    _ensure_loaded()
+    return {member_id: _members[member_id].role for member_id in sorted(_households.get(owner_id, ()))}
+
+def recipients(owner_id: int) -> List[int]:
+    """家庭通知的收件人：户主和全部成员"""
+    _ensure_loaded()
+    return [owner_id, *sorted(_households.get(owner_id, ()))]
+
+def add_member(owner_id: int, member_id: int, role: str) -> Optional[str]:
+    """邀请成员或修改其角色；不允许时返回原因"""
+    _ensure_loaded()
+    if role not in (EDITOR, VIEWER):
+        return "角色只能是 editor 或 viewer"
+    if member_id == owner_id:
+        return "不能把自己加入自己的家庭"
+    current = _members.get(member_id)
+    if current and current.portfolio_id != owner_id:
+        return "该用户已加入其他家庭，需先退出"
+    if _households.get(member_id):
+        return "该用户是其他家庭的户主，需先移除其成员"
+    if not db.set_household_member(owner_id, member_id, role):
+        return "保存失败，请稍后再试"
+    with _lock:
+        _members[member_id] = Membership(owner_id, role)
+        _households.setdefault(owner_id, set()).add(member_id)
+    _notify()
+    return None
+
+def remove_member(member_id: int) -> bool:
+    _ensure_loaded()
+    membership = _members.get(member_id)
+    if membership is None or not db.remove_household_member(member_id):
+        return False
+    with _lock:
+        _members.pop(member_id, None)
+        owners_members = _households.get(membership.portfolio_id, set())
+        owners_members.discard(member_id)
+        if not owners_members:
+            _households.pop(membership.portfolio_id, None)
+    _notify()
+    return True
@@ -0,0 +1,41 @@
+# installments.py
+"""
+分期计划：本金按期数平均分摊（除不尽的零头计入第一期），手续费每期按本金 × 费率收取。
+
+每期应还在建计划时一次性展开写入 installment_payments，之后账单预估、/forecast 和日历
+只按 (卡片, 账单日) 查表相加，渲染时不再重新推算。
+"""
+from datetime import date
+from typing import Dict, List, NamedTuple
+
+import core_logic
+
+MAX_PERIODS = 36
+
+
+class InstallmentPayment(NamedTuple):
+    period_no: int
+    statement_date: date
+    principal_cents: int
+    fee_cents: int
+
+    @property
+    def total_cents(self) -> int:
+        return self.principal_cents + self.fee_cents
+
+
+def statement_in_month(card: Dict, year: int, month: int) -> date:
+    """该卡在指定月份的账单日"""
+    return core_logic.safe_create_date(year, month, card['statement_day'])
+
+def build_schedule(card: Dict, principal_cents: int, periods: int, fee_rate_bp: int,
+                   first_statement: date) -> List[InstallmentPayment]:
+    """从 first_statement 那一期起，逐月展开每期的账单日、本金和手续费"""
+    base, remainder = divmod(principal_cents, periods)
+    fee = principal_cents * fee_rate_bp // 10000
+    schedule = []
+    for i in range(periods):
+        month_index = first_statement.month - 1 + i
+        statement_date = statement_in_month(card, first_statement.year + month_index // 12, month_index % 12 + 1)
+        schedule.append(InstallmentPayment(i + 1, statement_date, base + (remainder if i == 0 else 0), fee))
+    return schedule
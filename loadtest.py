@@ -0,0 +1,455 @@
+# loadtest.py
+"""
+离线压测工具：启动一个本地 Bot API 替身，把 main.py 构建的 Application 指向它，
+回放合成的更新流，并按场景输出吞吐量、p50/p99 延迟以及 API 调用次数。
+
+处理器抛出的异常计入 errors，有异常时退出码为 1。
+
+用法：
+    python loadtest.py                       # 运行全部场景
+    python loadtest.py -s calendar -n 500    # 只跑日历翻页风暴，500 个更新
+    python loadtest.py -s editcard --storage memory   # 在内存后端上编辑卡片后立即推荐
+    python loadtest.py --json                # 输出机器可读的结果
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import logging
+from collections import Counter, deque
+from email.parser import BytesParser
+from pathlib import Path
+from urllib.parse import parse_qs
+
+# 必须在导入 config/main 之前设置，保证不会用到真实的 token 和管理员
+LOADTEST_TOKEN = "123456:LOADTEST-TOKEN"
+LOADTEST_USER_ID = 424242
+os.environ['TELEGRAM_BOT_TOKEN'] = LOADTEST_TOKEN
+os.environ['ADMIN_USER_ID'] = str(LOADTEST_USER_ID)
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import database
+import main as bot_main
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+RESPONSE_METHODS = ('sendMessage', 'editMessageText', 'answerCallbackQuery', 'answerInlineQuery', 'sendDocument')
+
+
+class FakeBotAPI:
+    """最小化的 Bot API 替身：只实现压测需要的方法，其余方法一律返回 True"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.outbox = deque(maxlen=50)  # 最近发出的消息文本，便于排查
+        self._pending = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates = asyncio.Event()
+        self._server = None
+        self._connections = set()
+        self._closing = False
+        self.port = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        # 先唤醒挂起的长轮询，让连接自然结束，避免事件循环关闭时留下被取消的任务
+        self._closing = True
+        self._new_updates.set()
+        if self._server:
+            self._server.close()
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=5)
+        if self._server:
+            await self._server.wait_closed()
+
+    def push_update(self, update: dict) -> int:
+        """把一个更新放入 getUpdates 队列，返回分配的 update_id"""
+        self._update_id += 1
+        update['update_id'] = self._update_id
+        self._pending.append(update)
+        self._new_updates.set()
+        return self._update_id
+
+    def reset_counters(self):
+        self.calls.clear()
+
+    # --- HTTP 层 ---
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                api_method = target.rsplit('/', 1)[-1]
+                params = self._parse_params(headers.get('content-type', ''), body)
+                result = await self._dispatch(api_method, params)
+
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(payload) + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _parse_params(content_type: str, body: bytes) -> dict:
+        if not body:
+            return {}
+        if content_type.startswith('multipart/'):
+            message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+            raw = {
+                part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                for part in message.get_payload()
+            }
+            return {k: v.decode('utf-8', 'replace') for k, v in raw.items() if k and v is not None}
+        params = {}
+        for key, values in parse_qs(body.decode('utf-8'), keep_blank_values=True).items():
+            try:
+                params[key] = json.loads(values[0])
+            except ValueError:
+                params[key] = values[0]
+        return params
+
+    # --- Bot API 方法 ---
+    async def _dispatch(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            if method == 'editMessageText' and 'inline_message_id' in params:
+                return True
+            self._message_id += 1
+            chat_id = int(params.get('chat_id', 0))
+            self.outbox.append(str(params.get('text', params.get('caption', ''))))
+            return {
+                "message_id": params.get('message_id', self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "from": BOT_USER,
+                "text": str(params.get('text', '')),
+            }
+        return True
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        self._pending = [u for u in self._pending if u['update_id'] >= offset]
+        if self._closing:
+            return []
+        if not self._pending:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:int(params.get('limit') or 100)]
+
+
+# --- 合成更新 ---
+def _chat(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "private" if chat_id > 0 else "group", "title": "loadtest"}
+
+def _user() -> dict:
+    return {"id": LOADTEST_USER_ID, "is_bot": False, "first_name": "Load"}
+
+def text_update(chat_id: int, text: str) -> dict:
+    message = {
+        "message_id": random.randint(1, 10**9), "date": int(time.time()),
+        "chat": _chat(chat_id), "from": _user(), "text": text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"message": message}
+
+def callback_update(chat_id: int, data: str) -> dict:
+    return {"callback_query": {
+        "id": str(random.randint(1, 10**9)), "from": _user(), "chat_instance": str(chat_id), "data": data,
+        "message": {
+            "message_id": 1, "date": int(time.time()), "chat": _chat(chat_id), "from": BOT_USER, "text": "...",
+        },
+    }}
+
+def inline_update(query: str) -> dict:
+    return {"inline_query": {"id": str(random.randint(1, 10**9)), "from": _user(), "query": query, "offset": ""}}
+
+
+def random_card(index: int) -> dict:
+    due_type = random.choice(['fixed_day', 'days_after'])
+    return {
+        'nickname': f"压测卡{index:04d}",
+        'last_four_digits': f"{index % 10000:04d}",
+        'bank_name': random.choice(['招商银行', '工商银行', '建设银行', '中信银行', '交通银行']),
+        'statement_day': random.randint(1, 28),
+        'statement_day_inclusive': random.choice([True, False]),
+        'due_date_type': due_type,
+        'due_date_value': random.randint(1, 28) if due_type == 'fixed_day' else random.randint(15, 25),
+        'currency_type': random.choice(['local', 'foreign', 'all']),
+        'annual_fee_amount': random.choice([0, 0, 200, 600]),
+        'annual_fee_date': '08-15',
+        'has_waiver': True,
+        'is_waived_for_cycle': False,
+        'waiver_reset_date': None,
+    }
+
+
+# --- 场景：每个场景返回若干条“脚本”，同一脚本内的更新按顺序串行发送 ---
+def scenario_commands(total: int, chats: int) -> list:
+    """常用命令混合：/start /cards /ask /calendar /checkfees"""
+    weights = {'/ask': 4, '/cards': 3, '/start': 2, '/calendar': 2, '/checkfees': 1}
+    commands = random.choices(list(weights), weights=list(weights.values()), k=total)
+    scripts = [[] for _ in range(chats)]
+    for i, command in enumerate(commands):
+        chat_id = LOADTEST_USER_ID if chats == 1 else -(1000 + i % chats)
+        scripts[i % chats].append(text_update(chat_id, command))
+    return scripts
+
+def scenario_calendar(total: int, chats: int) -> list:
+    """日历翻页风暴：连续前后翻月并点击日期"""
+    scripts = [[] for _ in range(chats)]
+    year, month = 2025, 1
+    for i in range(total):
+        chat_id = LOADTEST_USER_ID if chats == 1 else -(2000 + i % chats)
+        if i % 5 == 4:
+            data = f"cal_day_{year}-{month}-{random.randint(1, 28)}"
+        else:
+            month += random.choice([1, 1, -1])
+            year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+            data = f"cal_nav_{year}_{month}"
+        scripts[i % chats].append(callback_update(chat_id, data))
+    return scripts
+
+def scenario_ledger(total: int, chats: int) -> list:
+    """记账与查询混合：/spend 写入流水并增量更新周期汇总，/ask 读取账单预估"""
+    script = []
+    for i in range(total):
+        if i % 4 == 3:
+            script.append(text_update(LOADTEST_USER_ID, '/ask'))
+        else:
+            amount = f"{random.randint(1, 2000)}.{random.randint(0, 99):02d}"
+            script.append(text_update(LOADTEST_USER_ID, f"/spend {amount} 压测卡{random.randint(0, 19):04d} 压测"))
+    return [script]
+
+def scenario_addcard(total: int, chats: int) -> list:
+    """完整的 /addcard 对话（每次 12 个更新），结束后用 /delcard 清理"""
+    chat_id = LOADTEST_USER_ID
+    script = []
+    for i in range(max(1, total // 14)):
+        nickname = f"对话卡{i:05d}"
+        script += [
+            text_update(chat_id, '/addcard'),
+            text_update(chat_id, '招商银行'),
+            text_update(chat_id, f"{i % 10000:04d}"),
+            text_update(chat_id, nickname),
+            text_update(chat_id, str(random.randint(1, 28))),
+            callback_update(chat_id, 'add_inclusive_false'),
+            callback_update(chat_id, 'add_due_fixed_day'),
+            text_update(chat_id, str(random.randint(1, 28))),
+            callback_update(chat_id, 'add_curr_all'),
+            text_update(chat_id, '200'),
+            text_update(chat_id, '08-15'),
+            callback_update(chat_id, 'add_waiver_true'),
+            text_update(chat_id, '/delcard'),
+            callback_update(chat_id, f"del_confirm_{nickname}"),
+        ]
+    # 对话状态属于单个用户，只能串行回放
+    return [script]
+
+def scenario_editcard(total: int, chats: int) -> list:
+    """/editcard 以文本输入修改账单日和还款日，随后 /ask 用修改后的卡片推荐（检查各后端保存的字段类型一致）"""
+    chat_id = LOADTEST_USER_ID
+    script = []
+    for i in range(max(1, total // 9)):
+        nickname = f"压测卡{i % 20:04d}"
+        script += [
+            text_update(chat_id, f"/editcard {nickname}"),
+            callback_update(chat_id, f"edit_card_{nickname}"),
+            callback_update(chat_id, 'edit_field_statement_day'),
+            text_update(chat_id, str(random.randint(1, 28))),
+            callback_update(chat_id, 'edit_field_due_date_rule'),
+            callback_update(chat_id, 'edit_due_days_after'),
+            text_update(chat_id, str(random.randint(15, 25))),
+            callback_update(chat_id, 'edit_field_done'),
+            text_update(chat_id, '/ask 300'),
+        ]
+    return [script]
+
+def scenario_inline(total: int, chats: int) -> list:
+    """内联查询 @机器人 金额：少量常见金额反复出现，大多命中按用户缓存的结果"""
+    queries = ['', '38', '300', '300 餐饮', '1200', 'amazon 120 USD', '星巴克 38', '5000']
+    return [[inline_update(random.choice(queries)) for _ in range(total)]]
+
+SCENARIOS = {
+    'commands': scenario_commands,
+    'calendar': scenario_calendar,
+    'addcard': scenario_addcard,
+    'ledger': scenario_ledger,
+    'editcard': scenario_editcard,
+    'inline': scenario_inline,
+}
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class LoadTestRunner:
+    """驱动 Application 处理合成更新，并统计每个更新从入队到处理完毕的端到端延迟"""
+
+    def __init__(self, api: FakeBotAPI, application):
+        self.api = api
+        self.application = application
+        self._waiters = {}
+        self.errors = 0
+        # 放在最后一个分组：只有前面所有分组的处理器都执行完毕后才会被调用
+        application.add_handler(TypeHandler(Update, self._mark_done), group=99)
+        application.add_error_handler(self._count_error)
+
+    async def _count_error(self, update, context):
+        self.errors += 1
+        logging.warning(f"处理更新时出错: {context.error!r}")
+
+    async def _mark_done(self, update: Update, context):
+        waiter = self._waiters.pop(update.update_id, None)
+        if waiter and not waiter.done():
+            waiter.set_result(time.perf_counter())
+
+    async def _run_script(self, script: list, latencies: list, timeout: float):
+        loop = asyncio.get_running_loop()
+        for update in script:
+            started = time.perf_counter()
+            update_id = self.api.push_update(update)
+            waiter = loop.create_future()
+            self._waiters[update_id] = waiter
+            try:
+                finished = await asyncio.wait_for(waiter, timeout=timeout)
+                latencies.append(finished - started)
+            except asyncio.TimeoutError:
+                self._waiters.pop(update_id, None)
+                logging.warning(f"更新 {update_id} 处理超时")
+
+    async def run(self, name: str, scripts: list, timeout: float = 30.0) -> dict:
+        self.api.reset_counters()
+        self.errors = 0
+        latencies = []
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_script(s, latencies, timeout) for s in scripts if s))
+        elapsed = time.perf_counter() - started
+        calls = {k: v for k, v in self.api.calls.items() if k != 'getUpdates'}
+        return {
+            'scenario': name,
+            'updates': len(latencies),
+            'seconds': round(elapsed, 3),
+            'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'api_calls': calls,
+            'api_calls_per_update': round(sum(calls.get(m, 0) for m in RESPONSE_METHODS) / max(1, len(latencies)), 2),
+            'errors': self.errors,
+        }
+
+
+def seed_portfolio(card_count: int):
+    with database.user_scope(LOADTEST_USER_ID):
+        for i in range(card_count):
+            database.add_card(random_card(i))
+
+
+async def run_loadtest(args) -> list:
+    random.seed(args.seed)
+    database.configure(args.storage, Path(args.data_dir) / "cards.db")
+    database.init_db()
+    seed_portfolio(args.cards)
+
+    api = FakeBotAPI()
+    base_url = await api.start()
+    application = bot_main.build_application(base_url=base_url)
+    runner = LoadTestRunner(api, application)
+
+    results = []
+    await application.initialize()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10)
+    await application.start()
+    try:
+        names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+        for name in names:
+            scripts = SCENARIOS[name](args.updates, args.chats)
+            results.append(await runner.run(name, scripts))
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await api.stop()
+    return results
+
+
+def format_results(results: list) -> str:
+    lines = [f"{'场景':<10}{'更新数':>8}{'耗时(s)':>10}{'吞吐(upd/s)':>14}{'p50(ms)':>10}{'p99(ms)':>10}{'异常':>6}  API调用"]
+    for r in results:
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(r['api_calls'].items()))
+        lines.append(
+            f"{r['scenario']:<10}{r['updates']:>8}{r['seconds']:>10}{r['throughput']:>14}"
+            f"{r['p50_ms']:>10}{r['p99_ms']:>10}{r['errors']:>6}  {calls}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="信用卡机器人离线压测")
+    parser.add_argument('-s', '--scenario', choices=['all', *SCENARIOS], default='all')
+    parser.add_argument('-n', '--updates', type=int, default=300, help="每个场景的更新数量")
+    parser.add_argument('-c', '--chats', type=int, default=1, help="并发会话数（命令和日历场景）")
+    parser.add_argument('--cards', type=int, default=20, help="预置的卡片数量")
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--storage', choices=list(database.BACKENDS), default='sqlite', help="存储后端")
+    parser.add_argument('--data-dir', default=None, help="数据库目录（sqlite 后端），默认使用临时目录")
+    parser.add_argument('--json', action='store_true', help="输出 JSON")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="cardbot-loadtest-") as tmp:
+        args.data_dir = args.data_dir or tmp
+        results = asyncio.run(run_loadtest(args))
+    print(json.dumps(results, ensure_ascii=False, indent=2) if args.json else format_results(results))
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
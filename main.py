@@ -1,36 +1,41 @@
 # main.py
 import logging
 import asyncio
-from datetime import time
+from datetime import time, timedelta
 from zoneinfo import ZoneInfo
 from telegram.ext import (
     Application, CommandHandler, ConversationHandler, MessageHandler, 
-    filters, CallbackQueryHandler, Defaults
+    filters, CallbackQueryHandler, Defaults, InlineQueryHandler, TypeHandler
 )
+from telegram import Update
 from telegram.constants import ParseMode
 
 import config
 import database
+from compute_pool import ComputePool
+import reminders
+import sharding
+from update_processor import ChatSequentialUpdateProcessor
 from handlers import (
-    start, cancel, list_cards, get_recommendation, calendar_view, calendar_date_detail, calendar_quick_actions,
+    scope_update, start, cancel, list_cards, find_card_command, get_recommendation, inline_recommendation, spend, spend_undo, repay, set_reward, list_rewards, delete_reward, add_installment, list_installments, delete_installment, simulate_command, optimize_command, coverage_command, forecast_command, calendar_view, calendar_date_detail, calendar_quick_actions,
     add_card_start, add_get_bank_name, add_get_last_four, add_get_nickname,
     add_get_statement_day, add_get_statement_inclusive, add_get_due_date_type,
     add_get_due_date_value, add_get_currency_type, add_get_annual_fee,
     add_get_annual_fee_date, add_get_has_waiver,
     edit_card_start, edit_choose_card, edit_main_menu_router,
     edit_get_simple_value, edit_get_statement_inclusive, edit_get_currency_type,
-    edit_get_due_date_type, edit_get_due_date_value,
+    edit_get_due_date_type, edit_get_due_date_value, edit_get_due_adjustment,
     edit_show_fee_submenu, edit_fee_submenu_router, edit_get_waiver_status,
     edit_get_fee_amount, edit_get_fee_date, edit_get_has_waiver,
-    del_card_start, del_card_confirm,
-    daily_check_job, force_check_fees, confirm_waiver,
+    del_card_start, del_card_confirm, card_picker_page,
+    daily_check_job, force_check_fees, briefing_precompute_job, briefing_send_job, briefing_command, household_command, repayment_reminder_job, REMINDER_SCHEDULER_KEY, compute_cancel, COMPUTE_POOL_KEY, tenant_user_ids, confirm_waiver, backup_job, backup_command,
     ADD_BANK_NAME, ADD_LAST_FOUR, ADD_NICKNAME, ADD_STATEMENT_DAY, 
     ADD_STATEMENT_INCLUSIVE, ADD_DUE_DATE_TYPE, ADD_DUE_DATE_VALUE, 
     ADD_CURRENCY_TYPE, ADD_ANNUAL_FEE_AMOUNT, ADD_ANNUAL_FEE_DATE, ADD_HAS_WAIVER,
     EDIT_CHOOSE_CARD, EDIT_MAIN_MENU, EDIT_GET_VALUE, EDIT_STATEMENT_INCLUSIVE,
     EDIT_CURRENCY_TYPE, EDIT_DUE_DATE_TYPE, EDIT_DUE_DATE_VALUE,
     EDIT_FEE_SUB_MENU, EDIT_FEE_AMOUNT, EDIT_FEE_DATE, EDIT_HAS_WAIVER,
-    EDIT_WAIVER_STATUS,
+    EDIT_WAIVER_STATUS, EDIT_DUE_ADJUSTMENT,
     DEL_CARD_CHOOSE
 )
 
@@ -39,14 +44,42 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-async def main() -> None:
-    database.init_db()
-    
+def parse_clock(text, default: time) -> time:
+    """把配置中的 "HH:MM" 解析为 time，格式不对时使用默认值"""
+    try:
+        hour, minute = map(int, str(text).split(':'))
+        return time(hour=hour, minute=minute)
+    except (TypeError, ValueError):
+        if text:
+            logging.warning(f"无法解析时间配置 {text!r}，使用默认值 {default.strftime('%H:%M')}")
+        return default
+
+class CardBotApplication(Application):
+    """计算池随 Application 一起初始化和关闭（main、分片 worker 和压测都手动调用 initialize / shutdown）"""
+
+    async def initialize(self) -> None:
+        await super().initialize()
+        self.bot_data[COMPUTE_POOL_KEY].start()
+
+    async def shutdown(self) -> None:
+        # stop() 已等待后台计算任务结束，这里只剩收尾
+        await self.bot_data[COMPUTE_POOL_KEY].shutdown()
+        await super().shutdown()
+
+def build_application(base_url: str = None) -> Application:
+    """构建并注册所有处理器的 Application；base_url 可指向本地的 Bot API 替身（压测用）"""
     local_tz = ZoneInfo('Asia/Shanghai')
     defaults = Defaults(parse_mode=ParseMode.HTML, tzinfo=local_tz)
-    application = Application.builder().token(config.config['telegram']['bot_token']).defaults(defaults).build()
-    
-    logging.info("Bot is starting...")
+    builder = (Application.builder().application_class(CardBotApplication)
+               .token(config.config['telegram']['bot_token']).defaults(defaults))
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    # 不同聊天并发处理，同一聊天按顺序串行；设为 1 则与旧版本一样逐个处理
+    concurrent_updates = int(config.config['telegram'].get('concurrent_updates') or 1)
+    if concurrent_updates > 1:
+        builder = builder.concurrent_updates(ChatSequentialUpdateProcessor(concurrent_updates))
+    application = builder.build()
+    application.bot_data[COMPUTE_POOL_KEY] = ComputePool.from_config(config.COMPUTE_CONFIG)
 
     add_card_conv = ConversationHandler(
         entry_points=[CommandHandler("addcard", add_card_start)],
@@ -70,13 +103,17 @@ async def main() -> None:
     edit_card_conv = ConversationHandler(
         entry_points=[CommandHandler("editcard", edit_card_start)],
         states={
-            EDIT_CHOOSE_CARD: [CallbackQueryHandler(pattern="^edit_card_", callback=edit_choose_card)],
+            EDIT_CHOOSE_CARD: [
+                CallbackQueryHandler(pattern="^edit_card_", callback=edit_choose_card),
+                CallbackQueryHandler(pattern="^edit_page_(prev|next)$", callback=card_picker_page),
+            ],
             EDIT_MAIN_MENU: [CallbackQueryHandler(pattern="^edit_field_", callback=edit_main_menu_router)],
             EDIT_GET_VALUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_get_simple_value)],
             EDIT_STATEMENT_INCLUSIVE: [CallbackQueryHandler(pattern="^edit_inclusive_", callback=edit_get_statement_inclusive)],
             EDIT_CURRENCY_TYPE: [CallbackQueryHandler(pattern="^edit_curr_", callback=edit_get_currency_type)],
             EDIT_DUE_DATE_TYPE: [CallbackQueryHandler(pattern="^edit_due_", callback=edit_get_due_date_type)],
             EDIT_DUE_DATE_VALUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_get_due_date_value)],
+            EDIT_DUE_ADJUSTMENT: [CallbackQueryHandler(pattern="^edit_adj_", callback=edit_get_due_adjustment)],
             EDIT_FEE_SUB_MENU: [CallbackQueryHandler(pattern="^edit_fee_", callback=edit_fee_submenu_router)],
             EDIT_FEE_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_get_fee_amount)],
             EDIT_FEE_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_get_fee_date)],
@@ -90,18 +127,39 @@ async def main() -> None:
     del_card_conv = ConversationHandler(
         entry_points=[CommandHandler("delcard", del_card_start)],
         states={
-            DEL_CARD_CHOOSE: [CallbackQueryHandler(pattern="^del_confirm_", callback=del_card_confirm)]
+            DEL_CARD_CHOOSE: [
+                CallbackQueryHandler(pattern="^del_confirm_", callback=del_card_confirm),
+                CallbackQueryHandler(pattern="^del_page_(prev|next)$", callback=card_picker_page),
+            ]
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         per_message=False
     )
 
+    # 先于所有处理器执行，把本次更新的数据读写限定在发送者名下
+    application.add_handler(TypeHandler(Update, scope_update), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("cancel", cancel))
     application.add_handler(CommandHandler("cards", list_cards))
+    application.add_handler(CommandHandler("find", find_card_command))
     application.add_handler(CommandHandler("ask", get_recommendation))
     application.add_handler(CommandHandler("calendar", calendar_view))
+    application.add_handler(CommandHandler("spend", spend))
+    application.add_handler(CommandHandler("repay", repay))
+    application.add_handler(CommandHandler("setreward", set_reward))
+    application.add_handler(CommandHandler("rewards", list_rewards))
+    application.add_handler(CommandHandler("delreward", delete_reward))
+    application.add_handler(CommandHandler("installment", add_installment))
+    application.add_handler(CommandHandler("installments", list_installments))
+    application.add_handler(CommandHandler("delinstallment", delete_installment))
+    application.add_handler(CommandHandler("simulate", simulate_command))
+    application.add_handler(CommandHandler("optimize", optimize_command))
+    application.add_handler(CommandHandler("coverage", coverage_command))
+    application.add_handler(CommandHandler("forecast", forecast_command))
+    application.add_handler(CommandHandler("briefing", briefing_command))
+    application.add_handler(CommandHandler("household", household_command))
     application.add_handler(CommandHandler("checkfees", force_check_fees))
+    application.add_handler(CommandHandler("backup", backup_command))
     
     application.add_handler(add_card_conv)
     application.add_handler(edit_card_conv)
@@ -114,17 +172,65 @@ async def main() -> None:
     application.add_handler(CallbackQueryHandler(calendar_quick_actions, pattern="^cal_remind_"))
     application.add_handler(CallbackQueryHandler(calendar_quick_actions, pattern="^cal_note_"))
     application.add_handler(CallbackQueryHandler(pattern="^waiver_confirm_", callback=confirm_waiver))
+    application.add_handler(CallbackQueryHandler(pattern="^spend_undo_", callback=spend_undo))
+    application.add_handler(CallbackQueryHandler(pattern="^compute_cancel$", callback=compute_cancel))
+    application.add_handler(InlineQueryHandler(inline_recommendation))
+    return application
+
+def schedule_jobs(application: Application, include_backup: bool = True):
+    """登记每日任务和还款提醒；分片部署时每个 worker 只处理自己分片的用户，备份只由一个 worker 执行"""
+    job_queue = application.job_queue
+    job_queue.run_daily(
+        daily_check_job, 
+        time=time(hour=10, minute=0, second=0), 
+        name="daily_fee_check"
+    )
+    if config.NOTIFICATION_CONFIG.get('daily_briefing_enabled'):
+        job_queue.run_daily(
+            briefing_precompute_job,
+            time=parse_clock(config.NOTIFICATION_CONFIG.get('briefing_precompute_time'), time(hour=0, minute=5)),
+            name="daily_briefing_precompute"
+        )
+        job_queue.run_daily(
+            briefing_send_job,
+            time=parse_clock(config.NOTIFICATION_CONFIG.get('daily_briefing_time'), time(hour=8, minute=30)),
+            name="daily_briefing_send"
+        )
+    if config.NOTIFICATION_CONFIG.get('repayment_reminder_enabled'):
+        settings = reminders.ReminderSettings.from_config(
+            config.NOTIFICATION_CONFIG,
+            parse_clock(config.NOTIFICATION_CONFIG.get('reminder_time'), time(hour=9, minute=0))
+        )
+        scheduler = reminders.ReminderScheduler(job_queue, settings, repayment_reminder_job)
+        for user_id in tenant_user_ids():
+            with database.user_scope(user_id):
+                scheduler.arm_all(database.get_all_cards())
+        application.bot_data[REMINDER_SCHEDULER_KEY] = scheduler
+    if include_backup and config.BACKUP_CONFIG.get('enabled'):
+        job_queue.run_repeating(
+            backup_job,
+            interval=timedelta(hours=float(config.BACKUP_CONFIG.get('interval_hours') or 24)),
+            first=timedelta(minutes=5),
+            name="database_backup"
+        )
+
+async def main() -> None:
+    storage_config = config.config.get('storage', {})
+    database.configure(storage_config.get('backend'), storage_config.get('path') or None)
+    database.init_db()
+    database.adopt_default_user_cards(config.ADMIN_USER_ID)
+    workers = sharding.worker_count(config.config.get('sharding'))
+    if workers > 1:
+        await sharding.run_front(workers)
+        return
+    application = build_application()
+    
+    logging.info("Bot is starting...")
     
     try:
         logging.info("Application starting...")
         await application.initialize()
-        job_queue = application.job_queue
-        job_queue.run_daily(
-            daily_check_job, 
-            time=time(hour=10, minute=0, second=0), 
-            chat_id=config.ADMIN_USER_ID, 
-            name="daily_fee_check"
-        )
+        schedule_jobs(application)
         await application.updater.start_polling()
         await application.start()
         logging.info("Daily jobs scheduled. Bot is now running.")
@@ -142,4 +248,4 @@ async def main() -> None:
         logging.info("Bot has shut down successfully.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+# merchants.py
+"""
+离线商户词典：把 merchants.json 中的商户名和别名装入字符 trie，用于从自由文本推断消费类别和币种。
+
+精确解析是一次 trie 下行（取查询文本最长的已知商户前缀），与词典大小无关；
+没有命中时，只在查询文本能走到的最深子树内做模糊匹配，不会线性扫描整个词典。
+词典在第一次查询时才加载。
+"""
+import difflib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Optional
+
+MERCHANTS_FILE = Path(__file__).parent / "merchants.json"
+LOCAL_CURRENCY = 'CNY'
+FUZZY_CUTOFF = 0.75         # 模糊匹配的最低相似度
+MAX_FUZZY_CANDIDATES = 64   # 模糊匹配最多比较的候选数
+
+
+class Merchant(NamedTuple):
+    name: str
+    category: str
+    region: str  # local / foreign
+
+
+class MerchantMatch(NamedTuple):
+    merchant: Merchant
+    exact: bool
+
+
+def normalize(text: str) -> str:
+    """统一大小写并去掉空格和标点：'Trip.com' -> 'tripcom'，'7-Eleven' -> '7eleven'"""
+    return ''.join(ch for ch in text.lower() if ch.isalnum())
+
+
+class MerchantIndex:
+    """字符 trie：每个节点是 {字符: 子节点}，_END 键保存以该节点结尾的商户"""
+    _END = ''
+
+    def __init__(self):
+        self._root: Dict[str, dict] = {}
+        self.size = 0
+
+    def insert(self, key: str, merchant: Merchant):
+        key = normalize(key)
+        if not key:
+            return
+        node = self._root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node.setdefault(self._END, (key, merchant))
+        self.size += 1
+
+    def lookup(self, text: str) -> Optional[MerchantMatch]:
+        key = normalize(text)
+        node, deepest, depth, best = self._root, self._root, 0, None
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                break
+            deepest, depth = node, depth + 1
+            if self._END in node:
+                best = node[self._END][1]
+        if best:
+            return MerchantMatch(best, True)
+        if depth == 0:
+            return None
+        return self._fuzzy(key, deepest)
+
+    def _terminals(self, node: dict) -> Iterator[tuple]:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for ch, child in current.items():
+                if ch == self._END:
+                    yield child
+                else:
+                    stack.append(child)
+
+    def _fuzzy(self, key: str, node: dict) -> Optional[MerchantMatch]:
+        best, best_ratio = None, FUZZY_CUTOFF
+        for i, (candidate, merchant) in enumerate(self._terminals(node)):
+            if i >= MAX_FUZZY_CANDIDATES:
+                break
+            ratio = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if ratio > best_ratio:
+                best, best_ratio = merchant, ratio
+        return MerchantMatch(best, False) if best else None
+
+
+class _Dictionary(NamedTuple):
+    index: MerchantIndex
+    currencies: Dict[str, str]   # 名称/符号 -> 币种代码
+    rates: Dict[str, float]      # 币种代码 -> 折合人民币的汇率
+
+
+_dictionary: Optional[_Dictionary] = None
+_load_lock = threading.Lock()
+
+def _load() -> _Dictionary:
+    global _dictionary
+    if _dictionary is None:
+        with _load_lock:
+            if _dictionary is None:
+                with open(MERCHANTS_FILE, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                index = MerchantIndex()
+                for entry in data['merchants']:
+                    merchant = Merchant(entry['name'], entry['category'], entry['region'])
+                    for key in [entry['name'], *entry.get('aliases', [])]:
+                        index.insert(key, merchant)
+                currencies = {code.lower(): code for code in data['currencies']}
+                rates = {}
+                for code, info in data['currencies'].items():
+                    rates[code] = info['rate']
+                    currencies.update({name.lower(): code for name in info['names']})
+                _dictionary = _Dictionary(index, currencies, rates)
+                logging.info(f"商户词典已加载: {len(data['merchants'])} 个商户，{index.size} 个名称")
+    return _dictionary
+
+def resolve(text: str) -> Optional[MerchantMatch]:
+    """把自由文本解析为商户；精确命中时 exact 为 True，模糊匹配时为 False"""
+    return _load().index.lookup(text)
+
+def parse_currency(text: str) -> Optional[str]:
+    """把币种名称或符号（'USD'、'美元'、'$'）转换为币种代码，无法识别返回 None"""
+    return _load().currencies.get(text.strip().lower()) if text else None
+
+def to_local_cents(amount_cents: int, currency: Optional[str]) -> int:
+    """按词典中的参考汇率折合为人民币（分），仅用于额度与返现估算"""
+    if not currency or currency == LOCAL_CURRENCY:
+        return amount_cents
+    return round(amount_cents * _load().rates.get(currency, 1.0))
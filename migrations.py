@@ -0,0 +1,291 @@
+# migrations.py
+"""
+数据库结构迁移：以 PRAGMA user_version 记录当前版本，启动时按顺序应用未执行的迁移。
+
+所有待执行的迁移在同一个事务中完成，任何一步失败都会整体回滚，user_version 保持不变。
+新增迁移只需在文件末尾追加一个带 @migration(版本号, 说明) 装饰的函数，版本号必须递增。
+"""
+import logging
+import sqlite3
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+MIGRATIONS: List[Migration] = []
+
+def migration(version: int, description: str):
+    """注册一个迁移。版本号必须严格递增，避免合并代码时出现重复版本"""
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"迁移版本号必须递增: {version} <= {MIGRATIONS[-1].version}")
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return decorator
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+def run_migrations(conn: sqlite3.Connection) -> List[dict]:
+    """
+    应用所有待执行的迁移，返回每个迁移的耗时报告。
+    数据库版本高于代码已知的最新版本时拒绝启动，防止旧代码写坏新结构。
+    """
+    current = get_schema_version(conn)
+    if current > latest_version():
+        raise RuntimeError(f"数据库结构版本 {current} 高于程序支持的版本 {latest_version()}，请升级程序。")
+
+    pending = [m for m in MIGRATIONS if m.version > current]
+    if not pending:
+        return []
+
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # 手动管理事务，DDL 也纳入同一事务
+    report = []
+    started = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for m in pending:
+            step_started = time.perf_counter()
+            m.apply(conn)
+            elapsed = time.perf_counter() - step_started
+            report.append({'version': m.version, 'description': m.description, 'seconds': round(elapsed, 4)})
+            logging.info(f"迁移 {m.version}（{m.description}）完成，耗时 {elapsed:.3f}s")
+        conn.execute(f"PRAGMA user_version = {pending[-1].version}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        logging.error(f"数据库迁移失败，已回滚到版本 {current}")
+        raise
+    finally:
+        conn.isolation_level = previous_isolation
+
+    logging.info(
+        f"数据库结构已从版本 {current} 升级到 {pending[-1].version}，"
+        f"共 {len(pending)} 个迁移，总耗时 {time.perf_counter() - started:.3f}s"
+    )
+    return report
+
+def rebuild_table(
+    conn: sqlite3.Connection,
+    table: str,
+    create_sql: str,
+    select_sql: Optional[str] = None,
+    indexes: Optional[List[str]] = None,
+    batch_size: int = 5000,
+):
+    """
+    分批重建表，用于 SQLite 无法直接 ALTER 的变更（修改约束、调整列类型等）。
+
+    create_sql 使用占位符 {table} 作为新表名；select_sql 是从旧表取数的 SELECT 列表
+    （默认 *，需与新表列顺序一致）。数据按 rowid 分批复制，避免一次性把大表读入内存，
+    每批输出进度。须在 run_migrations 的事务中调用。
+    """
+    new_table = f"{table}__rebuild"
+    conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+    conn.execute(create_sql.format(table=new_table))
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    copied = 0
+    last_rowid = -1
+    while True:
+        row = conn.execute(
+            f"SELECT MAX(rowid), COUNT(*) FROM "
+            f"(SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+            (last_rowid, batch_size)
+        ).fetchone()
+        if not row[1]:
+            break
+        batch_end = row[0]
+        conn.execute(
+            f"INSERT INTO {new_table} SELECT {select_sql or '*'} FROM {table} WHERE rowid > ? AND rowid <= ?",
+            (last_rowid, batch_end)
+        )
+        copied += row[1]
+        last_rowid = batch_end
+        logging.info(f"重建表 {table}: {copied}/{total}")
+
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    for index_sql in indexes or []:
+        conn.execute(index_sql)
+
+
+# --- 迁移列表（只能追加，不要修改已发布的迁移） ---
+
+@migration(1, "创建 cards 表")
+def _create_cards_table(conn: sqlite3.Connection):
+    # 旧版本的 init_db 已经建过同样的表，IF NOT EXISTS 让存量数据库直接升到版本 1
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nickname TEXT NOT NULL UNIQUE,
+        last_four_digits TEXT,
+        bank_name TEXT,
+        statement_day INTEGER NOT NULL,
+        statement_day_inclusive BOOLEAN NOT NULL,
+        due_date_type TEXT NOT NULL CHECK(due_date_type IN ('fixed_day', 'days_after')),
+        due_date_value INTEGER NOT NULL,
+        currency_type TEXT NOT NULL,
+        annual_fee_amount INTEGER DEFAULT 0,
+        annual_fee_date TEXT,
+        has_waiver BOOLEAN DEFAULT FALSE,
+        is_waived_for_cycle BOOLEAN DEFAULT FALSE,
+        waiver_reset_date DATE
+    )
+    """)
+
+@migration(2, "消费流水与按账单周期汇总表")
+def _create_ledger_tables(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        spent_on DATE NOT NULL,
+        statement_date DATE NOT NULL,
+        note TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_card_cycle ON transactions (card_id, statement_date)")
+    # 每张卡每个账单周期一行，记账时增量维护，查询账单金额无需扫描流水
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cycle_totals (
+        card_id INTEGER NOT NULL,
+        statement_date DATE NOT NULL,
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        txn_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (card_id, statement_date)
+    ) WITHOUT ROWID
+    """)
+
+@migration(3, "信用额度、还款记录与未还余额")
+def _add_credit_limits(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE cards ADD COLUMN credit_limit INTEGER DEFAULT 0")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS repayments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        paid_on DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_repayments_card ON repayments (card_id)")
+    # 每张卡的未还余额（消费 - 还款），随记账和还款增量维护
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS card_balances (
+        card_id INTEGER PRIMARY KEY,
+        balance_cents INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("""
+    INSERT OR REPLACE INTO card_balances (card_id, balance_cents)
+    SELECT card_id, SUM(amount_cents) FROM transactions GROUP BY card_id
+    """)
+
+@migration(4, "返现规则与消费类别")
+def _add_reward_rules(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE transactions ADD COLUMN category TEXT")
+    # rate_bp 以万分之一为单位（150 = 1.5%）；category 为 '*' 表示全部类别
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reward_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        rate_bp INTEGER NOT NULL CHECK(rate_bp > 0),
+        cap_cents INTEGER,
+        min_spend_cents INTEGER NOT NULL DEFAULT 0,
+        starts_on DATE,
+        ends_on DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reward_rules_card ON reward_rules (card_id)")
+
+@migration(5, "还款日节假日调整方式")
+def _add_due_date_adjustment(conn: sqlite3.Connection):
+    # none：不调整；next：顺延至下一工作日；previous：提前至上一工作日
+    conn.execute(
+        "ALTER TABLE cards ADD COLUMN due_date_adjustment TEXT DEFAULT 'none' "
+        "CHECK(due_date_adjustment IN ('none', 'next', 'previous'))"
+    )
+
+@migration(6, "分期计划与还款计划表")
+def _add_installments(conn: sqlite3.Connection):
+    # fee_rate_bp 为每期手续费率（万分之一，60 = 0.6%），按本金计
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS installment_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id INTEGER NOT NULL,
+        principal_cents INTEGER NOT NULL CHECK(principal_cents > 0),
+        periods INTEGER NOT NULL CHECK(periods > 0),
+        fee_rate_bp INTEGER NOT NULL DEFAULT 0,
+        first_statement_date DATE NOT NULL,
+        note TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # 建计划时一次性展开的每期应还，按 (卡片, 账单日) 查询当期应还走索引
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS installment_payments (
+        plan_id INTEGER NOT NULL,
+        period_no INTEGER NOT NULL,
+        card_id INTEGER NOT NULL,
+        statement_date DATE NOT NULL,
+        principal_cents INTEGER NOT NULL,
+        fee_cents INTEGER NOT NULL,
+        PRIMARY KEY (plan_id, period_no)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_installment_payments_card_cycle ON installment_payments (card_id, statement_date)")
+
+@migration(7, "cards 表按用户分区")
+def _partition_cards_by_user(conn: sqlite3.Connection):
+    # 别名改为按用户唯一；已有卡片归到 user_id 0，启动时转给管理员（database.adopt_default_user_cards）
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cards'").fetchone()
+    rebuild_table(conn, "cards", """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nickname TEXT NOT NULL,
+        last_four_digits TEXT,
+        bank_name TEXT,
+        statement_day INTEGER NOT NULL,
+        statement_day_inclusive BOOLEAN NOT NULL,
+        due_date_type TEXT NOT NULL CHECK(due_date_type IN ('fixed_day', 'days_after')),
+        due_date_value INTEGER NOT NULL,
+        currency_type TEXT NOT NULL,
+        annual_fee_amount INTEGER DEFAULT 0,
+        annual_fee_date TEXT,
+        has_waiver BOOLEAN DEFAULT FALSE,
+        is_waived_for_cycle BOOLEAN DEFAULT FALSE,
+        waiver_reset_date DATE,
+        credit_limit INTEGER DEFAULT 0,
+        due_date_adjustment TEXT DEFAULT 'none' CHECK(due_date_adjustment IN ('none', 'next', 'previous')),
+        user_id INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (user_id, nickname)
+    )
+    """, select_sql="*, 0")
+    if row:
+        # 保留自增序号，已删除卡片的 id 不会被新卡片复用
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'cards'", (row[0],))
+
+@migration(8, "家庭共享成员表")
+def _add_household_members(conn: sqlite3.Connection):
+    # 每个用户最多加入一个家庭；owner_id 即共享卡片所属的 user_id，户主本人不在表中
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS household_members (
+        member_id INTEGER PRIMARY KEY,
+        owner_id INTEGER NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('editor', 'viewer')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_household_members_owner ON household_members (owner_id)")
@@ -0,0 +1,172 @@
+# optimizer.py
+"""
+账单日优化建议：为选定的几张卡重新分配账单日（1-28），
+使整个组合在未来一年里"每天能用到的最长免息期"的最差一天最长，其次平均值最高。
+
+每张卡、每个候选账单日的一年免息期序列用 core_logic.build_period_column 预计算（与 get_interest_free_period 一致），
+组合的免息期是这些序列的逐日最大值（上包络）。搜索是分支定界：
+先用贪心 + 逐卡调整得到一个较好的初始解，再深度优先枚举。剪枝依据：
+- 上界：已定卡的包络 ∨ 剩余卡所有候选的包络；总和再与"剩余各卡单独加入的最大增量之和"取较小值；
+- 同一层中包络相同或被另一个候选逐日不劣于的分支直接丢弃；
+- 规则完全相同的卡互换账单日结果不变，只枚举非递减的分配。
+节点数或耗时超过上限时返回当前最优解，并标记为近似。
+"""
+import time
+from datetime import date
+from typing import Dict, List, NamedTuple, Tuple
+
+import core_logic
+
+STATEMENT_DAYS = range(1, 29)
+HORIZON_DAYS = 365
+NODE_LIMIT = 50000   # 搜索节点上限，超过后返回当前最优解并标记为近似
+TIME_LIMIT = 3.0     # 搜索耗时上限（秒），同上
+
+
+class Assignment(NamedTuple):
+    card: Dict
+    current_day: int
+    suggested_day: int
+
+
+class OptimizationResult(NamedTuple):
+    assignments: List[Assignment]
+    current_worst: int
+    current_average: float
+    best_worst: int
+    best_average: float
+    nodes: int
+    exact: bool
+    seconds: float
+
+
+def period_column(card: Dict, statement_day: int, start: date, days: int = HORIZON_DAYS) -> List[int]:
+    """该卡账单日改为 statement_day 后，start 起每天消费的免息天数"""
+    return core_logic.build_period_column({**card, 'statement_day': statement_day}, start, days)
+
+def envelope(columns: List[List[int]], days: int = HORIZON_DAYS) -> List[int]:
+    """逐日最大值；没有任何列时为全 0"""
+    return list(map(max, *columns)) if len(columns) > 1 else list(columns[0]) if columns else [0] * days
+
+def score(column: List[int]) -> Tuple[int, int]:
+    """目标值：(最差一天的免息期, 一年免息期之和)，按元组比较"""
+    return min(column), sum(column)
+
+def _rule_key(card: Dict) -> Tuple:
+    return (card['statement_day_inclusive'], card['due_date_type'], card['due_date_value'], card.get('due_date_adjustment'))
+
+
+def optimize(cards: List[Dict], selected: List[Dict], start: date = None, node_limit: int = NODE_LIMIT,
+             time_limit: float = TIME_LIMIT) -> OptimizationResult:
+    """为 selected 中的卡寻找最优账单日；cards 中其余的卡保持不变，作为组合的一部分"""
+    started = time.perf_counter()
+    start = start or date.today()
+    selected_ids = {card['id'] for card in selected}
+    fixed_columns = [period_column(card, card['statement_day'], start) for card in cards if card['id'] not in selected_ids]
+    base = envelope(fixed_columns)
+
+    # 规则相同的卡放在一起，候选列只算一次
+    selected = sorted(selected, key=_rule_key)
+    columns_by_rule: Dict[Tuple, List[List[int]]] = {}
+    for card in selected:
+        key = _rule_key(card)
+        if key not in columns_by_rule:
+            columns_by_rule[key] = [period_column(card, day, start) for day in STATEMENT_DAYS]
+    candidates = [columns_by_rule[_rule_key(card)] for card in selected]
+    k = len(selected)
+
+    current = score(envelope([base] + [candidates[i][card['statement_day'] - 1] for i, card in enumerate(selected)]))
+
+    # 剩余卡的上界包络：suffix_upper[i] = 第 i 张及之后所有卡所有候选列的逐日最大值
+    suffix_upper = [None] * (k + 1)
+    suffix_upper[k] = [0] * HORIZON_DAYS
+    for i in range(k - 1, -1, -1):
+        suffix_upper[i] = envelope([suffix_upper[i + 1]] + candidates[i])
+
+    # 初始解：贪心逐张选择，再逐卡调整直到不再改进
+    choice = []
+    env = base
+    for i in range(k):
+        best_day = max(range(len(STATEMENT_DAYS)), key=lambda d: score(envelope([env, candidates[i][d]])))
+        choice.append(best_day)
+        env = envelope([env, candidates[i][best_day]])
+    best_score = score(env)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(k):
+            others = envelope([base] + [candidates[j][choice[j]] for j in range(k) if j != i])
+            for d in range(len(STATEMENT_DAYS)):
+                trial = score(envelope([others, candidates[i][d]]))
+                if trial > best_score:
+                    best_score, choice[i], improved = trial, d, True
+    best_choice = list(choice)
+
+    # 分支定界
+    nodes = 0
+    exact = True
+    deadline = started + time_limit
+    path = [0] * k
+
+    def remaining_gain(i: int, env: List[int]) -> int:
+        """第 i 张及之后的卡各自单独加入时能带来的最大增量之和，是它们一起加入时增量的上界"""
+        total = 0
+        for j in range(i, k):
+            total += max(sum(map(max, env, column)) for column in candidates[j])
+        return total - (k - i) * sum(env)
+
+    def search(i: int, env: List[int], min_day: int):
+        nonlocal nodes, best_score, best_choice, exact
+        if i == k:
+            s = score(env)
+            if s > best_score:
+                best_score, best_choice = s, list(path)
+            return
+        children = []
+        seen = set()
+        for d in range(min_day, len(STATEMENT_DAYS)):
+            nodes += 1
+            if nodes > node_limit or time.perf_counter() > deadline:
+                exact = False
+                return
+            child = list(map(max, env, candidates[i][d]))
+            key = tuple(child)
+            if key in seen:
+                continue  # 不同账单日得到相同的包络，只保留一个
+            seen.add(key)
+            upper = list(map(max, child, suffix_upper[i + 1]))
+            bound = (min(upper), sum(upper))
+            if bound > best_score:
+                children.append((bound, d, child))
+        # 被另一个候选逐日不劣于的包络不可能更优，剔除
+        children.sort(key=lambda c: c[0], reverse=True)
+        kept = []
+        for bound, d, child in children:
+            if not any(all(map(int.__ge__, other, child)) for _, _, other in kept):
+                kept.append((bound, d, child))
+        gain = remaining_gain(i + 1, env) if i + 1 < k and kept else 0
+        for bound, d, child in kept:
+            if bound <= best_score:
+                break
+            if i + 1 < k and (bound[0], min(bound[1], sum(child) + gain)) <= best_score:
+                continue
+            path[i] = d
+            same_rule_next = i + 1 < k and _rule_key(selected[i + 1]) == _rule_key(selected[i])
+            search(i + 1, child, d if same_rule_next else 0)
+            if not exact:
+                return
+
+    if k:
+        search(0, base, 0)
+
+    assignments = [Assignment(card, card['statement_day'], STATEMENT_DAYS[best_choice[i]]) for i, card in enumerate(selected)]
+    return OptimizationResult(
+        assignments=assignments,
+        current_worst=current[0],
+        current_average=current[1] / HORIZON_DAYS,
+        best_worst=best_score[0],
+        best_average=best_score[1] / HORIZON_DAYS,
+        nodes=nodes,
+        exact=exact,
+        seconds=time.perf_counter() - started,
+    )
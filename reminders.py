@@ -0,0 +1,134 @@
+# reminders.py
+"""
+还款日 / 账单日提醒：每个事件日期的每个提前量（如 D-3、D-1、当天）是一个独立的 JobQueue 定时任务，
+在准确的时间触发，不做每日轮询。
+
+同一用户同一天还款（或出账）的多张卡共用一组任务，触发时合并为一条消息发到该用户的私聊。
+调度器记录每张卡当前登记的事件日期：卡片增删改时只重新登记这一张卡，
+某个日期不再有卡片时撤销它的任务；事件的最后一次提醒发出后，把涉及的卡登记到下一期。
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import core_logic
+
+TIMEZONE = ZoneInfo('Asia/Shanghai')
+DUE = 'due'
+STATEMENT = 'statement'
+
+
+class ReminderSettings(NamedTuple):
+    due_offsets: Tuple[int, ...]        # 还款日前几天提醒，0 为当天
+    statement_offsets: Tuple[int, ...]  # 账单日前几天提醒
+    at: time                            # 提醒时间（北京时间）
+
+    @classmethod
+    def from_config(cls, notification_config: Dict, at: time) -> 'ReminderSettings':
+        def offsets(key, default):
+            values = notification_config.get(key)
+            values = default if values is None else values
+            return tuple(sorted({int(v) for v in values if int(v) >= 0}, reverse=True))
+        return cls(offsets('due_reminder_days', [3, 1, 0]), offsets('statement_reminder_days', [1]), at)
+
+    def offsets_for(self, kind: str) -> Tuple[int, ...]:
+        return self.due_offsets if kind == DUE else self.statement_offsets
+
+
+class ReminderJob(NamedTuple):
+    """定时任务的 data：哪位用户、哪类事件、哪一天、提前几天"""
+    user_id: int
+    kind: str
+    day: date
+    offset: int
+
+
+def next_event_date(card: Dict, kind: str, start: date) -> date:
+    if kind == DUE:
+        return core_logic.get_next_due_date(card, start)
+    return core_logic.get_next_calendar_statement_date(start, card['statement_day'])
+
+
+class ReminderScheduler:
+    def __init__(self, job_queue, settings: ReminderSettings, callback: Callable):
+        self.job_queue = job_queue
+        self.settings = settings
+        self.callback = callback
+        self._events: Dict[Tuple[int, str, date], Dict[int, Dict]] = {}  # (用户, 类型, 日期) -> card_id -> 卡片
+        self._armed: Dict[Tuple[str, int], Tuple[int, str, date]] = {}   # (类型, card_id) -> 已登记的事件
+        self._jobs: Dict[Tuple[int, str, date], list] = {}               # (用户, 类型, 日期) -> 定时任务
+
+    def _fire_at(self, day: date, offset: int) -> datetime:
+        return datetime.combine(day - timedelta(days=offset), self.settings.at, tzinfo=TIMEZONE)
+
+    def _upcoming_event(self, card: Dict, kind: str, now: datetime) -> Optional[date]:
+        """下一个还有提醒未发出的事件日期；当天的提醒时间已过则看下一期"""
+        offsets = self.settings.offsets_for(kind)
+        if not offsets:
+            return None
+        day = next_event_date(card, kind, now.date())
+        if self._fire_at(day, min(offsets)) <= now:
+            day = next_event_date(card, kind, day + timedelta(days=1))
+        return day
+
+    def _schedule(self, event: Tuple[int, str, date], now: datetime):
+        user_id, kind, day = event
+        jobs = []
+        for offset in self.settings.offsets_for(kind):
+            when = self._fire_at(day, offset)
+            if when > now:
+                jobs.append(self.job_queue.run_once(
+                    self.callback, when, data=ReminderJob(user_id, kind, day, offset),
+                    chat_id=user_id, user_id=user_id,
+                    name=f"reminder:{user_id}:{kind}:{day.isoformat()}:{offset}"
+                ))
+        self._jobs[event] = jobs
+
+    def _unregister(self, kind: str, card_id: int):
+        event = self._armed.pop((kind, card_id), None)
+        if event is None:
+            return
+        cards = self._events.get(event, {})
+        cards.pop(card_id, None)
+        if not cards:
+            # 这一天不再有卡片，撤销整组任务
+            self._events.pop(event, None)
+            for job in self._jobs.pop(event, []):
+                job.schedule_removal()
+
+    def arm_card(self, card: Dict, now: datetime = None):
+        """登记（或重新登记）一张卡的下一个还款日和账单日"""
+        now = now or datetime.now(TIMEZONE)
+        for kind in (DUE, STATEMENT):
+            self._unregister(kind, card['id'])
+            day = self._upcoming_event(card, kind, now)
+            if day is None:
+                continue
+            event = (card['user_id'], kind, day)
+            self._armed[(kind, card['id'])] = event
+            if event not in self._events:
+                self._events[event] = {}
+                self._schedule(event, now)
+            self._events[event][card['id']] = card
+
+    def disarm_card(self, card_id: int):
+        for kind in (DUE, STATEMENT):
+            self._unregister(kind, card_id)
+
+    def arm_all(self, cards: List[Dict]):
+        now = datetime.now(TIMEZONE)
+        for card in cards:
+            self.arm_card(card, now)
+        logging.info(f"已登记 {len(cards)} 张卡的提醒，共 {sum(len(jobs) for jobs in self._jobs.values())} 个定时任务")
+
+    def cards_for(self, job: ReminderJob) -> List[Dict]:
+        return list(self._events.get((job.user_id, job.kind, job.day), {}).values())
+
+    def job_fired(self, job: ReminderJob):
+        """事件的最后一次提醒发出后，把涉及的卡登记到下一期"""
+        if job.offset != min(self.settings.offsets_for(job.kind)):
+            return
+        now = max(datetime.now(TIMEZONE), self._fire_at(job.day, job.offset))
+        for card in self.cards_for(job):
+            self.arm_card(card, now)
@@ -0,0 +1,191 @@
+# rewards.py
+"""
+返现规则引擎：把数据库中的返现规则在加载时编译为按类别索引的结构，
+/ask 对每张卡的预期回报只需一次字典查找和少量比较。
+
+规则之间不叠加：同一笔消费在一张卡上只取回报最高的一条适用规则。
+每期上限按当前账单周期内同类别已记账的消费估算已用额度。
+"""
+import heapq
+import logging
+import threading
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import core_logic
+import database as db
+
+ALL_CATEGORIES = '*'
+
+# 类别键 -> 展示名称
+CATEGORIES = {
+    'dining': '餐饮',
+    'grocery': '商超',
+    'online': '网购',
+    'travel': '旅行',
+    'transport': '交通',
+    'fuel': '加油',
+    'entertainment': '娱乐',
+    'overseas': '境外',
+    ALL_CATEGORIES: '全部',
+}
+
+# 常见的中文说法，解析用户输入时使用
+CATEGORY_ALIASES = {
+    '吃饭': 'dining', '美食': 'dining', '外卖': 'dining', '餐厅': 'dining',
+    '超市': 'grocery', '便利店': 'grocery',
+    '淘宝': 'online', '京东': 'online', '网上': 'online',
+    '机票': 'travel', '酒店': 'travel',
+    '地铁': 'transport', '打车': 'transport', '出行': 'transport',
+    '油费': 'fuel',
+    '电影': 'entertainment',
+    '海外': 'overseas', '外币': 'overseas',
+    '通用': ALL_CATEGORIES,
+}
+
+
+def parse_category(text: str) -> Optional[str]:
+    """把用户输入的类别（键名、中文名或别名）转换为类别键，无法识别返回 None"""
+    if not text:
+        return None
+    text = text.strip().lower()
+    if text in CATEGORIES:
+        return text
+    for key, name in CATEGORIES.items():
+        if text == name:
+            return key
+    return CATEGORY_ALIASES.get(text)
+
+def category_name(category: Optional[str]) -> str:
+    return CATEGORIES.get(category, category or '未分类')
+
+
+class RewardRule(NamedTuple):
+    id: int
+    card_id: int
+    category: str
+    rate_bp: int
+    cap_cents: Optional[int]
+    min_spend_cents: int
+    starts_on: Optional[date]
+    ends_on: Optional[date]
+
+    @classmethod
+    def from_row(cls, row: Dict) -> 'RewardRule':
+        return cls(
+            id=row['id'],
+            card_id=row['card_id'],
+            category=row['category'],
+            rate_bp=row['rate_bp'],
+            cap_cents=row['cap_cents'],
+            min_spend_cents=row['min_spend_cents'] or 0,
+            starts_on=date.fromisoformat(row['starts_on']) if row['starts_on'] else None,
+            ends_on=date.fromisoformat(row['ends_on']) if row['ends_on'] else None,
+        )
+
+    def active_on(self, day: date) -> bool:
+        return (self.starts_on is None or self.starts_on <= day) and (self.ends_on is None or day <= self.ends_on)
+
+    def describe(self) -> str:
+        text = f"{category_name(self.category)} {self.rate_bp / 100:g}%"
+        if self.cap_cents:
+            text += f"，每期上限 ¥{self.cap_cents / 100:g}"
+        if self.min_spend_cents:
+            text += f"，单笔满 ¥{self.min_spend_cents / 100:g}"
+        if self.starts_on or self.ends_on:
+            text += f"，{self.starts_on or '不限'} ~ {self.ends_on or '不限'}"
+        return text
+
+
+class RewardQuote(NamedTuple):
+    """单张卡对一笔消费的预期回报"""
+    reward_cents: int
+    rule: Optional[RewardRule]
+
+
+class RewardEngine:
+    """按类别编译好的规则索引：category -> card_id -> [规则]，每个列表按比例从高到低排序"""
+
+    def __init__(self, rules: List[RewardRule]):
+        self._index: Dict[str, Dict[int, List[RewardRule]]] = {}
+        for rule in sorted(rules, key=lambda r: r.rate_bp, reverse=True):
+            self._index.setdefault(rule.category, {}).setdefault(rule.card_id, []).append(rule)
+        self.rule_count = len(rules)
+
+    @classmethod
+    def from_db(cls) -> 'RewardEngine':
+        return cls([RewardRule.from_row(row) for row in db.get_reward_rules()])
+
+    def has_rules(self) -> bool:
+        return self.rule_count > 0
+
+    def candidates(self, card_id: int, category: Optional[str]) -> List[RewardRule]:
+        """适用于该类别的规则（本类别与全部类别），按比例从高到低"""
+        general = self._index.get(ALL_CATEGORIES, {}).get(card_id, [])
+        if not category or category == ALL_CATEGORIES:
+            return general
+        specific = self._index.get(category, {}).get(card_id, [])
+        if not general or not specific:
+            return specific or general
+        return list(heapq.merge(specific, general, key=lambda r: r.rate_bp, reverse=True))
+
+    def quote(self, card_id: int, category: Optional[str], amount_cents: int, day: date,
+              cycle_spend: Dict[Optional[str], int] = None) -> RewardQuote:
+        """
+        计算一笔消费在该卡上的预期回报。
+        cycle_spend 为本账单周期内按类别汇总的已记账消费，用于扣减每期上限。
+        """
+        best = RewardQuote(0, None)
+        for rule in self.candidates(card_id, category):
+            if rule.rate_bp * amount_cents <= best.reward_cents * 10000:
+                break  # 已按比例降序，后面的规则不可能更好
+            if amount_cents < rule.min_spend_cents or not rule.active_on(day):
+                continue
+            reward = amount_cents * rule.rate_bp // 10000
+            if rule.cap_cents is not None:
+                reward = min(reward, max(rule.cap_cents - self._used_cents(rule, cycle_spend), 0))
+            if reward > best.reward_cents:
+                best = RewardQuote(reward, rule)
+        return best
+
+    @staticmethod
+    def _used_cents(rule: RewardRule, cycle_spend: Optional[Dict[Optional[str], int]]) -> int:
+        if not cycle_spend:
+            return 0
+        if rule.category == ALL_CATEGORIES:
+            spent = sum(cycle_spend.values())
+        else:
+            spent = cycle_spend.get(rule.category, 0)
+        return spent * rule.rate_bp // 10000
+
+
+_engines: Dict[int, Tuple[Tuple[int, int], RewardEngine]] = {}   # user_id -> ((卡片数据版本, 记账版本), 引擎)
+_engines_lock = threading.Lock()
+
+def get_engine() -> RewardEngine:
+    """返回当前用户编译好的规则引擎；规则增删会递增记账版本，删卡会递增卡片数据版本，任一变化后重新编译"""
+    user_id = db.current_user()
+    # 先取版本再读规则：期间有写入时，这个引擎只会被当作旧版本
+    key = (db.get_data_version(), db.get_ledger_version())
+    cached = _engines.get(user_id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    engine = RewardEngine.from_db()
+    with _engines_lock:
+        _engines[user_id] = (key, engine)
+    logging.debug(f"用户 {user_id} 的返现规则已编译: {engine.rule_count} 条")
+    return engine
+
+def invalidate():
+    """规则变更后调用，当前用户下次使用时重新编译"""
+    with _engines_lock:
+        _engines.pop(db.current_user(), None)
+
+def cycle_spend_for(cards: List[Dict], day: date) -> Dict[int, Dict[Optional[str], int]]:
+    """一次查询取出每张卡当前账单周期按类别的已记账消费"""
+    keys: List[Tuple[int, date]] = [
+        (card['id'], core_logic.get_statement_date_for_purchase(day, card['statement_day'], card['statement_day_inclusive']))
+        for card in cards
+    ]
+    spend = db.get_category_cycle_spend(keys)
+    return {card_id: spend.get((card_id, stmt), {}) for card_id, stmt in keys}
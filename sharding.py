@@ -0,0 +1,148 @@
+# sharding.py
+"""
+分片部署：一个前端进程轮询更新，按卡片组合（家庭户主的 user_id）取模路由到 N 个 worker 进程。
+
+每个 worker 运行完整的 Application（与单进程部署相同的处理器），只负责自己分片的用户：
+这些用户的会话状态、缓存、每日任务和还款提醒都在该 worker 中。同一用户的更新总是进入同一个
+worker 的先进先出队列，worker 逐个处理，ConversationHandler 的状态因此保持一致。
+家庭成员与户主路由到同一个 worker，同一组卡片只有一个进程写入，内存中的余额索引不会过期。
+
+各进程共用同一个磁盘 SQLite 数据库（WAL 模式），分片部署不支持内存存储后端。
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot, Update
+from telegram.ext import Updater
+
+import config
+import database as db
+import households
+
+HOUSEHOLDS_CHANGED = 'households_changed'   # worker -> 前端 -> 所有 worker：家庭成员关系已变更，重新载入
+
+# 本进程负责的分片 (序号, 总数)；单进程部署时为 None，所有用户都归本进程
+_local_shard: Optional[Tuple[int, int]] = None
+
+
+def worker_count(sharding_config: Optional[Dict]) -> int:
+    """worker 进程数，优先使用环境变量 CARD_BOT_WORKERS；1 表示单进程部署"""
+    value = os.getenv('CARD_BOT_WORKERS') or (sharding_config or {}).get('workers') or 1
+    try:
+        return max(int(value), 1)
+    except ValueError:
+        raise ValueError(f"worker 数量必须是整数: {value!r}")
+
+def shard_for(portfolio_id: int, count: int) -> int:
+    return portfolio_id % count
+
+def owns(portfolio_id: int) -> bool:
+    """本进程是否负责该卡片组合（定时任务据此只处理自己分片的用户）"""
+    return _local_shard is None or shard_for(portfolio_id, _local_shard[1]) == _local_shard[0]
+
+def route_key(update: Update) -> int:
+    """路由依据：发送者所属家庭的户主；没有发送者的更新按聊天路由"""
+    if update.effective_user:
+        return households.resolve(update.effective_user.id).portfolio_id
+    return update.effective_chat.id if update.effective_chat else 0
+
+
+# --- worker ---
+def _worker_entry(index: int, count: int, inbox, control, db_path: str, base_url: Optional[str]):
+    # Ctrl+C 由前端统一处理，worker 收到队列中的 None 后退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, count, inbox, control, db_path, base_url))
+
+async def _run_worker(index: int, count: int, inbox, control, db_path: str, base_url: Optional[str]):
+    global _local_shard
+    _local_shard = (index, count)
+    import main as bot_main  # main 在模块级导入本模块，这里延迟导入
+
+    db.configure(db.SQLiteBackend.name, db_path)
+    households.on_change(lambda: control.put(HOUSEHOLDS_CHANGED))
+    application = bot_main.build_application(base_url=base_url)
+    await application.initialize()
+    bot_main.schedule_jobs(application, include_backup=(index == 0))
+    await application.start()
+    logging.info(f"worker {index + 1}/{count} 已启动")
+    try:
+        while True:
+            message = await asyncio.to_thread(inbox.get)
+            if message is None:
+                break
+            if message == HOUSEHOLDS_CHANGED:
+                households.invalidate()
+                continue
+            await application.update_queue.put(Update.de_json(json.loads(message), application.bot))
+    finally:
+        await application.stop()
+        await application.shutdown()
+        logging.info(f"worker {index + 1}/{count} 已停止")
+
+
+# --- 前端 ---
+async def _relay_control(control, inboxes: List):
+    """把 worker 发来的家庭变更通知转发给所有 worker，并刷新前端自己的路由表"""
+    while True:
+        message = await asyncio.to_thread(control.get)
+        if message is None:
+            return
+        if message == HOUSEHOLDS_CHANGED:
+            households.invalidate()
+            for inbox in inboxes:
+                inbox.put(message)
+
+async def run_front(workers: int, base_url: Optional[str] = None):
+    """启动 worker 进程并轮询更新，直到被取消或收到中断"""
+    backend = db.get_backend()
+    if not isinstance(backend, db.SQLiteBackend) or isinstance(backend, db.SharedMemorySQLiteBackend):
+        raise ValueError("分片部署需要多个进程共用磁盘数据库，请使用 sqlite 存储后端")
+    with backend.connect() as conn:
+        # WAL 允许多个 worker 进程并发读，写入互不阻塞读取
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    ctx = multiprocessing.get_context('spawn')
+    control = ctx.Queue()
+    inboxes = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(target=_worker_entry, name=f"card-bot-worker-{i}",
+                    args=(i, workers, inboxes[i], control, str(backend.path), base_url))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logging.info(f"分片部署：已启动 {workers} 个 worker 进程")
+
+    token = config.config['telegram']['bot_token']
+    if base_url:
+        bot = Bot(token, base_url=f"{base_url}/bot", base_file_url=f"{base_url}/file/bot")
+    else:
+        bot = Bot(token)
+    updates: asyncio.Queue = asyncio.Queue()
+    relay = asyncio.create_task(_relay_control(control, inboxes))
+    try:
+        async with Updater(bot, updates) as updater:
+            await updater.start_polling()
+            try:
+                while True:
+                    update = await updates.get()
+                    shard = shard_for(route_key(update), workers)
+                    if not processes[shard].is_alive():
+                        logging.error(f"worker {shard + 1}/{workers} 已退出（exitcode={processes[shard].exitcode}），该分片的更新将积压")
+                    inboxes[shard].put(update.to_json())
+            finally:
+                await updater.stop()
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+        logging.info("前端收到停止信号")
+    finally:
+        for inbox in inboxes:
+            inbox.put(None)
+        await asyncio.to_thread(lambda: [process.join(timeout=30) for process in processes])
+        control.put(None)
+        await relay
+        logging.info("所有 worker 已停止")
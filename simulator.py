@@ -0,0 +1,238 @@
+# simulator.py
+"""
+多年期消费策略模拟：给定周期性消费（每天 / 每周 / 每月，本币或外币），
+对比"每天按推荐用卡"与"固定用一张卡"两种策略的免息天数、单卡最高余额和还款日分布。
+
+每张卡先用 core_logic.build_period_table 预计算整个区间每天的 (账单日, 还款日)，
+每天的推荐评分与 AppleStyleUX._calculate_card_score 的基础部分一致（免息期 + 本币加分 - 临近账单日扣分）。
+评分编码为整数 score * K - 卡序号后，逐日取最大值由 map(max, zip(*列)) 在 C 层完成，
+不再对每天每张卡调用 Python 函数。
+"""
+import calendar as py_calendar
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import core_logic
+from apple_ux_enhancements import AppleStyleUX
+
+MIN_MONTHS = 12
+MAX_MONTHS = 60
+FREQUENCIES = {'每天': 'daily', '每周': 'weekly', '每月': 'monthly'}
+FREQUENCY_NAMES = {v: k for k, v in FREQUENCIES.items()}
+
+
+class SpendItem(NamedTuple):
+    frequency: str     # daily / weekly / monthly
+    amount_cents: int
+    scope: str         # local / foreign
+
+    def describe(self) -> str:
+        prefix = "外币" if self.scope == 'foreign' else ""
+        return f"{prefix}{FREQUENCY_NAMES[self.frequency]} ¥{self.amount_cents / 100:,.0f}"
+
+
+class StrategyResult(NamedTuple):
+    name: str
+    total_cents: int
+    float_cent_days: int                 # Σ 金额 × 免息天数
+    peak_balances: Dict[int, int]        # card_id -> 最高未还余额（分）
+    due_totals: Dict[date, int]          # 还款日 -> 当日应还（分）
+    cards_used: int
+
+    @property
+    def avg_float_days(self) -> float:
+        return self.float_cent_days / self.total_cents if self.total_cents else 0.0
+
+    @property
+    def peak_balance(self) -> Tuple[int, Optional[int]]:
+        if not self.peak_balances:
+            return 0, None
+        card_id = max(self.peak_balances, key=self.peak_balances.get)
+        return self.peak_balances[card_id], card_id
+
+    @property
+    def busiest_due_day(self) -> Tuple[Optional[date], int]:
+        if not self.due_totals:
+            return None, 0
+        day = max(self.due_totals, key=self.due_totals.get)
+        return day, self.due_totals[day]
+
+    def due_days_per_month(self) -> float:
+        """平均每个月有几天需要还款，越大越分散"""
+        months = {(d.year, d.month) for d in self.due_totals}
+        return len(self.due_totals) / len(months) if months else 0.0
+
+
+class SimulationReport(NamedTuple):
+    start: date
+    months: int
+    event_count: int
+    advice: StrategyResult
+    fixed: StrategyResult
+    seconds: float
+
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, py_calendar.monthrange(year, month)[1]))
+
+def spend_events(profile: List[SpendItem], start: date, months: int) -> List[tuple]:
+    """展开消费计划，返回按日期排序的 (距 start 的天数, 金额, 本币/外币)"""
+    horizon = (add_months(start, months) - start).days
+    events = []
+    for item in profile:
+        if item.frequency == 'daily':
+            offsets = range(horizon)
+        elif item.frequency == 'weekly':
+            offsets = range(0, horizon, 7)
+        else:
+            offsets = [(add_months(start, i) - start).days for i in range(months)]
+        events.extend((offset, item.amount_cents, item.scope) for offset in offsets)
+    events.sort(key=lambda e: e[0])
+    return events
+
+def _eligible(cards: List[Dict], scope: str) -> List[Dict]:
+    allowed = ('local', 'all') if scope == 'local' else ('foreign', 'all')
+    return [card for card in cards if card['currency_type'] in allowed]
+
+def _score_column(card: Dict, runs: List[tuple], start: date, index: int, stride: int) -> List[int]:
+    """
+    单张卡整个区间每天的推荐评分，编码为 score * stride - index，逐日取最大值时可同时得到卡序号。
+    一个账单周期内评分每天减 1（临近账单日再整体扣分），整段用 range 生成，不逐日计算。
+    """
+    config = AppleStyleUX.SCORING_CONFIG
+    bonus = config['local_currency_bonus'] if card['currency_type'] in ('local', 'all') else 0
+    warning_days, penalty = config['statement_warning_days'], config['upcoming_statement_penalty'] * stride
+    start_ordinal = start.toordinal()
+    column = []
+    for offset, count, statement_date, due_date in runs:
+        end = offset + count
+        first = (due_date.toordinal() - start_ordinal - offset + bonus) * stride - index
+        penalty_from = min(end, max(offset, statement_date.toordinal() - start_ordinal - warning_days))
+        column.extend(range(first, first - (penalty_from - offset) * stride, -stride))
+        penalized = first - (penalty_from - offset) * stride - penalty
+        column.extend(range(penalized, penalized - (end - penalty_from) * stride, -stride))
+        # 与 get_next_calendar_statement_date 一致：账单日当天（不计入本期）距下一个日历账单日为 0 天
+        if (not card['statement_day_inclusive'] and penalty_from > offset
+                and date.fromordinal(start_ordinal + offset).day == card['statement_day']):
+            column[offset] -= penalty
+    return column
+
+def _best_card_by_day(columns: List[List[int]], stride: int) -> List[int]:
+    """每天评分最高的卡的下标；同分时取下标最小的一张，与 max() 逐张比较的结果一致"""
+    return [-(best % -stride) for best in map(max, zip(*columns))]
+
+def _best_fixed_card(cards: List[Dict], runs: Dict[int, list], events: List[tuple], horizon: int) -> Dict:
+    """
+    整段时间免息天数（按金额加权）最多的卡。Σ 金额 × (还款日 - 消费日) 中消费日部分与卡无关，
+    只需比较 Σ 周期内消费额 × 还款日，用前缀和每个周期 O(1) 求出。
+    """
+    prefix = [0] * (horizon + 1)
+    for offset, amount in events:
+        prefix[offset + 1] += amount
+    for i in range(horizon):
+        prefix[i + 1] += prefix[i]
+
+    def weighted_due(card):
+        return sum(due_date.toordinal() * (prefix[offset + count] - prefix[offset])
+                   for offset, count, _, due_date in runs[card['id']])
+    return max(cards, key=weighted_due)
+
+def _run_strategy(name: str, events: List[tuple], choose, due_offsets, start: date) -> StrategyResult:
+    """choose(offset, scope) 返回当天使用的卡片；余额在还款日当天全额还清"""
+    total = float_cent_days = 0
+    balance_changes: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    due_totals: Dict[int, int] = defaultdict(int)
+    for offset, amount, scope in events:
+        card = choose(offset, scope)
+        if card is None:
+            continue
+        due_offset = due_offsets(card)[offset]
+        total += amount
+        float_cent_days += amount * (due_offset - offset)
+        changes = balance_changes[card['id']]
+        changes[offset] += amount
+        changes[due_offset] -= amount
+        due_totals[due_offset] += amount
+
+    peaks = {}
+    for card_id, changes in balance_changes.items():
+        balance = peak = 0
+        for offset in sorted(changes):
+            balance += changes[offset]
+            peak = max(peak, balance)
+        peaks[card_id] = peak
+    due_dates = {start + timedelta(days=offset): amount for offset, amount in due_totals.items()}
+    return StrategyResult(name, total, float_cent_days, peaks, due_dates, len(balance_changes))
+
+def simulate(cards: List[Dict], profile: List[SpendItem], months: int, start: date = None,
+             fixed_card: Dict = None) -> SimulationReport:
+    """
+    模拟 months 个月。固定卡策略：指定 fixed_card 时本币/外币消费都用它（不支持的币种按推荐），
+    否则对每个币种分别选出整段时间免息天数最多的那一张卡。
+    """
+    started = time.perf_counter()
+    start = start or date.today()
+    months = max(MIN_MONTHS, min(MAX_MONTHS, months))
+    events = spend_events(profile, start, months)
+    horizon = (events[-1][0] + 1) if events else 0
+    # 规则相同的卡共享同一份周期表
+    rule_runs = {}
+    runs = {}
+    for card in cards:
+        rule = (card['statement_day'], card['statement_day_inclusive'], card['due_date_type'], card['due_date_value'],
+                card.get('due_date_adjustment'))
+        if rule not in rule_runs:
+            rule_runs[rule] = core_logic.build_period_runs(card, start, horizon)
+        runs[card['id']] = rule_runs[rule]
+
+    eligible = {scope: _eligible(cards, scope) for scope in ('local', 'foreign')}
+    scope_events = {scope: [(offset, amount) for offset, amount, s in events if s == scope] for scope in eligible}
+    # 评分列以卡在 cards 中的下标编码，本币/外币共用；各币种只取有资格的列
+    stride = len(cards) + 1
+    columns = {}
+    daily_best = {}
+    for scope, scope_cards in eligible.items():
+        if not scope_cards or not scope_events[scope]:
+            daily_best[scope] = None
+            continue
+        scope_ids = {card['id'] for card in scope_cards}
+        indexes = [i for i, card in enumerate(cards) if card['id'] in scope_ids]
+        for i in indexes:
+            if i not in columns:
+                columns[i] = _score_column(cards[i], runs[cards[i]['id']], start, i, stride)
+        daily_best[scope] = _best_card_by_day([columns[i] for i in indexes], stride)
+
+    def advice(offset, scope):
+        best = daily_best[scope]
+        return cards[best[offset]] if best else None
+
+    fixed_choice = {}
+    for scope, scope_cards in eligible.items():
+        if fixed_card is not None:
+            if fixed_card in scope_cards:
+                fixed_choice[scope] = fixed_card
+        elif scope_cards and scope_events[scope]:
+            fixed_choice[scope] = _best_fixed_card(scope_cards, runs, scope_events[scope], horizon)
+
+    def fixed(offset, scope):
+        return fixed_choice[scope] if scope in fixed_choice else advice(offset, scope)
+
+    # 只为实际用到的卡展开逐日还款日
+    due_cache: Dict[int, List[int]] = {}
+    start_ordinal = start.toordinal()
+
+    def due_offsets(card):
+        if card['id'] not in due_cache:
+            offsets = []
+            for _, count, _, due_date in runs[card['id']]:
+                offsets.extend([due_date.toordinal() - start_ordinal] * count)
+            due_cache[card['id']] = offsets
+        return due_cache[card['id']]
+
+    advice_result = _run_strategy("跟随每日推荐", events, advice, due_offsets, start)
+    fixed_result = _run_strategy("固定用卡", events, fixed, due_offsets, start)
+    return SimulationReport(start, months, len(events), advice_result, fixed_result, time.perf_counter() - started)
@@ -0,0 +1,70 @@
+# update_processor.py
+"""
+并发处理更新，但同一聊天内严格按到达顺序串行。
+
+不同聊天的更新（以及 JobQueue 的任务）并行执行，一个慢的处理器只阻塞它自己的聊天；
+同一聊天的后续更新排进该聊天的队列，由正在处理的那个任务依次执行，
+ConversationHandler 的状态和 user_data['new_card'] / edit_nickname 等中间数据因此不会乱序。
+排队中的更新不占用并发名额，一个聊天连续发来大量更新也不会挤占其他聊天。
+"""
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def chat_key(update: object) -> Optional[int]:
+    """串行化的粒度：聊天；没有聊天的更新（如内联查询）按用户；都没有时不串行"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class ChatSequentialUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._queues: Dict[int, Deque[Awaitable[Any]]] = {}  # 正在处理的聊天 -> 排队的更新
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        pending = self._queues.get(key)
+        if pending is not None:
+            # 该聊天已有更新在处理，排队后立即返回，由处理中的任务按顺序执行
+            pending.append(coroutine)
+            return
+        pending = self._queues[key] = deque()
+        try:
+            await coroutine
+        finally:
+            try:
+                while pending:
+                    try:
+                        await pending.popleft()
+                    except Exception as e:
+                        logging.error(f"处理聊天 {key} 的排队更新时出错: {e}")
+            finally:
+                # 被取消时也要移除队列，否则该聊天之后的更新会一直排队
+                del self._queues[key]
+                while pending:
+                    pending.popleft().close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        dropped = 0
+        for pending in self._queues.values():
+            while pending:
+                pending.popleft().close()
+                dropped += 1
+        if dropped:
+            logging.warning(f"关闭时丢弃了 {dropped} 个尚未处理的排队更新")